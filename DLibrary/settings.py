@@ -39,6 +39,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.middleware.MetricsMiddleware',
+    'library.middleware.CompressionMiddleware',
+    'library.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,9 +83,13 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '',
+        # Keep connections open between requests; put PgBouncer in front for pooling.
+        'CONN_MAX_AGE': 60,
     }
 }
 
+DATABASE_ROUTERS = ['library.db_routers.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -114,6 +121,22 @@ USE_L10N = True
 
 USE_TZ = True
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Use a shared backend (Redis, memcached, file based) in production so that
+# invalidations reach every worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'djlibrary',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
@@ -121,16 +144,18 @@ STATIC_URL = '/static/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'library.authentication.CachedOAuth2Authentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'library.renderers.ORJSONRenderer',
+        'library.renderers.MessagePackRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
+        'library.parsers.MessagePackParser',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -138,4 +163,88 @@ REST_FRAMEWORK = {
 
 OAUTH2_PROVIDER = {
     'SCOPES': {'read': 'Read scope', 'write': 'Write scope', 'groups': 'Access to your groups'}
-}
\ No newline at end of file
+}
+
+# In-memory tag -> books index used by /search_books/ (see library/tag_index.py)
+LIBRARY_TAG_INDEX = {
+    'CACHE_ALIAS': 'default',
+    'AUTO_BUILD': True,
+    'BACKGROUND': True,
+}
+
+# Cached responses of the read endpoints (see library/cache.py)
+LIBRARY_RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    # Responses read from a replica, which may lag behind the last write.
+    'REPLICA_TIMEOUT': 5,
+}
+
+# Validated OAuth2 access tokens (see library/authentication.py)
+LIBRARY_TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,
+    # Carries evictions to every process; use a cache they share (Redis,
+    # Memcached) when running more than one.
+    'CACHE_ALIAS': 'default',
+}
+
+# Request metrics served at /metrics (see library/metrics.py)
+LIBRARY_METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_SECONDS': None,
+    # Clients allowed to scrape /metrics (addresses or networks).
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+# Read replicas for safe requests (see library/db_routers.py)
+LIBRARY_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 5,
+    'HEALTH_CHECK_INTERVAL': 10,
+}
+
+# Precomputed "related books" model, rebuilt by build_related (see library/related.py)
+LIBRARY_RELATED = {
+    'PATH': os.path.join(BASE_DIR, 'var', 'related'),
+    'K': 50,
+    'AUTHOR_WEIGHT': 2.0,
+    'LAG_SECONDS': 5,
+}
+
+# Change feed served at /changes/ (see library/changes.py)
+LIBRARY_CHANGES = {
+    'PAGE_SIZE': 500,
+    'LAG_SECONDS': 5,
+    'TOMBSTONE_DAYS': 30,
+}
+
+# Reads served from worker threads under ASGI and concurrent prefetches (see library/concurrency.py)
+LIBRARY_ASYNC = {
+    'ENABLED': False,
+    'CONCURRENT_PREFETCH': False,
+    'PREFETCH_WORKERS': 8,
+}
+
+# Compression of large responses, brotli when installed (see library/compression.py)
+LIBRARY_COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+}
+
+# Prefix autocomplete snapshot, rebuilt by build_autocomplete (see library/autocomplete.py)
+LIBRARY_AUTOCOMPLETE = {
+    'PATH': os.path.join(BASE_DIR, 'var', 'autocomplete'),
+    'SYNC_SECONDS': 1,
+    'MAX_OVERLAY': 10000,
+}
+
+# Summary tables served at /stats/, rebuilt by rebuild_stats (see library/stats.py)
+LIBRARY_STATS = {
+    'BUCKETS': (0, 50, 100, 200, 300, 400, 500, 750, 1000, 1500),
+}
+
+# Facet counts of filtered lists (see library/facets.py)
+LIBRARY_FACETS = {
+    'MAX_SQL_BOOKS': 100000,
+}
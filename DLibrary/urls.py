@@ -18,10 +18,16 @@ from django.urls import path, include
 from rest_framework.routers import SimpleRouter, DefaultRouter
 from rest_framework_nested import routers
 
-from library.views import BookViewSet, AuthorViewSet, TagViewSet, SearchBooks
+from library.asyncviews import asyncify
+from library.concurrency import get_options as get_async_options
+from library.metrics import metrics_view
+from library.routers import BulkRouter
+from library.views import (
+    BookViewSet, AuthorViewSet, TagViewSet, SearchBooks, BatchGet, Changes, Autocomplete, Stats, ScopeStats,
+)
 
 
-router = routers.DefaultRouter()
+router = BulkRouter()
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'authors', AuthorViewSet, basename='authors')
 router.register(r'books', BookViewSet, basename='books')
@@ -38,11 +44,24 @@ book_router.register(r'authors', AuthorViewSet, basename='author')
 book_router.register(r'tags', TagViewSet, basename='tag')
 
 
+def api(patterns):
+    # Reads are served from worker threads under ASGI, see library/asyncviews.py.
+    return asyncify(patterns) if get_async_options()['ENABLED'] else patterns
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    url(r'^', include(router.urls)),
-    url(r'^', include(tag_router.urls)),
-    url(r'^', include(book_router.urls)),
-    url(r'^', include(author_router.urls)),
+    path('metrics', metrics_view, name='metrics'),
+    path('batch/get', BatchGet.as_view(), name='batch-get'),
+    *api([
+        path('changes/', Changes.as_view(), name='changes'),
+        path('autocomplete/', Autocomplete.as_view(), name='autocomplete'),
+        path('stats/', Stats.as_view(), name='stats'),
+        path('stats/<str:scope>/', ScopeStats.as_view(), name='scope-stats'),
+    ]),
+    url(r'^', include(api(router.urls))),
+    url(r'^', include(api(tag_router.urls))),
+    url(r'^', include(api(book_router.urls))),
+    url(r'^', include(api(author_router.urls))),
     path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
 ]
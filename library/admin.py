@@ -1,21 +1,106 @@
 from django.contrib import admin
-from django.contrib.admin import ModelAdmin
+from django.contrib.admin import ModelAdmin, TabularInline
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 
+from library import search
 from library.models import Book, Author, Tag
+from library.pagination import estimate_count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting unfiltered querysets from the planner estimate (see
+    ``library.pagination.estimate_count``) instead of ``COUNT(*)``. Filtered
+    and searched ones are counted exactly, a row estimate of a predicate can
+    be far off. Fetching a page corrects a stale estimate: the count never
+    drops below the rows fetched, and becomes exact on the last page.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.where or queryset.query.distinct:
+            return super().count
+        estimate = estimate_count(queryset)
+        if estimate <= self.per_page:
+            # Small tables, or stale statistics that would show every row on one page.
+            return super().count
+        self.estimated = True
+        return estimate
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Pages past an estimate are checked when fetched.
+            if self.estimated and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        # Validating counts, which decides whether the count is estimated.
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows:
+            raise EmptyPage('That page contains no results')
+        if len(rows) > self.per_page:
+            count = max(self.count, bottom + len(rows))
+        else:
+            count = bottom + len(rows)
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+        return self._get_page(rows[:self.per_page], number, self)
+
+
+class LibraryAdmin(ModelAdmin):
+    """
+    Changelists that stay fast on large tables: estimated counts, no
+    unfiltered total and full-text search where the model has a document.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        terms = search.tokenize([search_term])
+        if not terms or not search.has_search_document(self.model):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.match(self.model, terms, queryset.db)), False
+
+
+class AuthorInline(TabularInline):
+    model = Author.books.through
+    autocomplete_fields = ('author',)
+    extra = 0
+    verbose_name = 'author'
+    verbose_name_plural = 'authors'
 
 
 @admin.register(Author)
-class AuthorAdmin(ModelAdmin):
-    # list_display = ('id', 'name', 'year_of_birth')
-    pass
+class AuthorAdmin(LibraryAdmin):
+    list_display = ('id', 'name', 'year_of_birth')
+    search_fields = ('name',)
+    autocomplete_fields = ('books',)
+
 
 @admin.register(Tag)
-class TagAdmin(ModelAdmin):
-    pass
+class TagAdmin(LibraryAdmin):
+    list_display = ('id', 'title')
+    search_fields = ('title',)
 
 
 @admin.register(Book)
-class BookAdmin(ModelAdmin):
-    pass
-    # filter_horizontal = ('authors', 'tags',)
-    # list_display = ('title', 'display_authors', 'display_tags')
+class BookAdmin(LibraryAdmin):
+    list_display = ('id', 'title', 'pages', 'display_tags')
+    search_fields = ('title',)
+    autocomplete_fields = ('tags',)
+    inlines = (AuthorInline,)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('tags')
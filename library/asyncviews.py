@@ -0,0 +1,65 @@
+"""
+Async views for the read side of the API under ASGI (``DLibrary.asgi``).
+
+Django 3.1 runs synchronous views under ASGI on one shared thread, so a
+process serves a single request at a time however many it accepts.
+``asyncify`` wraps the views of URL patterns in coroutines that run safe
+requests in worker threads, each with its own database connection, and
+keep the other requests on the shared thread, where transactions and
+``on_commit`` hooks behave as they do under WSGI.
+
+The routes of the API are wrapped when ``LIBRARY_ASYNC['ENABLED']`` is on
+(see ``library.concurrency``). Leave it off under WSGI, where every wrapped
+view would run in an event loop of its own.
+"""
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.urls import URLPattern, URLResolver
+from rest_framework.permissions import SAFE_METHODS
+
+from library.concurrency import worker_connections
+
+
+def render_in_worker(view, request, *args, **kwargs):
+    with worker_connections():
+        response = view(request, *args, **kwargs)
+        # Rendering can read the database too; MetricsMiddleware skips its
+        # render timing for responses rendered here.
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            started = time.perf_counter()
+            response.render()
+            request._metrics_render_seconds = time.perf_counter() - started
+    return response
+
+
+def async_view(view):
+    """
+    Returns a coroutine view running ``view`` in a worker thread for safe
+    methods and on the shared thread for the others.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await sync_to_async(render_in_worker, thread_sensitive=False)(view, request, *args, **kwargs)
+        return await sync_to_async(view, thread_sensitive=True)(request, *args, **kwargs)
+
+    return wrapper
+
+
+def asyncify(patterns):
+    """
+    Returns a copy of the URL ``patterns`` with every view wrapped by
+    ``async_view``; names, arguments and ``csrf_exempt`` are kept.
+    """
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            result.append(URLResolver(
+                pattern.pattern, asyncify(pattern.url_patterns), pattern.default_kwargs,
+                pattern.app_name, pattern.namespace,
+            ))
+        else:
+            result.append(URLPattern(pattern.pattern, async_view(pattern.callback), pattern.default_args, pattern.name))
+    return result
@@ -0,0 +1,223 @@
+"""
+OAuth2 bearer authentication with validated tokens cached in process.
+
+``OAuth2Authentication`` loads the ``AccessToken`` with its user and
+application on every request. ``CachedOAuth2Authentication`` keeps the
+loaded token in a bounded LRU keyed by a hash of the bearer string, and
+in a Django cache (``LIBRARY_TOKEN_CACHE['CACHE_ALIAS']``) shared by every
+process. Entries are honored until the token ``expires`` at the latest;
+signals evict them when a token is saved, revoked or deleted and when its
+user changes.
+
+An eviction also leaves a timestamped marker in the shared cache, which
+every process checks on a hit, so a revoked token is refused everywhere at
+once. The shared cache holds only the ids, scope and expiry of the token
+and ``USER_FIELDS`` of its user, never the password hash; the objects are
+rebuilt from them with every other field deferred. Without a shared cache
+(``CACHE_ALIAS`` ``None``) evictions only reach the current process, which
+is only safe with a single one.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,
+    'CACHE_ALIAS': 'default',
+    # How long a process trusts its own copy of an entry in the shared cache,
+    # in case the shared cache dropped an eviction marker.
+    'LOCAL_TIMEOUT': 60,
+    'KEY_PREFIX': 'library:token',
+    # Fields of the user kept in the shared cache besides its id.
+    'USER_FIELDS': ('username', 'is_active', 'is_staff', 'is_superuser'),
+}
+
+# Fields of the access token kept in the shared cache.
+TOKEN_FIELDS = ('id', 'user_id', 'scope', 'expires')
+
+
+def from_fields(model, values):
+    """
+    Returns an instance of ``model`` as if loaded with only the fields in
+    ``values``, the others deferred.
+    """
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(None, names, [values[name] for name in names])
+
+
+class TokenCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'LIBRARY_TOKEN_CACHE', {})}
+
+    @property
+    def shared_cache(self):
+        alias = self.options['CACHE_ALIAS']
+        return caches[alias] if alias else None
+
+    def get_key(self, token):
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        return f'{self.options["KEY_PREFIX"]}:{digest}'
+
+    @staticmethod
+    def get_evicted_key(key):
+        return f'{key}:evicted'
+
+    def get(self, token):
+        """
+        Returns the cached ``AccessToken`` for the bearer string ``token``,
+        or ``None`` when it is missing, evicted or past its expiry.
+        """
+        key = self.get_key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+        shared = self.shared_cache
+        if shared is not None:
+            local = entry is not None
+            evicted_key = self.get_evicted_key(key)
+            values = shared.get_many([evicted_key] if local else [key, evicted_key])
+            if key in values:
+                data, valid_until, stored_at = values[key]
+                entry = (self.load(data), valid_until, stored_at)
+            if entry is not None and values.get(evicted_key, -1) >= entry[2]:
+                self._discard(key)
+                entry = None
+            elif entry is not None and not local and entry[1] > now:
+                self._store(key, entry[0], min(entry[1], now + self.options['LOCAL_TIMEOUT']), entry[2])
+        with self._lock:
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[0]
+
+    def set(self, token, access_token, loaded_at=None):
+        """
+        Caches ``access_token`` read from the database at ``loaded_at``
+        (now by default); evictions after that time drop it.
+        """
+        options = self.options
+        now = time.time()
+        loaded_at = now if loaded_at is None else loaded_at
+        valid_until = min(access_token.expires.timestamp(), now + options['TIMEOUT'])
+        if valid_until <= now:
+            return
+        key = self.get_key(token)
+        shared = self.shared_cache
+        if shared is not None:
+            shared.set(key, (self.dump(access_token), valid_until, loaded_at), valid_until - now)
+            valid_until = min(valid_until, now + options['LOCAL_TIMEOUT'])
+        self._store(key, access_token, valid_until, loaded_at)
+
+    def dump(self, access_token):
+        user = access_token.user
+        user_fields = [user._meta.pk.attname, *self.options['USER_FIELDS']]
+        return {
+            'token': {name: getattr(access_token, name) for name in TOKEN_FIELDS},
+            'user': {name: getattr(user, name) for name in user_fields},
+        }
+
+    @staticmethod
+    def load(data):
+        AccessToken = get_access_token_model()
+        access_token = from_fields(AccessToken, data['token'])
+        access_token.user = from_fields(AccessToken._meta.get_field('user').related_model, data['user'])
+        return access_token
+
+    def _store(self, key, access_token, valid_until, stored_at):
+        with self._lock:
+            self._entries[key] = (access_token, valid_until, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.options['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict(self, *tokens):
+        keys = [self.get_key(token) for token in tokens]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self.shared_cache
+        if shared is not None and keys:
+            shared.delete_many(keys)
+            # Outlives every copy of the entries in other processes.
+            now = time.time()
+            shared.set_many({self.get_evicted_key(key): now for key in keys}, self.options['TIMEOUT'])
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (token, _, _) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+        if self.shared_cache is not None:
+            AccessToken = get_access_token_model()
+            self.evict(*AccessToken.objects.filter(user_id=user_id).values_list('token', flat=True))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    ``OAuth2Authentication`` answering repeated bearer tokens from
+    ``token_cache`` without a database query.
+    """
+
+    @staticmethod
+    def get_bearer_token(request):
+        parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            return parts[1]
+        return None
+
+    def authenticate(self, request):
+        token = self.get_bearer_token(request)
+        if token is not None:
+            access_token = token_cache.get(token)
+            if access_token is not None:
+                return access_token.user, access_token
+        loaded_at = time.time()
+        result = super().authenticate(request)
+        if result is not None and token is not None:
+            token_cache.set(token, result[1], loaded_at)
+        return result
@@ -0,0 +1,452 @@
+"""
+Prefix autocomplete over book titles, author names and tag titles
+(``/autocomplete/?q=har&types=books,authors,tags``).
+
+Names are folded (accents stripped, case folded, punctuation dropped) and a
+name matches when the query is a prefix of it from one of its words on.
+``build_autocomplete`` stores, per type, every such word suffix cut to
+``KEY_BYTES`` in a sorted array with the popularity of its object (its
+number of links: books of an author or tag, tags and authors of a book),
+as ``.npy`` files under ``LIBRARY_AUTOCOMPLETE['PATH']``. Processes
+memory-map the snapshot, unless it was built from another database. A
+lookup is a binary search and a scan of at most ``SCAN_LIMIT`` keys;
+prefixes matching more keys than that get their ``TOP_SIZE`` best objects
+precomputed.
+
+Objects changed since the snapshot live in an in-memory overlay that
+shadows the snapshot. Saves and deletes update it from signals in the
+writing process, and every process replays the change feed (see
+``library.changes``) every ``SYNC_SECONDS``, which also carries other
+processes' writes and counter changes. An overlay larger than
+``MAX_OVERLAY`` triggers a new snapshot. Until a snapshot exists, lookups
+answer from SQL without folding.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from library import changes
+from library.models import Book, Author, Tag, Tombstone
+from library.related import load_meta, save
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'var', 'autocomplete'),
+    'CACHE_ALIAS': 'default',
+    'AUTO_BUILD': True,
+    'BACKGROUND': True,
+    'KEY_BYTES': 24,
+    'SCAN_LIMIT': 2000,
+    'TOP_SIZE': 50,
+    'SYNC_SECONDS': 1,
+    'MAX_OVERLAY': 10000,
+}
+
+Source = namedtuple('Source', ['name', 'model', 'field', 'popularity'])
+
+SOURCES = {
+    'books': Source('books', Book, 'title', ('tag_count', 'author_count')),
+    'authors': Source('authors', Author, 'name', ('book_count',)),
+    'tags': Source('tags', Tag, 'title', ('book_count',)),
+}
+
+ARRAYS = ('ids', 'popularity', 'name_offsets', 'names', 'keys', 'key_rows', 'top_prefixes',
+          'top_offsets', 'top_rows')
+
+# An object changed since the snapshot, None once deleted.
+Entry = namedtuple('Entry', ['name', 'folded', 'popularity', 'keys'])
+
+APOSTROPHES = re.compile("['’]")
+WORDS = re.compile(r'\w+')
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_AUTOCOMPLETE', {})}
+
+
+def fold(text):
+    """
+    Returns ``text`` without accents, case folded, its words separated by
+    single spaces: ``"Émile O'Neil"`` becomes ``"emile oneil"``.
+    """
+    text = unicodedata.normalize('NFKD', APOSTROPHES.sub('', text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORDS.findall(text.casefold()))
+
+
+def get_keys(folded, key_bytes):
+    """
+    Returns the suffixes of ``folded`` starting at each of its words.
+    """
+    keys, start = [], 0
+    while folded:
+        keys.append(folded[start:].encode('utf-8')[:key_bytes])
+        start = folded.find(' ', start) + 1
+        if not start:
+            break
+    return keys
+
+
+def best_rows(rows, popularity, size=None):
+    """
+    Returns the distinct ``rows`` by popularity then row (folded name) order.
+    """
+    ordered = rows[np.lexsort((rows, -popularity[rows]))]
+    _, first = np.unique(ordered, return_index=True)
+    return ordered[np.sort(first)][:size]
+
+
+def get_top(keys, key_rows, popularity, options):
+    """
+    Returns ``(prefixes, offsets, rows)`` with the best ``TOP_SIZE`` rows
+    of every prefix matching more than ``SCAN_LIMIT`` keys.
+    """
+    tops = []
+    for length in range(1, options['KEY_BYTES'] + 1):
+        truncated = keys.astype(f'S{length}')
+        starts = np.flatnonzero(np.r_[True, truncated[1:] != truncated[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        heavy = np.flatnonzero(ends - starts > options['SCAN_LIMIT'])
+        if not len(heavy):
+            break
+        for start, end in zip(starts[heavy], ends[heavy]):
+            prefix = truncated[start]
+            # Keys shorter than the length, their prefix was done already.
+            if len(prefix) == length:
+                tops.append((prefix, best_rows(key_rows[start:end], popularity, options['TOP_SIZE'])))
+    tops.sort(key=lambda top: top[0])
+    offsets = np.zeros(len(tops) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows) for _, rows in tops])
+    prefixes = np.array([prefix for prefix, _ in tops], dtype=f'S{options["KEY_BYTES"]}')
+    rows = np.concatenate([rows for _, rows in tops]) if tops else np.zeros(0, dtype=np.int32)
+    return prefixes, offsets, rows.astype(np.int32)
+
+
+def build_part(source, options, using=None):
+    popularity = sum((F(field) for field in source.popularity[1:]), F(source.popularity[0]))
+    objects = source.model.objects.using(using).order_by().annotate(popularity=popularity).values_list(
+        'pk', source.field, 'popularity')
+    # Rows are in folded name order, which breaks popularity ties.
+    objects = sorted((fold(name), pk, name, count) for pk, name, count in objects.iterator(chunk_size=10000))
+    keys, key_rows = [], []
+    for row, (folded, _, _, _) in enumerate(objects):
+        for key in get_keys(folded, options['KEY_BYTES']):
+            keys.append(key)
+            key_rows.append(row)
+    keys = np.array(keys, dtype=f'S{options["KEY_BYTES"]}')
+    order = np.argsort(keys, kind='stable')
+    keys, key_rows = keys[order], np.array(key_rows, dtype=np.int32)[order]
+    ids = np.array([pk for _, pk, _, _ in objects], dtype=np.int64)
+    popularity = np.array([count for _, _, _, count in objects], dtype=np.int64)
+    names = [name.encode('utf-8') for _, _, name, _ in objects]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    name_offsets[1:] = np.cumsum([len(name) for name in names])
+    top_prefixes, top_offsets, top_rows = get_top(keys, key_rows, popularity, options)
+    return {
+        'ids': ids,
+        'popularity': popularity,
+        'name_offsets': name_offsets,
+        'names': np.frombuffer(b''.join(names), dtype=np.uint8),
+        'keys': keys,
+        'key_rows': key_rows,
+        'top_prefixes': top_prefixes,
+        'top_offsets': top_offsets,
+        'top_rows': top_rows,
+    }
+
+
+def build(using=None, **overrides):
+    """
+    Builds the snapshot of the catalog in ``using`` and atomically replaces
+    the stored one. Returns the number of objects by type.
+    """
+    options = {**get_options(), **overrides}
+    # Changes from now on are replayed over the snapshot.
+    built_at = timezone.now()
+    arrays, counts = {}, {}
+    for source in SOURCES.values():
+        part = build_part(source, options, using)
+        counts[source.name] = len(part['ids'])
+        arrays.update({f'{source.name}_{name}': array for name, array in part.items()})
+    version = time.time_ns()
+    save(options['PATH'], arrays, {
+        'version': version,
+        'built_at': built_at.isoformat(),
+        'key_bytes': options['KEY_BYTES'],
+        'top_size': options['TOP_SIZE'],
+    })
+    caches[options['CACHE_ALIAS']].set(AutocompleteIndex.version_key, version, timeout=None)
+    return counts
+
+
+class Part:
+    """
+    The memory-mapped snapshot of one type.
+    """
+
+    def __init__(self, path, name, meta):
+        self.key_bytes = meta['key_bytes']
+        self.top_size = meta['top_size']
+        for array in ARRAYS:
+            setattr(self, array, np.load(os.path.join(path, f'{name}_{array}.npy'), mmap_mode='r'))
+
+    def get_name(self, row):
+        return bytes(self.names[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    def get_range(self, prefix):
+        low = int(np.searchsorted(self.keys, prefix, 'left'))
+        if len(prefix) >= self.key_bytes:
+            return low, int(np.searchsorted(self.keys, prefix, 'right'))
+        # No UTF-8 byte is 0xff, every key starting with the prefix sorts below.
+        return low, int(np.searchsorted(self.keys, prefix + b'\xff', 'left'))
+
+    def get_top(self, prefix):
+        index = int(np.searchsorted(self.top_prefixes, prefix))
+        if index < len(self.top_prefixes) and self.top_prefixes[index] == prefix:
+            return self.top_rows[self.top_offsets[index]:self.top_offsets[index + 1]]
+        return None
+
+    def iter_rows(self, prefix):
+        """
+        Yields the rows with a key starting with ``prefix``, each once, most
+        popular first.
+        """
+        low, high = self.get_range(prefix)
+        if low == high:
+            return
+        seen = set()
+        top = self.get_top(prefix)
+        if top is not None:
+            for row in top.tolist():
+                seen.add(row)
+                yield row
+            if len(top) < self.top_size:
+                return
+        for row in best_rows(np.asarray(self.key_rows[low:high]), self.popularity).tolist():
+            if row not in seen:
+                yield row
+
+
+class Snapshot:
+    def __init__(self, path, meta):
+        self.version = meta['version']
+        self.built_at = parse_datetime(meta['built_at'])
+        self.parts = {name: Part(path, name, meta) for name in SOURCES}
+
+
+class AutocompleteIndex:
+    version_key = 'library:autocomplete:version'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._snapshot = None
+        self._building = False
+        self.reset(None)
+
+    @property
+    def options(self):
+        return get_options()
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE_ALIAS']]
+
+    def reset(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+            self._overlay = {name: {} for name in SOURCES}
+            self._overlay_keys = {name: [] for name in SOURCES}
+            self._cursor = changes.Event(snapshot.built_at, -1, 0) if snapshot else None
+            self._next_sync = 0
+
+    def current_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            meta = self.read_meta()
+            if meta is not None:
+                version = meta['version']
+                self.cache.add(self.version_key, version, timeout=None)
+        return version
+
+    def read_meta(self):
+        return load_meta(self.options['PATH'])
+
+    def get_snapshot(self):
+        """
+        Returns the snapshot, loading it when another process built a new
+        one, or ``None`` when none was built.
+        """
+        version = self.current_version()
+        with self._lock:
+            if version is not None and (self._snapshot is None or self._snapshot.version != version):
+                meta = self.read_meta()
+                self.reset(Snapshot(self.options['PATH'], meta) if meta is not None else None)
+            return self._snapshot
+
+    def schedule_build(self, using=None):
+        options = self.options
+        if not options['AUTO_BUILD']:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        if options['BACKGROUND']:
+            threading.Thread(target=self._build_and_close, args=(using,), daemon=True).start()
+        else:
+            self._build_and_close(using, close=False)
+
+    def _build_and_close(self, using=None, close=True):
+        try:
+            build(using)
+        finally:
+            self._building = False
+            if close:
+                connection.close()
+
+    def put(self, name, pk, text=None, popularity=0):
+        """
+        Records the current ``text`` and popularity of an object, ``None``
+        for a deleted one, in the overlay.
+        """
+        overlay, keys = self._overlay[name], self._overlay_keys[name]
+        with self._lock:
+            previous = overlay.get(pk)
+            for key in previous.keys if previous else ():
+                del keys[bisect.bisect_left(keys, (key, pk))]
+            if text is None:
+                overlay[pk] = None
+                return
+            folded = fold(text)
+            entry = overlay[pk] = Entry(text, folded, popularity, get_keys(folded, self.options['KEY_BYTES']))
+            for key in entry.keys:
+                bisect.insort(keys, (key, pk))
+
+    def object_saved(self, instance, using=None):
+        source = next(source for source in SOURCES.values() if isinstance(instance, source.model))
+        popularity = sum(getattr(instance, field) for field in source.popularity)
+        args = (source.name, instance.pk, getattr(instance, source.field), popularity)
+        transaction.on_commit(lambda: self.put(*args), using=using)
+
+    def object_deleted(self, instance, using=None):
+        source = next(source for source in SOURCES.values() if isinstance(instance, source.model))
+        transaction.on_commit(lambda: self.put(source.name, instance.pk), using=using)
+
+    def sync(self, using=None):
+        """
+        Replays the change feed since the last sync into the overlay, at most
+        every ``SYNC_SECONDS``.
+        """
+        options = self.options
+        now = time.monotonic()
+        with self._lock:
+            if self._cursor is None or now < self._next_sync:
+                return
+            self._next_sync = now + options['SYNC_SECONDS']
+            cursor = self._cursor
+        try:
+            events, _ = changes.read(cursor, options['MAX_OVERLAY'], using=using)
+        except changes.CursorExpired:
+            self.schedule_build(using)
+            return
+        if not events:
+            return
+        updated = {}
+        for event in events:
+            updated.setdefault(event.source, []).append(event.pk)
+        rows = []
+        for index, pks in updated.items():
+            model = changes.SOURCES[index].model
+            if model is Tombstone:
+                deleted = Tombstone.objects.using(using).filter(pk__in=pks).values_list('model', 'object_id')
+                rows += [(f'{model}s', pk, None, 0) for model, pk in deleted if f'{model}s' in SOURCES]
+                continue
+            source = next(source for source in SOURCES.values() if source.model is model)
+            objects = model.objects.using(using).filter(pk__in=pks).values_list('pk', source.field, *source.popularity)
+            found = {pk: (name, sum(counts)) for pk, name, *counts in objects}
+            rows += [(source.name, pk, *found.get(pk, (None, 0))) for pk in pks]
+        with self._lock:
+            if self._cursor != cursor:
+                # Reloaded or synced by another thread meanwhile.
+                return
+            for row in rows:
+                self.put(*row)
+            self._cursor = events[-1]
+            overlay = sum(len(entries) for entries in self._overlay.values())
+        if overlay > options['MAX_OVERLAY']:
+            self.schedule_build(using)
+
+    def lookup(self, name, query, limit, using=None):
+        """
+        Returns up to ``limit`` ``(id, name)`` of type ``name`` matching
+        ``query``, most popular first, or ``None`` without a snapshot.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            self.schedule_build(using)
+            return None
+        self.sync(using)
+        folded = fold(query)
+        if not folded:
+            return []
+        prefix = folded.encode('utf-8')
+        part = snapshot.parts[name]
+        # Keys are cut to KEY_BYTES, longer queries are checked on the names.
+        check = len(prefix) > part.key_bytes
+        prefix = prefix[:part.key_bytes]
+        with self._lock:
+            overlay, keys = self._overlay[name], self._overlay_keys[name]
+            found = []
+            for row in part.iter_rows(prefix):
+                pk = int(part.ids[row])
+                if pk in overlay:
+                    continue
+                text = part.get_name(row)
+                text_folded = fold(text)
+                if check and not self.matches(text_folded, folded):
+                    continue
+                found.append((-int(part.popularity[row]), text_folded, pk, text))
+                if len(found) >= limit:
+                    break
+            start = bisect.bisect_left(keys, (prefix,))
+            pks = set()
+            for key, pk in islice(keys, start, None):
+                if not key.startswith(prefix):
+                    break
+                pks.add(pk)
+            for pk in pks:
+                entry = overlay[pk]
+                if not check or self.matches(entry.folded, folded):
+                    found.append((-entry.popularity, entry.folded, pk, entry.name))
+        return [(pk, text) for _, _, pk, text in sorted(found)[:limit]]
+
+    @staticmethod
+    def matches(folded, query):
+        return folded.startswith(query) or f' {query}' in folded
+
+    def lookup_sql(self, name, query, limit, using=None):
+        """
+        Cold fallback: case-insensitive prefix of the name or of one of its
+        words, without accent folding.
+        """
+        source = SOURCES[name]
+        popularity = sum((F(field) for field in source.popularity[1:]), F(source.popularity[0]))
+        queryset = source.model.objects.using(using).filter(
+            Q(**{f'{source.field}__istartswith': query}) | Q(**{f'{source.field}__icontains': f' {query}'})
+        ).annotate(popularity=popularity).order_by('-popularity', source.field, 'pk')
+        return list(queryset.values_list('pk', source.field)[:limit])
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,498 @@
+"""
+Benchmark scenarios for the API, run in process through ``APIClient`` by
+``manage.py bench`` against a catalog generated with ``seed_catalog``.
+
+Every scenario issues ``requests`` requests built from random rows and
+reports latency percentiles, throughput and SQL queries per request, so
+runs at 10k, 100k and 1M books can be saved as JSON and compared.
+
+``run_concurrency`` compares the read scenarios served one request at a
+time, as by a WSGI worker, with requests served concurrently through the
+ASGI handler, with and without ``library.asyncviews``. ``run_render``
+times the renderers and compressions on ``BooksSerializer`` output.
+"""
+import asyncio
+import math
+import platform
+import random
+import time
+import types
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from importlib import import_module
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Max, Min
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from oauth2_provider.models import get_access_token_model, get_application_model
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from library import compression
+from library import autocomplete
+from library.asyncviews import asyncify
+from library.concurrency import get_options as get_async_options
+from library.metrics import QueryRecorder
+from library.models import Book, Author, Tag
+from library.renderers import MessagePackRenderer, ORJSONRenderer
+from library.serializers import BooksSerializer
+from library.tag_index import tag_index
+
+WORDS = (
+    'war peace night day river city garden house winter summer road sea island shadow '
+    'light stone fire storm king queen letter journey dream silence mountain forest '
+    'secret empire bridge station music portrait memory stranger harbor orchard'
+).split()
+
+Scenario = namedtuple('Scenario', ['name', 'build', 'write'])
+
+
+class Sampler:
+    """
+    Picks random existing rows for the scenarios, outside of the timings.
+    """
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.bounds = {}
+        self.pages = None
+
+    def page(self):
+        if self.pages is None:
+            self.pages = max(1, math.ceil(Book.objects.count() / api_settings.PAGE_SIZE))
+        return self.rng.randint(1, min(self.pages, 20))
+
+    def pick(self, model):
+        if model not in self.bounds:
+            bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+            self.bounds[model] = (bounds['low'] or 0, bounds['high'] or 0)
+        low, high = self.bounds[model]
+        pk = self.rng.randint(low, high)
+        return model.objects.filter(pk__gte=pk).order_by('pk').values_list('pk', flat=True).first() or pk
+
+
+def books_list(sampler):
+    return 'get', reverse('books-list'), {'page': sampler.page()}
+
+
+def books_keyset(sampler):
+    return 'get', reverse('books-list'), {'cursor': '', 'ordering': sampler.rng.choice(['title', '-pages'])}
+
+
+def book_detail(sampler):
+    return 'get', reverse('books-detail', args=(sampler.pick(Book),)), {}
+
+
+def books_search(sampler):
+    return 'get', reverse('books-list'), {'search': sampler.rng.choice(WORDS)}
+
+
+def tag_search(sampler):
+    tags = f'{sampler.pick(Tag)},{sampler.pick(Tag)}'
+    return 'get', reverse('search_books-list'), {'tags': tags, 'match': sampler.rng.choice(['all', 'any'])}
+
+
+def tag_books(sampler):
+    return 'get', reverse('tags-books', args=(sampler.pick(Tag),)), {}
+
+
+def author_books(sampler):
+    return 'get', reverse('authors-books', args=(sampler.pick(Author),)), {}
+
+
+def book_authors(sampler):
+    return 'get', reverse('books-authors', args=(sampler.pick(Book),)), {}
+
+
+def autocomplete_prefix(sampler):
+    prefix = sampler.rng.choice(WORDS)[:sampler.rng.randint(1, 4)]
+    return 'get', reverse('autocomplete'), {'q': prefix}
+
+
+def scope_stats(sampler):
+    scope = sampler.rng.choice(['authors', 'tags'])
+    return 'get', reverse('scope-stats', args=(scope,)), {'limit': 100}
+
+
+def book_create(sampler):
+    data = {'title': ' '.join(sampler.rng.sample(WORDS, 3)), 'pages': 100, 'tags': [sampler.pick(Tag)]}
+    return 'post', reverse('books-list'), data
+
+
+def book_update(sampler):
+    return 'patch', reverse('books-detail', args=(sampler.pick(Book),)), {'pages': sampler.rng.randint(20, 1500)}
+
+
+SCENARIOS = [
+    Scenario('books-list', books_list, False),
+    Scenario('books-keyset', books_keyset, False),
+    Scenario('book-detail', book_detail, False),
+    Scenario('books-search', books_search, False),
+    Scenario('tag-search', tag_search, False),
+    Scenario('tag-books', tag_books, False),
+    Scenario('author-books', author_books, False),
+    Scenario('book-authors', book_authors, False),
+    Scenario('autocomplete', autocomplete_prefix, False),
+    Scenario('stats', scope_stats, False),
+    Scenario('book-create', book_create, True),
+    Scenario('book-update', book_update, True),
+]
+
+
+def percentile(values, fraction):
+    """
+    Percentile of the sorted ``values`` with linear interpolation.
+    """
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(latencies, queries, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'throughput_rps': len(latencies) / elapsed if elapsed else 0.0,
+        'queries_per_request': sum(queries) / len(queries) if queries else 0.0,
+        'max_queries': max(queries, default=0),
+    }
+
+
+def send(client, method, path, data):
+    if method == 'get':
+        return client.get(path, data=data)
+    return getattr(client, method)(path, data=data, format='json')
+
+
+def run_scenario(client, scenario, sampler, requests, warmup):
+    calls = [scenario.build(sampler) for _ in range(warmup + requests)]
+    latencies, queries, errors = [], [], 0
+    with transaction.atomic():
+        started = time.perf_counter()
+        for index, (method, path, data) in enumerate(calls):
+            if index == warmup:
+                started = time.perf_counter()
+                latencies, queries, errors = [], [], 0
+            recorder = QueryRecorder()
+            request_started = time.perf_counter()
+            with connection.execute_wrapper(recorder):
+                response = send(client, method, path, data)
+            latencies.append(time.perf_counter() - request_started)
+            queries.append(recorder.count)
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+        if scenario.write:
+            # Leave the catalog as it was for the next run.
+            transaction.set_rollback(True)
+    return summarize(latencies, queries, errors, elapsed)
+
+
+def get_catalog():
+    return {
+        'books': Book.objects.count(),
+        'authors': Author.objects.count(),
+        'tags': Tag.objects.count(),
+        'book_tags': Book.tags.through.objects.count(),
+        'author_books': Author.books.through.objects.count(),
+    }
+
+
+@contextmanager
+def environment(cache=False):
+    """
+    Yields an authenticated ``APIClient`` with the response cache bypassed
+    unless ``cache`` is set.
+    """
+    user, _ = User.objects.get_or_create(username='benchmark')
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user)
+    # Measure the tag search and autocomplete on warm indexes rather than their SQL fallbacks.
+    if not tag_index.is_warm():
+        tag_index.build()
+    if autocomplete.autocomplete_index.get_snapshot() is None:
+        autocomplete.build()
+    # The requests never leave the process.
+    overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'localhost']}
+    if not cache:
+        overrides.update({
+            'CACHES': {**settings.CACHES, 'benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+            'LIBRARY_RESPONSE_CACHE': {**getattr(settings, 'LIBRARY_RESPONSE_CACHE', {}), 'CACHE_ALIAS': 'benchmark'},
+        })
+    with override_settings(**overrides):
+        yield client
+
+
+def get_scenarios(names=None):
+    return [scenario for scenario in SCENARIOS if not names or scenario.name in names]
+
+
+def run(names=None, requests=200, warmup=20, seed=0, cache=False):
+    """
+    Runs the scenarios named in ``names`` (all by default) and returns the
+    results with the catalog size and environment they were measured on.
+    """
+    sampler = Sampler(seed)
+    with environment(cache) as client:
+        results = {
+            scenario.name: run_scenario(client, scenario, sampler, requests, warmup)
+            for scenario in get_scenarios(names)
+        }
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'catalog': get_catalog(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': requests,
+            'seed': seed,
+            'cache': cache,
+        },
+        'scenarios': results,
+    }
+
+
+def compare(baseline, results, threshold=0.2):
+    """
+    Returns ``(name, metric, baseline, current, regressed)`` for every
+    scenario measured in both runs. Latency regresses when its p95 grows by
+    more than ``threshold``, queries per request whenever they grow.
+    """
+    rows = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        rows.append((name, 'p95_ms', previous['p95_ms'], current['p95_ms'],
+                     current['p95_ms'] > previous['p95_ms'] * (1 + threshold)))
+        rows.append((name, 'queries_per_request', previous['queries_per_request'], current['queries_per_request'],
+                     current['queries_per_request'] > previous['queries_per_request'] + 0.01))
+    return rows
+
+
+def capture_queries(names=None, seed=0):
+    """
+    Sends one request of every scenario and returns the ``(sql, params)`` of
+    the queries it ran, by scenario name. Writes are rolled back.
+    """
+    sampler = Sampler(seed)
+    statements = {}
+    with environment() as client:
+        for scenario in get_scenarios(names):
+            recorder = QueryRecorder(capture=1000)
+            with transaction.atomic():
+                method, path, data = scenario.build(sampler)
+                with connection.execute_wrapper(recorder):
+                    send(client, method, path, data)
+                transaction.set_rollback(True)
+            statements[scenario.name] = [(sql, params) for _, sql, params in recorder.statements]
+    return statements
+
+
+CONCURRENCY_MODES = ('wsgi', 'asgi-sync', 'asgi')
+
+
+def get_token():
+    """
+    Returns a bearer token of the benchmark user, the async client cannot
+    force authentication.
+    """
+    user, _ = User.objects.get_or_create(username='benchmark')
+    application, _ = get_application_model().objects.get_or_create(name='benchmark', defaults={
+        'user': user, 'client_type': 'confidential', 'authorization_grant_type': 'password',
+    })
+    token, _ = get_access_token_model().objects.update_or_create(
+        token='benchmark', defaults={
+            'user': user, 'application': application, 'scope': 'read',
+            'expires': datetime.now(timezone.utc) + timedelta(days=1),
+        },
+    )
+    return token.token
+
+
+def get_async_urlconf():
+    module = types.ModuleType('library_benchmark_urls')
+    module.urlpatterns = asyncify(import_module(settings.ROOT_URLCONF).urlpatterns)
+    return module
+
+
+def run_sequential(token, paths):
+    client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for path in paths:
+        request_started = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code >= 400
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_concurrent(token, paths, concurrency):
+    client = AsyncClient()
+    # The headers replace those of the client, queries stay in the path.
+    headers = [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def send_one(path):
+        nonlocal errors
+        async with semaphore:
+            request_started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*[send_one(path) for path in paths])
+    return latencies, errors, time.perf_counter() - started
+
+
+@contextmanager
+def query_latency(seconds):
+    """
+    Adds ``seconds`` to every query of every connection, in every thread,
+    standing for the round trip to a database server.
+    """
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    delayed = []
+
+    def install(connection, **kwargs):
+        # First, execute_wrapper() pops the last one when it exits.
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+            delayed.append(connection)
+
+    if not seconds:
+        yield
+        return
+    for alias in connections:
+        install(connections[alias])
+    connection_created.connect(install)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        for wrapper in delayed:
+            wrapper.execute_wrappers.remove(delay)
+
+
+def run_mode(mode, token, paths, concurrency):
+    if mode == 'wsgi':
+        return run_sequential(token, paths)
+    if mode == 'asgi':
+        with override_settings(ROOT_URLCONF=get_async_urlconf()):
+            return asyncio.run(run_concurrent(token, paths, concurrency))
+    return asyncio.run(run_concurrent(token, paths, concurrency))
+
+
+def run_concurrency(names=None, requests=200, warmup=20, concurrency=8, seed=0, latency=0):
+    """
+    Runs the read scenarios in every mode of ``CONCURRENCY_MODES`` on the
+    same requests and returns the results by scenario then mode. ``wsgi``
+    serves one request at a time, the ASGI modes keep ``concurrency``
+    requests in flight. A local SQLite file answers without waiting, so
+    ``latency`` seconds per query can be added to stand for a server.
+    """
+    sampler = Sampler(seed)
+    token = get_token()
+    results = {}
+    with environment(), query_latency(latency):
+        for scenario in get_scenarios(names):
+            if scenario.write:
+                continue
+            paths = []
+            for _ in range(warmup + requests):
+                _, path, data = scenario.build(sampler)
+                paths.append(f'{path}?{urlencode(data)}' if data else path)
+            results[scenario.name] = {}
+            for mode in CONCURRENCY_MODES:
+                run_mode(mode, token, paths[:warmup], concurrency)
+                latencies, errors, elapsed = run_mode(mode, token, paths[warmup:], concurrency)
+                results[scenario.name][mode] = summarize(latencies, [], errors, elapsed)
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'catalog': get_catalog(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': requests,
+            'concurrency': concurrency,
+            'query_latency_ms': latency * 1000,
+            'async': get_async_options(),
+        },
+        'scenarios': results,
+    }
+
+
+RENDERERS = {
+    'json': JSONRenderer,
+    'orjson': ORJSONRenderer,
+    'msgpack': MessagePackRenderer,
+}
+
+
+def best_time(func, rounds):
+    """
+    Seconds of the fastest of ``rounds`` calls, the least disturbed one.
+    """
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_render(books=1000, rounds=20):
+    """
+    Renders ``BooksSerializer`` output for ``books`` books with every
+    renderer of ``RENDERERS`` and compresses the result with every available
+    encoding. Returns milliseconds and bytes by renderer, and whether the
+    orjson output is byte for byte the one of ``JSONRenderer``.
+    """
+    queryset = Book.objects.prefetch_related('tags').order_by('pk')[:books]
+    data = BooksSerializer(queryset, many=True).data
+    results, outputs = {}, {}
+    for name, renderer_class in RENDERERS.items():
+        renderer = renderer_class()
+        content = outputs[name] = renderer.render(data, renderer.media_type)
+        result = results[name] = {
+            'render_ms': best_time(lambda: renderer.render(data, renderer.media_type), rounds) * 1000,
+            'bytes': len(content),
+        }
+        for encoding in compression.get_encodings():
+            compressed = compression.compress(content, encoding)
+            result[f'{encoding}_ms'] = best_time(lambda: compression.compress(content, encoding), rounds) * 1000
+            result[f'{encoding}_bytes'] = len(compressed)
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'books': len(data),
+            'rounds': rounds,
+            'python': platform.python_version(),
+            'orjson_identical': outputs['orjson'] == outputs['json'],
+        },
+        'renderers': results,
+    }
@@ -0,0 +1,79 @@
+"""
+Set-based write helpers shared by the bulk API and the loading commands.
+"""
+import csv
+import io
+
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_save
+
+
+def create_returning_ids(model, objs, using='default', batch_size=None, send_signals=False):
+    """
+    Inserts ``objs`` and sets their primary keys. Uses a single
+    ``INSERT ... RETURNING`` where the backend supports it, one ``INSERT`` per
+    object otherwise. With ``send_signals`` every object gets its
+    ``post_save`` as if it had been saved on its own.
+    """
+    if not connections[using].features.can_return_rows_from_bulk_insert:
+        for obj in objs:
+            obj.save(using=using, force_insert=True)
+        return objs
+    objs = model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+    if send_signals:
+        for obj in objs:
+            post_save.send(sender=model, instance=obj, created=True, update_fields=None, raw=False, using=using)
+    return objs
+
+
+def send_m2m_changed(field, changes, action, using='default'):
+    """
+    Sends the ``m2m_changed`` signal ``instance.<field>.add()`` or
+    ``.remove()`` would have sent, for every ``(instance, pk_set)`` in
+    ``changes``.
+    """
+    for instance, pk_set in changes:
+        if pk_set:
+            m2m_changed.send(
+                sender=field.remote_field.through, instance=instance, action=action,
+                reverse=False, model=field.related_model, pk_set=set(pk_set), using=using,
+            )
+
+
+def insert_links(through, source, target, pairs, using='default', batch_size=10000):
+    """
+    Inserts ``(source_id, target_id)`` pairs into an M2M table, skipping
+    pairs that already exist. On Postgres the rows are streamed with
+    ``COPY`` into a temporary table and merged with a single ``INSERT``.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return
+    connection = connections[using]
+    columns = (f'{source}_id', f'{target}_id')
+    if connection.vendor == 'postgresql':
+        _copy_links(connection, through._meta.db_table, columns, pairs)
+        return
+    through.objects.using(using).bulk_create(
+        [through(**dict(zip(columns, pair))) for pair in pairs],
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def _copy_links(connection, table, columns, pairs):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(pairs)
+    buffer.seek(0)
+    column_list = ', '.join(columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE IF NOT EXISTS {table}_load '
+            f'({columns[0]} integer, {columns[1]} integer) ON COMMIT DELETE ROWS'
+        )
+        cursor.execute(f'TRUNCATE {table}_load')
+        cursor.copy_expert(f'COPY {table}_load ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {table}_load '
+            f'ON CONFLICT DO NOTHING'
+        )
@@ -0,0 +1,155 @@
+"""
+Response cache for the read endpoints.
+
+Entries are stored in a Django cache (``LIBRARY_RESPONSE_CACHE['CACHE_ALIAS']``,
+so local memory, file based or Redis backends all work, with their own
+TTL/LRU eviction). The key of an entry includes the current generation of
+every model and link table the endpoint reads; signals bump generations on
+writes, which orphans exactly the entries that could have changed. Each
+entry carries a strong ETag so ``If-None-Match`` is answered with a 304
+straight from the cache.
+
+A response read from a replica (see ``library.db_routers``) may predate a
+write whose generation bump already happened on the primary, so it is
+only kept for ``REPLICA_TIMEOUT`` seconds, about the replication lag the
+sticky primary cookie assumes.
+"""
+import functools
+import hashlib
+import time
+
+import orjson
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from library.db_routers import read_alias
+from library.models import Book, Author
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'library',
+    'REPLICA_TIMEOUT': 5,
+}
+
+
+class ResponseCache:
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'LIBRARY_RESPONSE_CACHE', {})}
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE_ALIAS']]
+
+    def generation_key(self, label):
+        return f'{self.options["KEY_PREFIX"]}:generation:{label}'
+
+    def get_generations(self, labels):
+        keys = {self.generation_key(label): label for label in labels}
+        generations = self.cache.get_many(list(keys))
+        for key in keys:
+            if key not in generations:
+                # Never restart from a number an evicted generation may have used.
+                self.cache.add(key, time.time_ns(), timeout=None)
+                generations[key] = self.cache.get(key)
+        return [f'{keys[key]}={generations[key]}' for key in sorted(keys)]
+
+    def invalidate(self, *labels, using=None):
+        """
+        Bumps the generation of ``labels`` now and again after commit, so a
+        reader that cached the pre-commit state is orphaned as well.
+        """
+        self._bump(labels)
+        transaction.on_commit(lambda: self._bump(labels), using=using)
+
+    def invalidate_all(self, using=None):
+        """
+        Invalidates every library endpoint, for writes that bypass model signals.
+        """
+        labels = ['book', 'author', 'tag', Book.tags.through._meta.model_name, Author.books.through._meta.model_name]
+        self.invalidate(*labels, using=using)
+
+    def _bump(self, labels):
+        for label in labels:
+            key = self.generation_key(label)
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, time.time_ns(), timeout=None)
+
+    def get_key(self, request, labels):
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        parts = [
+            request.get_host(),
+            request.path,
+            query,
+            getattr(request, 'accepted_media_type', ''),
+        ] + self.get_generations(labels)
+        digest = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+        return f'{self.options["KEY_PREFIX"]}:response:{digest}'
+
+    @staticmethod
+    def get_etag(data, media_type):
+        content = orjson.dumps(data, default=DjangoJSONEncoder().default, option=orjson.OPT_NON_STR_KEYS)
+        return '"%s"' % hashlib.sha1(f'{media_type}\n'.encode('utf-8') + content).hexdigest()
+
+    @staticmethod
+    def get_matching_etag(request, etag):
+        """
+        Returns the tag of ``If-None-Match`` that matches ``etag``, or
+        ``None``. Compressed responses carry the weak form of ``etag`` (see
+        ``library.middleware.CompressionMiddleware``), which matches too.
+        """
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return None
+        for tag in parse_etags(header):
+            if tag == '*':
+                return etag
+            if tag in (etag, 'W/' + etag):
+                return tag
+        return None
+
+    def respond(self, view, request, handler):
+        if request.method not in ('GET', 'HEAD'):
+            return handler()
+        key = self.get_key(request, view.get_cache_models())
+        entry = self.cache.get(key)
+        if entry is None:
+            response = handler()
+            if response.status_code != status.HTTP_200_OK or not isinstance(response, Response):
+                return response
+            etag = self.get_etag(response.data, getattr(request, 'accepted_media_type', ''))
+            replica = read_alias.get() is not None
+            timeout = self.options['REPLICA_TIMEOUT' if replica else 'TIMEOUT']
+            self.cache.set(key, (etag, response.data), timeout)
+        else:
+            etag, data = entry
+            response = Response(data)
+        matching = self.get_matching_etag(request, etag)
+        if matching is not None:
+            # Echoes the form the client holds, the body is not compressed.
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            etag = matching
+        response['ETag'] = etag
+        return response
+
+
+response_cache = ResponseCache()
+
+
+def cache_response(method):
+    """
+    Serves a viewset method from the response cache. Authentication and
+    permissions have already run by the time the handler is called.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        return response_cache.respond(view, request, lambda: method(view, request, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,125 @@
+"""
+Change feed over books, authors and tags (``/changes/?since=<cursor>``).
+
+Every object carries ``updated_at``, bumped by saves and, through the
+counters, by changes to its links; deletes leave a ``Tombstone``. The feed
+merges the four ``(timestamp, id)`` ordered streams, each read from its own
+index, and returns a cursor that resumes right after the last event. An
+object appears once, with its current state, at its latest change.
+
+Timestamps are taken before the writing transaction commits, so a row can
+become visible with a timestamp a reader has already passed. The feed
+therefore stops ``LAG_SECONDS`` short of the present; writes taking longer
+than that to commit can be missed.
+"""
+import base64
+import binascii
+import heapq
+import json
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from library.models import Book, Author, Tag, Tombstone
+
+DEFAULTS = {
+    'PAGE_SIZE': 500,
+    'MAX_PAGE_SIZE': 5000,
+    'LAG_SECONDS': 5,
+    'TOMBSTONE_DAYS': 30,
+}
+
+Source = namedtuple('Source', ['name', 'model', 'field'])
+
+# The position of a source breaks ties between events at the same instant.
+SOURCES = [
+    Source('book', Book, 'updated_at'),
+    Source('author', Author, 'updated_at'),
+    Source('tag', Tag, 'updated_at'),
+    Source('delete', Tombstone, 'deleted_at'),
+]
+
+Event = namedtuple('Event', ['timestamp', 'source', 'pk'])
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The cursor is older than the kept deletes, sync again from the start.'
+    default_code = 'cursor_expired'
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_CHANGES', {})}
+
+
+def encode_cursor(event):
+    data = json.dumps([event.timestamp.isoformat(), event.source, event.pk])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(value):
+    """
+    Returns the ``Event`` a cursor points at, ``None`` for an empty one.
+    """
+    if not value:
+        return None
+    try:
+        timestamp, source, pk = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None or not 0 <= source < len(SOURCES) or not isinstance(pk, int):
+            raise ValueError
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValidationError({'since': ['Invalid cursor.']})
+    return Event(timestamp, source, pk)
+
+
+def get_events(index, queryset, since, until, limit):
+    """
+    Returns the first ``limit`` events of one source after ``since``.
+    """
+    field = SOURCES[index].field
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if since is not None:
+        if index > since.source:
+            queryset = queryset.filter(**{f'{field}__gte': since.timestamp})
+        elif index < since.source:
+            queryset = queryset.filter(**{f'{field}__gt': since.timestamp})
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': since.timestamp}) | Q(**{field: since.timestamp, 'pk__gt': since.pk})
+            )
+    rows = queryset.order_by(field, 'pk').values_list(field, 'pk')[:limit]
+    return [Event(timestamp, index, pk) for timestamp, pk in rows]
+
+
+def read(since, limit, using=None, now=None):
+    """
+    Returns the first ``limit`` events after ``since`` and whether there are
+    more, reading at most ``limit`` rows from every source.
+    """
+    options = get_options()
+    now = now or timezone.now()
+    if since is not None and since.timestamp < now - timedelta(days=options['TOMBSTONE_DAYS']):
+        raise CursorExpired()
+    until = now - timedelta(seconds=options['LAG_SECONDS'])
+    streams = [
+        get_events(index, source.model.objects.using(using), since, until, limit + 1)
+        for index, source in enumerate(SOURCES)
+    ]
+    events = list(heapq.merge(*streams))
+    return events[:limit], len(events) > limit
+
+
+def prune_tombstones(using=None, now=None):
+    """
+    Deletes the tombstones older than ``TOMBSTONE_DAYS``; cursors from before
+    then get ``CursorExpired``.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=get_options()['TOMBSTONE_DAYS'])
+    return Tombstone.objects.using(using).filter(deleted_at__lt=cutoff).delete()[0]
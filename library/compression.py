@@ -0,0 +1,99 @@
+"""
+Response compression for ``library.middleware.CompressionMiddleware``.
+
+Bodies of at least ``MIN_SIZE`` bytes whose media type starts with one of
+``CONTENT_TYPES`` are compressed with brotli when the ``brotli`` package is
+installed and the client accepts it, with gzip otherwise. Streaming
+responses (exports) are compressed chunk by chunk, flushing after every
+chunk so rows reach the client as they are produced.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'CONTENT_TYPES': ('application/json', 'application/msgpack', 'application/x-ndjson', 'text/'),
+    'GZIP_LEVEL': 6,
+    # Low qualities compress about as fast as gzip and still smaller.
+    'BROTLI_QUALITY': 4,
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_COMPRESSION', {})}
+
+
+def get_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def parse_accept_encoding(header):
+    """
+    Returns ``{coding: q}`` for an ``Accept-Encoding`` header.
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """
+    Returns the encoding to compress with for an ``Accept-Encoding`` header,
+    the most preferred by the client, ours breaking ties, or ``None``.
+    """
+    accepted = parse_accept_encoding(header or '')
+    best, best_q = None, 0
+    for encoding in get_encodings():
+        q = accepted.get(encoding, accepted.get('*', 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type):
+    media_type = content_type.split(';')[0].strip().lower()
+    return media_type.startswith(tuple(get_options()['CONTENT_TYPES']))
+
+
+def compress(content, encoding):
+    options = get_options()
+    if encoding == 'br':
+        return brotli.compress(content, quality=options['BROTLI_QUALITY'])
+    return gzip.compress(content, compresslevel=options['GZIP_LEVEL'], mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    options = get_options()
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=options['BROTLI_QUALITY'])
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+    # 16 + MAX_WBITS writes the gzip header and trailer.
+    compressor = zlib.compressobj(options['GZIP_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,118 @@
+"""
+Runs independent reads of a request at the same time, in worker threads
+with database connections of their own.
+
+Django 3.1 has no asynchronous ORM, so the reads are spread over threads:
+the database drivers release the GIL while they wait for a query. Workers
+close their connections after every call the way requests do, following
+``CONN_MAX_AGE``, and report their queries to the recorder of the request
+(``query_recorder``) so the metrics still count them.
+
+``ConcurrentPrefetchQuerySet`` is the queryset of the library models: with
+``LIBRARY_ASYNC['CONCURRENT_PREFETCH']`` on, prefetch lookups that follow
+different relations, e.g. the tags and the authors of a page of books, run
+concurrently. Inside a transaction they run one after the other, other
+connections would not see its writes.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connections, models
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+
+DEFAULTS = {
+    # Serve safe requests from worker threads under ASGI, see library.asyncviews.
+    'ENABLED': False,
+    'CONCURRENT_PREFETCH': False,
+    'PREFETCH_WORKERS': 8,
+}
+
+# QueryRecorder of the current request, installed on the connections of workers.
+query_recorder = ContextVar('library_query_recorder', default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_ASYNC', {})}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(get_options()['PREFETCH_WORKERS'], thread_name_prefix='library-prefetch')
+        return _executor
+
+
+@contextmanager
+def worker_connections():
+    """
+    Scope of one call in a worker thread: recycles old connections before
+    and after it and records its queries for the request.
+    """
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            recorder = query_recorder.get()
+            if recorder is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+            yield
+    finally:
+        close_old_connections()
+
+
+def call_in_worker(func):
+    with worker_connections():
+        return func()
+
+
+def run_all(calls):
+    """
+    Runs the ``calls`` concurrently, the first in the current thread, and
+    returns their results in order. Every call is waited for even when one
+    of them fails.
+    """
+    executor = get_executor()
+    futures = [executor.submit(copy_context().run, call_in_worker, call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        wait(futures)
+    return [first] + [future.result() for future in futures]
+
+
+def can_run_concurrently(using):
+    return get_options()['CONCURRENT_PREFETCH'] and not connections[using].in_atomic_block
+
+
+def group_lookups(lookups):
+    """
+    Groups prefetch lookups by the relation they start with; lookups of
+    different groups touch different objects and can run at the same time.
+    """
+    groups = {}
+    for lookup in lookups:
+        path = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        groups.setdefault(path.split(LOOKUP_SEP)[0], []).append(lookup)
+    return list(groups.values())
+
+
+class ConcurrentPrefetchQuerySet(models.QuerySet):
+    def _prefetch_related_objects(self):
+        groups = group_lookups(self._prefetch_related_lookups)
+        if len(groups) < 2 or not self._result_cache or not can_run_concurrently(self.db):
+            return super()._prefetch_related_objects()
+        # The groups fill different keys of the same caches, create them first.
+        for obj in self._result_cache:
+            if not hasattr(obj, '_prefetched_objects_cache'):
+                obj._prefetched_objects_cache = {}
+        run_all([partial(prefetch_related_objects, self._result_cache, *lookups) for lookups in groups])
+        self._prefetch_done = True
@@ -0,0 +1,105 @@
+"""
+Denormalized link counters: ``Tag.book_count``, ``Author.book_count``,
+``Book.tag_count`` and ``Book.author_count``.
+
+They are updated with ``F()`` expressions in the transaction of the write,
+together with ``updated_at`` so the change feed picks up link changes,
+from ``m2m_changed`` for link changes and from ``pre_delete`` for the links
+a delete cascades to (see ``library.signals``). Writes that bypass signals
+call ``reconcile``, which recounts from the link tables.
+"""
+from collections import namedtuple
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from library.models import Book, Author, Tag
+
+Counter = namedtuple('Counter', ['model', 'field', 'through', 'column'])
+
+COUNTERS = [
+    Counter(Tag, 'book_count', Book.tags.through, 'tag_id'),
+    Counter(Book, 'tag_count', Book.tags.through, 'book_id'),
+    Counter(Author, 'book_count', Author.books.through, 'author_id'),
+    Counter(Book, 'author_count', Author.books.through, 'book_id'),
+]
+
+
+def link_models(through):
+    """
+    Returns ``{column: model}`` for the source then the target column of an
+    auto-created M2M table.
+    """
+    model = through._meta.auto_created
+    field = next(field for field in model._meta.many_to_many if field.remote_field.through is through)
+    return {field.m2m_column_name(): model, field.m2m_reverse_name(): field.related_model}
+
+
+def add(counter, ids, delta, using=None):
+    """
+    Adds ``delta`` to the counter of the objects in ``ids`` (a list or a
+    subquery), never going below zero, and marks them as updated.
+    """
+    value = F(counter.field) + delta
+    if delta < 0:
+        value = Greatest(value, Value(0))
+    return counter.model.objects.using(using).filter(pk__in=ids).update(**{
+        counter.field: value,
+        'updated_at': timezone.now(),
+    })
+
+
+def links_changed(through, source_ids, target_ids, delta, using=None, instance=None):
+    """
+    Counts ``delta`` (1 or -1) for every link between ``source_ids`` and
+    ``target_ids``, one side of which is a single object, and applies the
+    change to ``instance`` in memory as well.
+    """
+    source = next(iter(link_models(through)))
+    for counter in COUNTERS:
+        if counter.through is not through:
+            continue
+        ids, other = (source_ids, target_ids) if counter.column == source else (target_ids, source_ids)
+        add(counter, list(ids), delta * len(other), using=using)
+        if isinstance(instance, counter.model) and instance.pk in ids and counter.field in instance.__dict__:
+            setattr(instance, counter.field, max(getattr(instance, counter.field) + delta * len(other), 0))
+
+
+def object_deleting(instance, using=None):
+    """
+    Decrements the counters on the other side of every link of ``instance``,
+    before the delete cascades to the link tables.
+    """
+    for counter in COUNTERS:
+        for column, model in link_models(counter.through).items():
+            if column != counter.column and isinstance(instance, model):
+                linked = counter.through.objects.using(using).filter(**{column: instance.pk})
+                add(counter, linked.values(counter.column), -1, using=using)
+
+
+def get_drift(counter, using=None):
+    """
+    Returns ``(pk, stored, actual)`` for every object whose counter is wrong.
+    """
+    actual = counter.through.objects.filter(**{counter.column: OuterRef('pk')}).order_by().values(
+        counter.column).annotate(count=Count('pk')).values('count')
+    return counter.model.objects.using(using).annotate(
+        actual=Coalesce(Subquery(actual, output_field=IntegerField()), Value(0)),
+    ).exclude(**{counter.field: F('actual')}).order_by('pk').values_list('pk', counter.field, 'actual')
+
+
+def reconcile(using=None, fix=True, batch_size=1000):
+    """
+    Recounts every counter from the link tables. Returns
+    ``{'<model>.<field>': number of wrong counters}``.
+    """
+    report = {}
+    for counter in COUNTERS:
+        drift = list(get_drift(counter, using).iterator())
+        report[f'{counter.model._meta.model_name}.{counter.field}'] = len(drift)
+        if fix and drift:
+            now = timezone.now()
+            objs = [counter.model(pk=pk, updated_at=now, **{counter.field: actual}) for pk, _, actual in drift]
+            counter.model.objects.using(using).bulk_update(objs, [counter.field, 'updated_at'], batch_size=batch_size)
+    return report
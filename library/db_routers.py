@@ -0,0 +1,115 @@
+"""
+Routes the reads of safe requests to read replicas.
+
+``LIBRARY_REPLICAS['ALIASES']`` lists the replica database aliases.
+``ReplicaMiddleware`` picks one healthy replica per GET/HEAD/OPTIONS request
+and ``ReplicaRouter`` sends the reads of the ``library`` models there; other
+requests, writes, reads inside a transaction and every read that follows a
+write use the primary. A client that wrote is pinned to the primary for
+``STICKY_SECONDS`` with a cookie, so it reads its own writes while the
+replicas catch up.
+
+To try it locally add a second alias, e.g. a copy of the SQLite database,
+with ``'TEST': {'MIRROR': 'default'}`` and list it in ``ALIASES``.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+DEFAULTS = {
+    'ALIASES': [],
+    'APPS': ['library'],
+    'STICKY_SECONDS': 5,
+    'COOKIE_NAME': 'library_primary',
+    # Seconds between two checks of a replica; a failed one is skipped until then.
+    'HEALTH_CHECK_INTERVAL': 10,
+}
+
+# Alias the reads of the current request are sent to, None for the primary.
+read_alias = ContextVar('library_read_alias', default=None)
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_REPLICAS', {})}
+
+
+class ReplicaPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checks = {}
+
+    def check(self, alias):
+        """
+        Returns whether ``alias`` answers a trivial query, reconnecting once
+        if its persistent connection went away.
+        """
+        connection = connections[alias]
+        for _ in range(2):
+            try:
+                connection.ensure_connection()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                return True
+            except DatabaseError:
+                connection.close()
+        return False
+
+    def is_healthy(self, alias):
+        interval = get_options()['HEALTH_CHECK_INTERVAL']
+        now = time.monotonic()
+        with self._lock:
+            checked = self._checks.get(alias)
+        if checked is None or interval is not None and now - checked[0] >= interval:
+            checked = (now, self.check(alias))
+            with self._lock:
+                self._checks[alias] = checked
+        return checked[1]
+
+    def choose(self):
+        """
+        Returns a random healthy replica, or ``None`` when there is none.
+        """
+        aliases = list(get_options()['ALIASES'])
+        random.shuffle(aliases)
+        for alias in aliases:
+            if self.is_healthy(alias):
+                return alias
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._checks = {}
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or model._meta.app_label not in get_options()['APPS']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Read your own writes for the rest of the request.
+        read_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_options()['ALIASES']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary.
+        if db in get_options()['ALIASES']:
+            return False
+        return None
@@ -0,0 +1,126 @@
+"""
+Streaming catalog export.
+
+Rows are read as plain values through a server-side cursor
+(``QuerySet.iterator``) one chunk at a time; the M2M links of a chunk are
+fetched with one query per relation and embedded into each row. Memory use
+is bounded by the chunk size whatever the size of the table.
+"""
+import csv
+from collections import defaultdict
+
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+
+from library.models import Book, Author, Tag
+
+
+class Relation:
+    """
+    A M2M relation exported as a list of ``{"id": ..., <label>: ...}``.
+    """
+
+    def __init__(self, name, through, source, target, label):
+        self.name = name
+        self.through = through
+        self.source = source
+        self.target = target
+        self.label = label
+
+    def fetch(self, ids):
+        links = defaultdict(list)
+        rows = self.through.objects.filter(**{f'{self.source}_id__in': ids}).values_list(
+            f'{self.source}_id', f'{self.target}_id', f'{self.target}__{self.label}',
+        ).order_by(f'{self.target}_id')
+        for source_id, target_id, label in rows:
+            links[source_id].append({'id': target_id, self.label: label})
+        return links
+
+
+EXPORTS = {
+    Book: (
+        ('id', 'title', 'pages'),
+        (
+            Relation('tags', Book.tags.through, 'book', 'tag', 'title'),
+            Relation('authors', Author.books.through, 'book', 'author', 'name'),
+        ),
+    ),
+    Author: (
+        ('id', 'name', 'year_of_birth'),
+        (
+            Relation('books', Author.books.through, 'author', 'book', 'title'),
+        ),
+    ),
+    Tag: (
+        ('id', 'title', 'description'),
+        (
+            Relation('books', Book.tags.through, 'tag', 'book', 'title'),
+        ),
+    ),
+}
+
+
+def iter_chunks(queryset, chunk_size=2000):
+    """
+    Yields lists of at most ``chunk_size`` denormalized rows.
+    """
+    fields, relations = EXPORTS[queryset.model]
+    rows = queryset.prefetch_related(None).values(*fields).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _attach(chunk, relations)
+            chunk = []
+    if chunk:
+        yield _attach(chunk, relations)
+
+
+def _attach(chunk, relations):
+    ids = [row['id'] for row in chunk]
+    for relation in relations:
+        links = relation.fetch(ids)
+        for row in chunk:
+            row[relation.name] = links.get(row['id'], [])
+    return chunk
+
+
+def ndjson_stream(queryset, chunk_size=2000):
+    default = DjangoJSONEncoder().default
+    option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+    for chunk in iter_chunks(queryset, chunk_size):
+        yield b''.join(orjson.dumps(row, default=default, option=option) for row in chunk)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_stream(queryset, chunk_size=2000):
+    """
+    One column per field, plus ``<relation>`` with the labels and
+    ``<relation>_ids`` with the ids of each relation, ``|`` separated.
+    """
+    fields, relations = EXPORTS[queryset.model]
+    writer = csv.writer(_Echo())
+    header = list(fields)
+    for relation in relations:
+        header += [relation.name, f'{relation.name}_ids']
+    yield writer.writerow(header)
+    for chunk in iter_chunks(queryset, chunk_size):
+        lines = []
+        for row in chunk:
+            values = [row[field] for field in fields]
+            for relation in relations:
+                links = row[relation.name]
+                values.append('|'.join(str(link[relation.label]) for link in links))
+                values.append('|'.join(str(link['id']) for link in links))
+            lines.append(writer.writerow(values))
+        yield ''.join(lines)
+
+
+STREAMS = {
+    'ndjson': ndjson_stream,
+    'csv': csv_stream,
+}
@@ -0,0 +1,127 @@
+"""
+Counts of the matching books per tag and per author (``?facets=``).
+
+Over the whole catalog the counts are the ``book_count`` counters (see
+``library.counters``). Tags of a filtered list are counted from the tag
+index: the matching book ids are read into a bitmap, unless the list came
+from the index already, and intersected with the posting lists of the
+tags in ``book_count`` order, stopping at the first tag whose
+``book_count`` cannot reach the ``limit``-th count found so far.
+
+Authors of a filtered list, and tags while the index is cold, are one
+grouped aggregate over the link table, restricted to the matching books,
+whose cost grows with the links of those books. It only runs for up to
+``MAX_SQL_BOOKS`` matching books; larger lists are refused.
+"""
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Count
+from rest_framework.exceptions import ValidationError
+
+from library.models import Book, Author
+from library.tag_index import bitmap_from_ids, tag_index
+
+DEFAULTS = {
+    'MAX_SQL_BOOKS': 100000,
+    # Tags counted from the index at a time.
+    'BATCH_SIZE': 256,
+}
+
+Facet = namedtuple('Facet', ['through', 'column', 'label'])
+
+FACETS = {
+    'tags': Facet(Book.tags.through, 'tag', 'title'),
+    'authors': Facet(Author.books.through, 'author', 'name'),
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_FACETS', {})}
+
+
+def get_model(name):
+    facet = FACETS[name]
+    return facet.through._meta.get_field(facet.column).related_model
+
+
+def by_book_count(name, using):
+    """
+    Returns the ``(id, label, book_count)`` rows of the values of a facet
+    with books, most frequent first.
+    """
+    rows = get_model(name).objects.using(using).filter(book_count__gt=0).order_by('-book_count', 'pk')
+    return rows.values_list('pk', FACETS[name].label, 'book_count')
+
+
+def count_catalog(name, using, limit):
+    label = FACETS[name].label
+    return [{'id': pk, label: value, 'count': count} for pk, value, count in by_book_count(name, using)[:limit]]
+
+
+def check_sql_books(name, queryset, count):
+    """
+    Refuses to count ``name`` in SQL over more than ``MAX_SQL_BOOKS``
+    books; ``count`` is the number of matching books when known.
+    """
+    max_books = get_options()['MAX_SQL_BOOKS']
+    if count is None:
+        count = max_books + queryset.order_by().values('pk')[max_books:max_books + 1].exists()
+    if count > max_books:
+        raise ValidationError({'facets': [f'Too many matching books to count "{name}", narrow the filter.']})
+    return count
+
+
+def count_sql(name, queryset, limit):
+    facet = FACETS[name]
+    column, label = f'{facet.column}_id', f'{facet.column}__{facet.label}'
+    rows = facet.through.objects.using(queryset.db).filter(
+        book_id__in=queryset.order_by().values('pk'),
+    ).values(column, label).annotate(count=Count('pk')).order_by('-count', column)
+    return [{'id': row[column], facet.label: row[label], 'count': row['count']} for row in rows[:limit]]
+
+
+def count_index(name, bitmap, using, limit):
+    """
+    Counts the tags of the books in ``bitmap`` from the tag index, or
+    returns ``None`` while it is cold.
+    """
+    batch_size = max(get_options()['BATCH_SIZE'], limit)
+    rows = by_book_count(name, using).iterator(chunk_size=batch_size)
+    top = []
+    while True:
+        batch = list(islice(rows, batch_size))
+        # A tag counts at most its book_count books.
+        if not batch or len(top) == limit and batch[0][2] < -top[-1][0]:
+            break
+        counts = tag_index.count_tags(bitmap, [pk for pk, _, _ in batch])
+        if counts is None:
+            return None
+        top = sorted(top + [(-counts[pk], pk, value) for pk, value, _ in batch if counts[pk]])[:limit]
+    label = FACETS[name].label
+    return [{'id': pk, label: value, 'count': -count} for count, pk, value in top]
+
+
+def get_facets(names, queryset, limit, bitmap=None, whole_catalog=False, count=None):
+    """
+    Returns ``{name: [{'id', <label>, 'count'}, ...]}`` with the ``limit``
+    most frequent values of every facet. ``bitmap`` is the tag index result
+    the queryset was built from, ``whole_catalog`` tells the queryset is not
+    filtered and ``count`` is its size when already known.
+    """
+    facets = {}
+    for name in names:
+        counts = None
+        if whole_catalog and bitmap is None:
+            counts = count_catalog(name, queryset.db, limit)
+        elif name == 'tags' and (bitmap is not None or tag_index.is_warm()):
+            books = bitmap
+            if books is None:
+                books = bitmap_from_ids(queryset.order_by().values_list('pk', flat=True).iterator(chunk_size=10000))
+            counts = count_index(name, books, queryset.db, limit)
+        if counts is None:
+            count = check_sql_books(name, queryset, count)
+            counts = count_sql(name, queryset, limit)
+        facets[name] = counts
+    return facets
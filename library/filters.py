@@ -0,0 +1,105 @@
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from library import search
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    ``SearchFilter`` backed by the full-text index from ``library.search``.
+
+    Fields prefixed with ``@`` in ``search_fields`` are matched through the
+    model's search document and the results are ranked by relevance.
+    Integer fields only match terms that are numbers, by equality, so they
+    stay index friendly; other fields keep the ``SearchFilter`` lookups.
+    """
+    rank_annotation = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        model = queryset.model
+        use_document = search.has_search_document(model) and any(f.startswith('@') for f in search_fields)
+        other_fields = [f for f in search_fields if not f.startswith('@') or not use_document]
+
+        conditions = []
+        if use_document:
+            conditions.append(Q(pk__in=search.match(model, search_terms, queryset.db)))
+        if other_fields:
+            conditions.append(self.get_fields_condition(model, other_fields, search_terms))
+        queryset = queryset.filter(reduce(operator.or_, conditions))
+
+        if use_document:
+            queryset = queryset.annotate(**{
+                self.rank_annotation: search.rank(model, search_terms, queryset.db),
+            })
+            queryset = queryset.order_by('-' + self.rank_annotation, *model._meta.ordering)
+        return queryset
+
+    def get_fields_condition(self, model, search_fields, search_terms):
+        condition = Q()
+        for term in search_terms:
+            term_condition = Q(pk__in=[])
+            for search_field in search_fields:
+                field = self.get_model_field(model, search_field)
+                if isinstance(field, models.IntegerField):
+                    if term.isdigit():
+                        term_condition |= Q(**{field.name: int(term)})
+                    continue
+                if search_field.startswith('@'):
+                    search_field = search_field[1:]
+                term_condition |= Q(**{self.construct_search(search_field): term})
+            condition &= term_condition
+        return condition
+
+    @staticmethod
+    def get_model_field(model, search_field):
+        name = search_field.lstrip('^=@$')
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+
+def parse_ids(values, max_ids, name='ids'):
+    """
+    Returns ``values`` as a list of integers, raising a ``ValidationError``
+    on anything else or on more than ``max_ids`` of them.
+    """
+    if not isinstance(values, (list, tuple)):
+        raise ValidationError({name: ['Expected a list of ids.']})
+    if len(values) > max_ids:
+        raise ValidationError({name: [f'Expected at most {max_ids} ids.']})
+    ids = []
+    for value in values:
+        if isinstance(value, bool):
+            raise ValidationError({name: ['Expected integer ids.']})
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            raise ValidationError({name: ['Expected integer ids.']})
+    return ids
+
+
+class IdsFilter(BaseFilterBackend):
+    """
+    Keeps the objects listed in ``?ids=1,2,3``.
+    """
+    ids_param = 'ids'
+    max_ids = 1000
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.ids_param)
+        if not value:
+            return queryset
+        ids = parse_ids([part.strip() for part in value.split(',')], self.max_ids, self.ids_param)
+        return queryset.filter(pk__in=ids)
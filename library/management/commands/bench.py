@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the API in process against the current catalog (see seed_catalog) and reports '
+        'p50/p95/p99 latency, throughput and queries per request for every scenario. '
+        'Results can be saved as JSON and compared with an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=[scenario.name for scenario in benchmark.SCENARIOS],
+            help='Scenario to run, may be repeated. Defaults to all of them.',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--cache', action='store_true', help='Keep the response cache enabled.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='JSON file of an earlier run to compare with.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Tolerated p95 growth, 0.2 is 20%%.')
+
+    def handle(self, *args, **options):
+        results = benchmark.run(
+            options['scenario'], options['requests'], options['warmup'], options['seed'], options['cache'],
+        )
+        catalog = ', '.join(f'{count} {name}' for name, count in results['meta']['catalog'].items())
+        self.stdout.write(f'Catalog: {catalog}')
+        self.stdout.write(
+            f'{"scenario":<16}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"req/s":>9}{"queries":>9}{"errors":>8}'
+        )
+        for name, result in results['scenarios'].items():
+            self.stdout.write(
+                f'{name:<16}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}{result["p99_ms"]:>9.2f}'
+                f'{result["throughput_rps"]:>9.0f}{result["queries_per_request"]:>9.1f}{result["errors"]:>8}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = 0
+            for name, metric, previous, current, regressed in benchmark.compare(
+                    baseline, results, options['threshold']):
+                regressions += regressed
+                line = f'{name:<16}{metric:<22}{previous:>10.2f} -> {current:<10.2f}'
+                self.stdout.write(self.style.ERROR(line + ' regressed') if regressed else line)
+            if regressions:
+                raise CommandError(f'{regressions} regressions compared to {options["compare"]}')
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from library import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the read scenarios served one request at a time, as by a WSGI worker, with concurrent '
+        'requests through the ASGI handler, with sync views (asgi-sync) and with library.asyncviews (asgi). '
+        'Everything runs in one process, like a single worker.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append',
+            choices=[scenario.name for scenario in benchmark.SCENARIOS if not scenario.write],
+            help='Scenario to run, may be repeated. Defaults to all the read scenarios.',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario and mode.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario and mode.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight in the ASGI modes.')
+        parser.add_argument(
+            '--query-latency', type=float, default=0,
+            help='Milliseconds added to every query, standing for the round trip to a database server.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        results = benchmark.run_concurrency(
+            options['scenario'], options['requests'], options['warmup'], options['concurrency'], options['seed'],
+            options['query_latency'] / 1000,
+        )
+        catalog = ', '.join(f'{count} {name}' for name, count in results['meta']['catalog'].items())
+        self.stdout.write(
+            f'Catalog: {catalog}, concurrency {options["concurrency"]}, '
+            f'{options["query_latency"]:g}ms added per query'
+        )
+        self.stdout.write(f'{"scenario":<16}{"mode":<11}{"p50 ms":>9}{"p95 ms":>9}{"req/s":>9}{"errors":>8}')
+        for name, modes in results['scenarios'].items():
+            for mode, result in modes.items():
+                self.stdout.write(
+                    f'{name:<16}{mode:<11}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                    f'{result["throughput_rps"]:>9.0f}{result["errors"]:>8}'
+                )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from library import benchmark, compression
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the JSON, orjson and MessagePack renderers and the response compressions on BooksSerializer '
+        'output of the current catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000, help='Books in the rendered list.')
+        parser.add_argument('--rounds', type=int, default=20, help='Timed renders, the fastest is reported.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        results = benchmark.run_render(options['books'], options['rounds'])
+        meta = results['meta']
+        self.stdout.write(f'{meta["books"]} books, orjson output identical to json: {meta["orjson_identical"]}')
+        encodings = compression.get_encodings()
+        header = f'{"renderer":<10}{"render ms":>11}{"bytes":>10}'
+        for encoding in encodings:
+            header += f'{encoding + " ms":>10}{encoding + " bytes":>12}'
+        self.stdout.write(header)
+        for name, result in results['renderers'].items():
+            line = f'{name:<10}{result["render_ms"]:>11.2f}{result["bytes"]:>10}'
+            for encoding in encodings:
+                line += f'{result[encoding + "_ms"]:>10.2f}{result[encoding + "_bytes"]:>12}'
+            self.stdout.write(line)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
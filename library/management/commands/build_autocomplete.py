@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import autocomplete
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the prefix index of book titles, author names and tag titles '
+        'served at /autocomplete/ (see library/autocomplete.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--key-bytes', type=int, help='Bytes of every name suffix kept in the index.')
+        parser.add_argument('--scan-limit', type=int)
+        parser.add_argument('--top-size', type=int)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        overrides = {
+            name.upper(): options[name]
+            for name in ('key_bytes', 'scan_limit', 'top_size') if options[name] is not None
+        }
+        started = time.monotonic()
+        counts = autocomplete.build(using=options['database'], **overrides)
+        built = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Built autocomplete for {built} in {time.monotonic() - started:.1f}s'))
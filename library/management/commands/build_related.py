@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import related
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the "related books" model served at /books/{id}/related/ '
+        'from the tags and authors of every book (see library/related.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, help='Neighbours stored per book.')
+        parser.add_argument('--author-weight', type=float)
+        parser.add_argument('--block-size', type=int)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        overrides = {
+            name.upper(): options[name]
+            for name in ('k', 'author_weight', 'block_size') if options[name] is not None
+        }
+        started = time.monotonic()
+        books = related.build(using=options['database'], **overrides)
+        self.stdout.write(self.style.SUCCESS(
+            f'Built related books for {books} books in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from library import benchmark
+
+
+def iter_sqlite_scans(cursor, sql, params):
+    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+    for row in cursor.fetchall():
+        detail = row[-1]
+        words = detail.split()
+        if words[0] != 'SCAN' or 'INDEX' in words or words[1] in ('CONSTANT', 'SUBQUERY'):
+            continue
+        table = words[2] if words[1] == 'TABLE' else words[1]
+        yield table, detail
+
+
+def iter_postgresql_scans(cursor, sql, params):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', ()))
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name'], f'Seq Scan on {node["Relation Name"]} (rows={node["Plan Rows"]})'
+
+
+SCANS = {
+    'sqlite': iter_sqlite_scans,
+    'postgresql': iter_postgresql_scans,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs every benchmark scenario once against the current catalog, explains the SELECT '
+        'queries it sent and reports the sequential scans of the library tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', choices=[scenario.name for scenario in benchmark.SCENARIOS],
+            help='Scenario to check, may be repeated. Defaults to all of them.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a scan is found.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SCANS:
+            raise CommandError(f'Query plans of {connection.vendor} are not supported')
+        iter_scans = SCANS[connection.vendor]
+        found = 0
+        statements = benchmark.capture_queries(options['scenario'], options['seed'])
+        with connection.cursor() as cursor:
+            for name, queries in statements.items():
+                for sql, params in queries:
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    for table, detail in iter_scans(cursor, sql, params):
+                        if not table.startswith('library_'):
+                            continue
+                        found += 1
+                        self.stdout.write(f'{name}: {detail}\n  {sql[:300]}')
+        if not found:
+            self.stdout.write(self.style.SUCCESS('No sequential scans'))
+        elif options['fail']:
+            raise CommandError(f'{found} sequential scans')
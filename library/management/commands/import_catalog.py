@@ -0,0 +1,236 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from library import autocomplete, counters, stats
+from library.bulk import create_returning_ids, insert_links
+from library.cache import response_cache
+from library.models import Book, Author, Tag
+from library.related import related_books
+from library.tag_index import tag_index
+
+# Model whose rows a batch of each type inserts, to tell committed batches.
+MODELS = {
+    'tags': Tag,
+    'authors': Author,
+    'books': Book,
+}
+
+# Fields every record of each type needs, with their type.
+FIELDS = {
+    'tags': {'title': str},
+    'authors': {'name': str, 'year_of_birth': int},
+    'books': {'title': str, 'pages': int},
+}
+
+# Tables whose secondary indexes are dropped by --rebuild-indexes.
+TABLES = {
+    'tags': [Tag._meta.db_table],
+    'authors': [Author._meta.db_table],
+    'books': [Book._meta.db_table, Book.tags.through._meta.db_table, Author.books.through._meta.db_table],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk loads tags, authors or books from CSV or NDJSON files. '
+        'Book records may list tag titles and author names ("|" separated in CSV); '
+        'missing tags are created, unknown authors are reported and skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=sorted(TABLES), required=True)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording progress; an existing one resumes the load. Assumes no other writer adds '
+                 'rows of the loaded type meanwhile.',
+        )
+        parser.add_argument(
+            '--rebuild-indexes', action='store_true',
+            help='Drop secondary indexes before the load and recreate them afterwards (Postgres only).',
+        )
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.type = options['type']
+        records = self.read(options['path'], options['format'])
+
+        done = self.load_checkpoint(options['checkpoint'], options['path'], self.get_last_id())
+        if done:
+            self.stdout.write(f'Resuming after {done} records')
+            records = islice(records, done, None)
+
+        indexes = self.drop_indexes() if options['rebuild_indexes'] else []
+        loaded = 0
+        try:
+            self.tags = dict(Tag.objects.using(self.using).values_list('title', 'id'))
+            self.authors = {}
+            for name, author_id in Author.objects.using(self.using).order_by('id').values_list('name', 'id'):
+                self.authors.setdefault(name, author_id)
+            self.skipped = 0
+            started = time.monotonic()
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                # A crash between the commit and the next save leaves the
+                # batch pending; resuming counts it as loaded when rows were
+                # added after ``last_id``.
+                self.save_checkpoint(
+                    options['checkpoint'], options['path'], done + loaded,
+                    pending=done + loaded + len(batch), last_id=self.get_last_id(),
+                )
+                with transaction.atomic(using=self.using):
+                    getattr(self, f'load_{self.type}')(batch)
+                loaded += len(batch)
+                self.save_checkpoint(options['checkpoint'], options['path'], done + loaded)
+                rate = loaded / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'{done + loaded} records, {rate:.0f} rows/s')
+        finally:
+            self.create_indexes(indexes)
+            if loaded:
+                # bulk_create and COPY bypass the model signals.
+                response_cache.invalidate_all(using=self.using)
+                tag_index.invalidate()
+                related_books.mark_stale()
+        # Rebuilt once the load completes; a failed one leaves them to the
+        # resumed run.
+        counters.reconcile(using=self.using)
+        stats.rebuild(using=self.using)
+        autocomplete.build(using=self.using)
+
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        if self.skipped:
+            self.stderr.write(f'Skipped {self.skipped} unknown authors')
+        if related_books.get_model() is not None:
+            self.stdout.write('Related books are computed on the fly until build_related runs')
+        self.stdout.write(self.style.SUCCESS(f'Imported {loaded} {self.type}'))
+
+    def read(self, path, file_format):
+        file_format = file_format or ('csv' if path.endswith('.csv') else 'ndjson')
+        with open(path, encoding='utf-8', newline='') as f:
+            if file_format == 'csv':
+                reader = csv.DictReader(f)
+                for row in reader:
+                    for key in ('tags', 'authors'):
+                        if key in row:
+                            row[key] = [value for value in row[key].split('|') if value]
+                    yield self.clean(row, reader.line_num)
+            else:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        raise CommandError(f'line {number}: invalid JSON: {e}')
+                    yield self.clean(row, number)
+
+    def clean(self, row, number):
+        """
+        Checks the fields of a record read from line ``number`` and converts
+        the integer ones.
+        """
+        if not isinstance(row, dict):
+            raise CommandError(f'line {number}: expected an object')
+        for field, kind in FIELDS[self.type].items():
+            value = row.get(field)
+            if value is None or value == '':
+                raise CommandError(f'line {number}: {field} is required')
+            if kind is int:
+                try:
+                    row[field] = int(value)
+                except (TypeError, ValueError):
+                    raise CommandError(f'line {number}: {field} must be an integer, got {value!r}')
+        return row
+
+    def load_tags(self, batch):
+        tags = [Tag(title=row['title'], description=row.get('description') or '') for row in batch]
+        for tag in create_returning_ids(Tag, tags, using=self.using):
+            self.tags.setdefault(tag.title, tag.id)
+
+    def load_authors(self, batch):
+        authors = [Author(name=row['name'], year_of_birth=row['year_of_birth']) for row in batch]
+        for author in create_returning_ids(Author, authors, using=self.using):
+            self.authors.setdefault(author.name, author.id)
+
+    def load_books(self, batch):
+        missing = {title for row in batch for title in row.get('tags') or () if title not in self.tags}
+        if missing:
+            self.load_tags([{'title': title} for title in sorted(missing)])
+
+        books = create_returning_ids(
+            Book, [Book(title=row['title'], pages=row['pages']) for row in batch], using=self.using,
+        )
+        tag_links, author_links = [], []
+        for book, row in zip(books, batch):
+            tag_links.extend((book.id, self.tags[title]) for title in row.get('tags') or ())
+            for name in row.get('authors') or ():
+                if name in self.authors:
+                    author_links.append((self.authors[name], book.id))
+                else:
+                    self.skipped += 1
+        insert_links(Book.tags.through, 'book', 'tag', tag_links, using=self.using)
+        insert_links(Author.books.through, 'author', 'book', author_links, using=self.using)
+
+    def get_last_id(self):
+        return MODELS[self.type].objects.using(self.using).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    @staticmethod
+    def load_checkpoint(checkpoint, path, last_id):
+        """
+        Returns the number of records already loaded, counting a pending
+        batch when its rows exist.
+        """
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as f:
+            state = json.load(f)
+        if state['path'] != os.path.abspath(path):
+            raise CommandError(f'{checkpoint} belongs to {state["path"]}')
+        if 'pending' in state and last_id > state['last_id']:
+            return state['pending']
+        return state['records']
+
+    @staticmethod
+    def save_checkpoint(checkpoint, path, records, **pending):
+        if not checkpoint:
+            return
+        with open(f'{checkpoint}.tmp', 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'records': records, **pending}, f)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
+
+    def drop_indexes(self):
+        connection = connections[self.using]
+        if connection.vendor != 'postgresql':
+            self.stderr.write('--rebuild-indexes is only supported on Postgres, ignoring')
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = ANY(%s) '
+                'AND indexname NOT IN (SELECT conname FROM pg_constraint)',
+                [TABLES[self.type]],
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX {name}')
+        self.stdout.write(f'Dropped {len(indexes)} indexes')
+        return indexes
+
+    def create_indexes(self, indexes):
+        if not indexes:
+            return
+        with connections[self.using].cursor() as cursor:
+            for name, definition in indexes:
+                self.stdout.write(f'Creating {name}')
+                cursor.execute(definition)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from library import changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the change feed tombstones older than LIBRARY_CHANGES["TOMBSTONE_DAYS"]; '
+        'clients with an older cursor must sync again from the start.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        deleted = changes.prune_tombstones(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library import stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the book pages and author decade summary tables served at /stats/ from the catalog '
+        'and fixes the rows that drifted (see library/stats.py). Run it after migrating and after '
+        'changing LIBRARY_STATS["BUCKETS"].'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the wrong rows.')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a row was wrong.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        report = stats.rebuild(using=options['database'], fix=not options['dry_run'], batch_size=options['batch_size'])
+        for name, wrong in report.items():
+            self.stdout.write(f'{name}: {wrong} wrong')
+        drifted = sum(report.values())
+        if drifted and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {drifted} rows'))
+        if drifted and options['fail']:
+            raise CommandError(f'{drifted} rows were wrong')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library import counters
+from library.cache import response_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Recounts the book, tag and author counters from the link tables and '
+        'fixes the ones that drifted (see library/counters.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the wrong counters.')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a counter was wrong.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        report = counters.reconcile(
+            using=options['database'], fix=not options['dry_run'], batch_size=options['batch_size'],
+        )
+        for name, wrong in report.items():
+            self.stdout.write(f'{name}: {wrong} wrong')
+        drifted = sum(report.values())
+        if drifted and not options['dry_run']:
+            # bulk_update bypasses the model signals.
+            response_cache.invalidate_all(using=options['database'])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {drifted} counters'))
+        if drifted and options['fail']:
+            raise CommandError(f'{drifted} counters were wrong')
@@ -0,0 +1,111 @@
+import random
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from library import autocomplete, counters, stats
+from library.benchmark import WORDS
+from library.bulk import create_returning_ids, insert_links
+from library.cache import response_cache
+from library.models import Book, Author, Tag
+from library.related import related_books
+from library.tag_index import tag_index
+
+
+def zipf_weights(size, skew):
+    """
+    Cumulative weights of a Zipf distribution over ``size`` ranks.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic catalog for load tests: tags and authors, then books linked to a '
+        'Zipf-distributed number of popular tags and authors, written with bulk inserts. '
+        'The same --seed on an empty database always produces the same catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--tags-per-book', type=float, default=3, help='Mean number of tags per book.')
+        parser.add_argument('--authors-per-book', type=float, default=1.2, help='Mean number of authors per book.')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of tag and author popularity.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if options['tags'] < 1 or options['authors'] < 1:
+            raise CommandError('--tags and --authors must be positive')
+        self.using = options['database']
+        self.rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        try:
+            with transaction.atomic(using=self.using):
+                tags = create_returning_ids(
+                    Tag, [Tag(title=f'Tag {i}', description=self.words(4)) for i in range(options['tags'])],
+                    using=self.using, batch_size=batch_size,
+                )
+                authors = create_returning_ids(
+                    Author,
+                    [Author(name=f'Author {i}', year_of_birth=self.rng.randint(1800, 2000))
+                     for i in range(options['authors'])],
+                    using=self.using, batch_size=batch_size,
+                )
+            self.tag_ids = [tag.id for tag in tags]
+            self.author_ids = [author.id for author in authors]
+            self.tag_weights = zipf_weights(len(tags), options['skew'])
+            self.author_weights = zipf_weights(len(authors), options['skew'])
+
+            started = time.monotonic()
+            created = 0
+            while created < options['books']:
+                size = min(batch_size, options['books'] - created)
+                with transaction.atomic(using=self.using):
+                    self.create_books(size, options['tags_per_book'], options['authors_per_book'])
+                created += size
+                rate = created / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f'{created} books, {rate:.0f} rows/s')
+        finally:
+            # bulk_create bypasses the model signals.
+            response_cache.invalidate_all(using=self.using)
+            tag_index.invalidate()
+            related_books.mark_stale()
+        counters.reconcile(using=self.using)
+        stats.rebuild(using=self.using)
+        autocomplete.build(using=self.using)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(tags)} tags, {len(authors)} authors and {created} books'
+        ))
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def fan_out(self, mean):
+        """
+        Number of links of one book, uniform between zero and twice ``mean``.
+        """
+        return round(self.rng.uniform(0, 2 * mean))
+
+    def create_books(self, size, tags_per_book, authors_per_book):
+        books = create_returning_ids(
+            Book,
+            [Book(title=self.words(self.rng.randint(1, 4)).capitalize(), pages=self.rng.randint(20, 1500))
+             for _ in range(size)],
+            using=self.using,
+        )
+        tag_links, author_links = [], []
+        for book in books:
+            tags = self.rng.choices(self.tag_ids, cum_weights=self.tag_weights, k=self.fan_out(tags_per_book))
+            tag_links.extend((book.id, tag_id) for tag_id in set(tags))
+            authors = self.rng.choices(
+                self.author_ids, cum_weights=self.author_weights, k=max(1, self.fan_out(authors_per_book)),
+            )
+            author_links.extend((author_id, book.id) for author_id in set(authors))
+        insert_links(Book.tags.through, 'book', 'tag', tag_links, using=self.using)
+        insert_links(Author.books.through, 'author', 'book', author_links, using=self.using)
@@ -0,0 +1,210 @@
+"""
+Request metrics exposed in the Prometheus text format at ``/metrics``.
+
+``library.middleware.MetricsMiddleware`` records, per URL name and method,
+the request latency, the number and time of SQL queries, the time spent
+building ``serializer.data`` and rendering the response and its size.
+Metrics live in process memory, so every worker is scraped on its own, the
+way Prometheus client libraries work without a multiprocess collector.
+``/metrics`` only answers clients in ``ALLOWED_IPS``.
+"""
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from library.authentication import token_cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'QUERY_BUCKETS': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    # Requests slower than this many seconds are logged with their SQL.
+    'SLOW_REQUEST_SECONDS': None,
+    'SLOW_REQUEST_MAX_QUERIES': 50,
+    # Addresses or networks allowed to scrape /metrics, None for everyone.
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield format_value(bound), cumulative
+        yield '+Inf', self.count
+
+
+class EndpointMetrics:
+    def __init__(self, options):
+        self.latency = Histogram(options['LATENCY_BUCKETS'])
+        self.queries = Histogram(options['QUERY_BUCKETS'])
+        self.serialize = Histogram(options['LATENCY_BUCKETS'])
+        self.query_seconds = 0
+        self.render_seconds = 0
+        self.response_bytes = 0
+        self.statuses = {}
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper()`` callable counting and timing the queries
+    of a request, and keeping their SQL when ``capture`` is set. Shared by
+    the worker threads of the request, see ``library.concurrency``.
+    """
+
+    def __init__(self, capture=0):
+        self._lock = threading.Lock()
+        self.capture = capture
+        self.count = 0
+        self.seconds = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.count += 1
+                self.seconds += duration
+                if len(self.statements) < self.capture:
+                    self.statements.append((duration, sql, params))
+
+
+def add_serialize_seconds(request, seconds):
+    """
+    Adds ``seconds`` spent building ``serializer.data`` to the metrics of
+    ``request``, a Django or DRF request.
+    """
+    request = getattr(request, '_request', request)
+    if request is not None and hasattr(request, '_metrics_serialize_seconds'):
+        request._metrics_serialize_seconds = (request._metrics_serialize_seconds or 0) + seconds
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        escaped.append(f'{name}="{value}"')
+    return '{%s}' % ','.join(escaped)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'LIBRARY_METRICS', {})}
+
+    def clear(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def observe(self, view, method, status, duration, queries, render_seconds, response_bytes,
+                serialize_seconds=None):
+        with self._lock:
+            endpoint = self._endpoints.get((view, method))
+            if endpoint is None:
+                endpoint = self._endpoints[(view, method)] = EndpointMetrics(self.options)
+            endpoint.latency.observe(duration)
+            endpoint.queries.observe(queries.count)
+            if serialize_seconds is not None:
+                endpoint.serialize.observe(serialize_seconds)
+            endpoint.query_seconds += queries.seconds
+            endpoint.render_seconds += render_seconds
+            endpoint.response_bytes += response_bytes
+            endpoint.statuses[status] = endpoint.statuses.get(status, 0) + 1
+
+    def render(self):
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{name}{suffix}{format_labels(labels)} {format_value(value)}')
+
+        def histogram(name, help_text, attr):
+            samples = []
+            for labels, endpoint in endpoints:
+                values = getattr(endpoint, attr)
+                samples.extend(('_bucket', labels + [('le', le)], count) for le, count in values.samples())
+                samples.append(('_sum', labels, values.sum))
+                samples.append(('_count', labels, values.count))
+            family(name, 'histogram', help_text, samples)
+
+        def counter(name, help_text, attr):
+            family(name, 'counter', help_text, [('', labels, getattr(endpoint, attr)) for labels, endpoint in endpoints])
+
+        with self._lock:
+            endpoints = [
+                ([('view', view), ('method', method)], endpoint)
+                for (view, method), endpoint in sorted(self._endpoints.items())
+            ]
+            family('library_requests_total', 'counter', 'Requests by view, method and status code.', [
+                ('', labels + [('status', status)], count)
+                for labels, endpoint in endpoints
+                for status, count in sorted(endpoint.statuses.items())
+            ])
+            histogram('library_request_duration_seconds', 'Request latency.', 'latency')
+            histogram('library_request_queries', 'SQL queries per request.', 'queries')
+            histogram('library_request_serialize_seconds', 'Time spent building serializer data.', 'serialize')
+            counter('library_request_query_seconds_total', 'Time spent in SQL queries.', 'query_seconds')
+            counter('library_request_render_seconds_total', 'Time spent rendering responses.', 'render_seconds')
+            counter('library_response_bytes_total', 'Size of the response bodies.', 'response_bytes')
+
+        stats = token_cache.stats()
+        family('library_token_cache_lookups_total', 'counter', 'Access token cache lookups.', [
+            ('', [('result', 'hit')], stats['hits']),
+            ('', [('result', 'miss')], stats['misses']),
+        ])
+        family('library_token_cache_evictions_total', 'counter', 'Access tokens evicted by the LRU bound.', [
+            ('', [], stats['evictions']),
+        ])
+        family('library_token_cache_entries', 'gauge', 'Access tokens cached in this process.', [
+            ('', [], stats['entries']),
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def is_allowed(request):
+    allowed = metrics.options['ALLOWED_IPS']
+    if allowed is None:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in allowed)
+
+
+def metrics_view(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from library import compression
+from library.concurrency import query_recorder
+from library.db_routers import get_options, read_alias, replica_pool
+from library.metrics import QueryRecorder, metrics
+
+logger = logging.getLogger('library.metrics')
+
+
+class AsyncCapableMiddleware:
+    """
+    Middleware running natively in both modes: under ASGI ``__call__``
+    returns the coroutine of ``__acall__``, so the chain is not pushed onto
+    the shared sync thread.
+
+    Subclasses define ``handle(request)``, called under WSGI, and the
+    coroutine ``__acall__(request)``, awaited under ASGI; both return the
+    response of ``get_response``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marks instances as coroutine functions for Django.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Records latency, SQL queries, serialize and render time and response
+    size of every request in ``library.metrics.metrics``. Should come first
+    in ``MIDDLEWARE`` so the other middleware is included in the latency.
+    Queries run while a streaming response is consumed are not counted, nor
+    under ASGI those of views not wrapped by ``library.asyncviews``.
+    """
+
+    def start(self, request):
+        options = metrics.options
+        if not options['ENABLED']:
+            return None
+        slow = options['SLOW_REQUEST_SECONDS']
+        request._metrics_render_seconds = 0
+        request._metrics_serialize_seconds = None
+        return QueryRecorder(capture=options['SLOW_REQUEST_MAX_QUERIES'] if slow is not None else 0)
+
+    def handle(self, request):
+        queries = self.start(request)
+        if queries is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        token = query_recorder.set(queries)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            query_recorder.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, queries)
+
+    async def __acall__(self, request):
+        queries = self.start(request)
+        if queries is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        # Worker threads install the recorder on their own connections.
+        token = query_recorder.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            query_recorder.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, queries)
+
+    def finish(self, request, response, duration, queries):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        if view == 'metrics':
+            return response
+        size = 0 if response.streaming else len(response.content)
+        metrics.observe(
+            view, request.method, response.status_code, duration, queries,
+            request._metrics_render_seconds, size, request._metrics_serialize_seconds,
+        )
+        slow = metrics.options['SLOW_REQUEST_SECONDS']
+        if slow is not None and duration >= slow:
+            self.log_slow_request(request, response, duration, queries)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns, unless
+        # library.asyncviews rendered and timed them already.
+        if response.is_rendered:
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._metrics_render_seconds = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def log_slow_request(request, response, duration, queries):
+        statements = '\n'.join(
+            f'  {seconds * 1000:.1f}ms {sql} {params!r}' for seconds, sql, params in queries.statements
+        )
+        logger.warning(
+            'Slow request %s %s (%s): %.3fs, %d queries in %.3fs\n%s',
+            request.method, request.get_full_path(), response.status_code,
+            duration, queries.count, queries.seconds, statements,
+        )
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+    """
+    Sends the reads of safe requests to a replica (see
+    ``library.db_routers``) and pins clients that wrote to the primary.
+    """
+
+    def choose_alias(self, request):
+        options = get_options()
+        if options['ALIASES'] and request.method in SAFE_METHODS and options['COOKIE_NAME'] not in request.COOKIES:
+            return replica_pool.choose()
+        return None
+
+    def handle(self, request):
+        token = read_alias.set(self.choose_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        alias = None
+        if get_options()['ALIASES']:
+            # Health checks query the replicas, off the event loop.
+            alias = await sync_to_async(self.choose_alias, thread_sensitive=False)(request)
+        token = read_alias.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_alias.reset(token)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        options = get_options()
+        if options['ALIASES'] and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                options['COOKIE_NAME'], '1', max_age=options['STICKY_SECONDS'], httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class CompressionMiddleware(AsyncCapableMiddleware):
+    """
+    Compresses large API responses with brotli or gzip, see
+    ``library.compression``. Should come right after ``MetricsMiddleware``
+    so the recorded size is the one sent. Only compressed responses have
+    their strong ``ETag`` made weak; the others keep it as it is.
+    """
+
+    def get_encoding(self, request, response):
+        """
+        Returns the encoding to compress ``response`` with, or ``None``.
+        """
+        options = compression.get_options()
+        if not options['ENABLED'] or response.has_header('Content-Encoding'):
+            return None
+        if not compression.is_compressible(response.get('Content-Type', '')):
+            return None
+        if not response.streaming and len(response.content) < options['MIN_SIZE']:
+            return None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return compression.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+
+    def compress(self, response, encoding):
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            response.content = compression.compress(response.content, encoding)
+            response['Content-Length'] = str(len(response.content))
+        # The body differs from the uncompressed one the ETag was computed on.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def handle(self, request):
+        response = self.get_response(request)
+        encoding = self.get_encoding(request, response)
+        return self.compress(response, encoding) if encoding else response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        encoding = self.get_encoding(request, response)
+        if encoding is None:
+            return response
+        if response.streaming:
+            return self.compress(response, encoding)
+        return await sync_to_async(self.compress, thread_sensitive=False)(response, encoding)
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from library import search
+
+
+def create_search_indexes(apps, schema_editor):
+    search.create_search_indexes(schema_editor)
+
+
+def drop_search_indexes(apps, schema_editor):
+    search.drop_search_indexes(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
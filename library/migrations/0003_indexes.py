@@ -0,0 +1,43 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_search_documents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['name', 'id'], name='author_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['year_of_birth'], name='author_year_of_birth_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['pages'], name='book_pages_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['title'], name='tag_title_idx'),
+        ),
+        # The unique constraints of the link tables only serve lookups from
+        # their first column.
+        migrations.RunSQL(
+            'CREATE INDEX library_book_tags_tag_id_book_id_idx ON library_book_tags (tag_id, book_id)',
+            'DROP INDEX library_book_tags_tag_id_book_id_idx',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX library_author_books_book_id_author_id_idx ON library_author_books (book_id, author_id)',
+            'DROP INDEX library_author_books_book_id_author_id_idx',
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+from library import search
+
+COUNTS = [
+    ('library_tag', 'book_count', 'library_book_tags', 'tag_id'),
+    ('library_book', 'tag_count', 'library_book_tags', 'book_id'),
+    ('library_author', 'book_count', 'library_author_books', 'author_id'),
+    ('library_book', 'author_count', 'library_author_books', 'book_id'),
+]
+
+
+def create_sqlite_triggers(apps, schema_editor):
+    # Adding or removing columns rebuilds the book and author tables on SQLite.
+    search.create_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_indexes'),
+    ]
+
+    operations = [
+        # Undone last, after removing the columns rebuilt the tables again.
+        migrations.RunPython(migrations.RunPython.noop, create_sqlite_triggers),
+        migrations.AddField(
+            model_name='author',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='author_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='tag_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['book_count', 'id'], name='author_book_count_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['tag_count', 'id'], name='book_tag_count_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author_count', 'id'], name='book_author_count_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['book_count', 'id'], name='tag_book_count_id_idx'),
+        ),
+        migrations.RunPython(create_sqlite_triggers, migrations.RunPython.noop),
+    ] + [
+        migrations.RunSQL(
+            f'UPDATE {table} SET {field} = (SELECT COUNT(*) FROM {through} WHERE {column} = {table}.id)',
+            migrations.RunSQL.noop,
+        )
+        for table, field, through, column in COUNTS
+    ]
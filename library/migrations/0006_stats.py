@@ -0,0 +1,36 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0005_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DecadeStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decade', models.IntegerField(unique=True)),
+                ('author_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PagesStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=10)),
+                ('object_id', models.IntegerField(default=0)),
+                ('bucket', models.IntegerField()),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('pages_sum', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pagesstat',
+            constraint=models.UniqueConstraint(fields=('scope', 'object_id', 'bucket'), name='pagesstat_scope_object_bucket_uniq'),
+        ),
+    ]
@@ -0,0 +1,340 @@
+import time
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.request import clone_request
+from rest_framework.response import Response
+
+from library import export, facets, values
+from library.cache import cache_response
+from library.metrics import add_serialize_seconds
+from library.renderers import CSVRenderer, NDJSONRenderer
+
+
+def get_list_view(request, viewset):
+    """
+    Returns an instance of ``viewset`` answering ``request`` as a ``list``,
+    to authorize and serialize a read of its objects from another view.
+    """
+    request = clone_request(request, 'GET')
+    return viewset(request=request, args=(), kwargs={}, format_kwarg=None, action='list')
+
+
+def check_list_permissions(request, viewset):
+    view = get_list_view(request, viewset)
+    view.check_permissions(view.request)
+
+
+def has_list_permission(request, viewset):
+    view = get_list_view(request, viewset)
+    return all(permission.has_permission(view.request, view) for permission in view.get_permissions())
+
+
+class ExpandMixin:
+    """
+    Embeds related objects inline with ``?expand=tags,authors`` and limits
+    the representation to ``?fields=id,title``.
+
+    ``prefetch`` is always applied to the queryset and ``expand_prefetch``
+    maps every expandable name to the lookups it needs, so a page costs a
+    fixed number of queries regardless of its size. Expanding a name
+    requires the permissions of its viewset (``get_expand_viewsets()``).
+    """
+    expand_query_param = 'expand'
+    fields_query_param = 'fields'
+    prefetch = ()
+    expand_prefetch = {}
+
+    def get_query_names(self, param):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return []
+        names = []
+        for name in request.query_params.get(param, '').split(','):
+            name = name.strip()
+            if name and name not in names:
+                names.append(name)
+        return names
+
+    def get_expand(self):
+        return [name for name in self.get_query_names(self.expand_query_param) if name in self.expand_prefetch]
+
+    def get_expand_viewsets(self):
+        return {}
+
+    def check_permissions(self, request):
+        super().check_permissions(request)
+        viewsets = self.get_expand_viewsets()
+        for name in self.get_expand():
+            if name in viewsets:
+                check_list_permissions(request, viewsets[name])
+
+    def get_sparse_fields(self):
+        return self.get_query_names(self.fields_query_param)
+
+    def get_queryset(self):
+        lookups = list(self.prefetch)
+        for name in self.get_expand():
+            lookups.extend(lookup for lookup in self.expand_prefetch[name] if lookup not in lookups)
+        return super().get_queryset().prefetch_related(*lookups)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        context['fields'] = self.get_sparse_fields()
+        return context
+
+
+class NestedMixin:
+    """
+    Scopes a viewset registered under a nested router to its parent object.
+    ``parent_lookups`` maps the URL kwarg of every parent to the lookup that
+    filters the queryset by it, e.g. ``{'tag_pk': 'tags'}``.
+    """
+    parent_lookups = {}
+
+    def get_parent_filter(self):
+        parent_filter = {}
+        for kwarg, lookup in self.parent_lookups.items():
+            if kwarg in self.kwargs:
+                value = self.kwargs[kwarg]
+                if not str(value).isdigit():
+                    raise NotFound()
+                parent_filter[lookup] = int(value)
+        return parent_filter
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**self.get_parent_filter())
+
+    def list_nested(self, viewset, kwarg):
+        """
+        Answers a detail ``@action`` with the ``list`` of ``viewset`` scoped to
+        this object, so it is filtered, searched and paginated the same way as
+        the nested route.
+        """
+        if self.get_parent_filter():
+            # The object is itself nested, check it belongs to its parent.
+            self.get_object()
+        view = viewset.as_view({'get': 'list'}, detail=False)
+        return view(self.request._request, **{kwarg: self.kwargs[self.lookup_url_kwarg or self.lookup_field]})
+
+
+class ValuesListMixin:
+    """
+    Serves ``list`` from ``QuerySet.values()`` rows when the serializer only
+    has plain columns and M2M primary keys (see ``library.values``), and
+    from model instances otherwise.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = values.get_plan(self.get_serializer())
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = [field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)]
+        rows = plan.get_queryset(queryset, ordering or queryset.model._meta.ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.represent(plan, page, queryset.db))
+        return Response(self.represent(plan, rows, queryset.db))
+
+    def represent(self, plan, rows, using):
+        # Timed like serializer.data, see library.serializers.TimedDataMixin.
+        started = time.perf_counter()
+        try:
+            return plan.represent(rows, using)
+        finally:
+            add_serialize_seconds(self.request, time.perf_counter() - started)
+
+
+class FacetMixin:
+    """
+    Adds the number of matching books per tag and per author to the list
+    response with ``?facets=tags,authors``, the ``?facet_limit=`` most
+    frequent values of each (see ``library.facets``). Counting a facet
+    requires the permissions of its viewset (``get_facet_viewsets()``).
+    """
+    facets_query_param = 'facets'
+    facet_limit_query_param = 'facet_limit'
+    facet_limit = 10
+    facet_max_limit = 100
+
+    def get_facets(self):
+        value = self.request.query_params.get(self.facets_query_param, '')
+        names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+        unknown = [name for name in names if name not in facets.FACETS]
+        if unknown:
+            raise ValidationError({self.facets_query_param: [f'Unknown facet "{name}".' for name in unknown]})
+        return names
+
+    def get_facet_viewsets(self):
+        return {}
+
+    def check_permissions(self, request):
+        super().check_permissions(request)
+        viewsets = self.get_facet_viewsets()
+        for name in self.get_facets():
+            if name in viewsets:
+                check_list_permissions(request, viewsets[name])
+
+    def get_facet_limit(self):
+        value = self.request.query_params.get(self.facet_limit_query_param, self.facet_limit)
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({self.facet_limit_query_param: ['A valid integer is required.']})
+        if not 1 <= limit <= self.facet_max_limit:
+            raise ValidationError({
+                self.facet_limit_query_param: [f'Expected a number from 1 to {self.facet_max_limit}.'],
+            })
+        return limit
+
+    def add_facets(self, response, queryset, bitmap=None):
+        names = self.get_facets()
+        if names and isinstance(response.data, dict):
+            # An estimated count cannot bound the SQL path, get_facets probes then.
+            exact = getattr(self.paginator, 'count_exact', True)
+            response.data['facets'] = facets.get_facets(
+                names, queryset, self.get_facet_limit(), bitmap=bitmap, whole_catalog=not queryset.query.where,
+                count=response.data.get('count') if exact else None,
+            )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        return self.add_facets(response, self.filter_queryset(self.get_queryset()))
+
+
+class CacheResponseMixin:
+    """
+    Serves ``list`` and ``retrieve`` from the response cache; actions opt in
+    with ``@cache_response``. ``cache_models`` names the models and link
+    tables every response reads, ``cache_action_models``,
+    ``cache_expand_models``, ``cache_parent_models`` and ``cache_facet_models``
+    add the ones read by an action, an expansion, the scoping to a parent URL
+    kwarg or a facet.
+    """
+    cache_models = ()
+    cache_action_models = {}
+    cache_expand_models = {}
+    cache_parent_models = {}
+    cache_facet_models = {}
+
+    def get_cache_models(self):
+        labels = set(self.cache_models)
+        labels.update(self.cache_action_models.get(self.action, ()))
+        for kwarg, models in self.cache_parent_models.items():
+            if kwarg in self.kwargs:
+                labels.update(models)
+        expand = self.get_expand() if hasattr(self, 'get_expand') else ()
+        for name in expand:
+            labels.update(self.cache_expand_models.get(name, ()))
+        for name in self.get_facets() if hasattr(self, 'get_facets') else ():
+            labels.update(self.cache_facet_models.get(name, ()))
+        return labels
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class ExportMixin:
+    """
+    Adds ``/export/``, streaming the filtered queryset as NDJSON (default)
+    or CSV, chosen by ``Accept`` or ``?format=ndjson|csv``.
+    """
+    export_chunk_size = 2000
+
+    @action(detail=False, methods=['GET'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        queryset = self.filter_queryset(self.get_queryset())
+        stream = export.STREAMS[renderer.format](queryset, self.export_chunk_size)
+        response = StreamingHttpResponse(stream, content_type=f'{renderer.media_type}; charset=utf-8')
+        filename = f'{queryset.model._meta.model_name}s.{renderer.format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class BulkMixin:
+    """
+    Accepts a list of objects on ``POST``, a list of partial objects with
+    their ``id`` on ``PATCH`` and a list of ids on ``DELETE`` to the list
+    endpoint (routed by ``library.routers.BulkRouter``). Every item is
+    validated before anything is written and the whole batch is applied in
+    one transaction; errors are reported per item, in request order.
+    """
+    bulk_max_items = 1000
+
+    def get_bulk_data(self, request):
+        data = request.data
+        if not isinstance(data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [f'Expected at most {self.bulk_max_items} items.']})
+        return data
+
+    def get_bulk_instances(self, ids):
+        """
+        Returns the instances for ``ids`` in the same order, raising per item
+        errors for ids that are missing, repeated or not found.
+        """
+        valid_ids = [pk for pk in ids if isinstance(pk, int) and not isinstance(pk, bool)]
+        instances = self.filter_queryset(self.get_queryset()).in_bulk(valid_ids)
+        errors, seen = [], set()
+        for pk in ids:
+            if pk not in valid_ids:
+                errors.append({'id': ['A valid integer is required.']})
+            elif pk in seen:
+                errors.append({'id': ['Duplicate id.']})
+            elif pk not in instances:
+                errors.append({'id': ['Not found.']})
+            else:
+                errors.append({})
+            seen.add(pk)
+        if any(errors):
+            raise ValidationError(errors)
+        return [instances[pk] for pk in ids]
+
+    def prefetch_bulk(self, instances):
+        prefetch_related_objects(instances, *getattr(self, 'prefetch', ()))
+        return instances
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=self.get_bulk_data(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.prefetch_bulk(serializer.save())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def bulk_update(self, request, *args, **kwargs):
+        data = self.get_bulk_data(request)
+        ids = [item.get('id') if isinstance(item, dict) else None for item in data]
+        instances = self.get_bulk_instances(ids)
+        serializer = self.get_serializer(instances, data=data, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        # Drop the relations cached before the update.
+        for instance in instances:
+            instance._prefetched_objects_cache = {}
+        self.prefetch_bulk(instances)
+        return Response(serializer.data)
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        instances = self.get_bulk_instances(self.get_bulk_data(request))
+        with transaction.atomic():
+            # QuerySet.delete() still sends pre_delete and post_delete per object.
+            self.get_queryset().model.objects.filter(pk__in=[instance.pk for instance in instances]).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,46 +1,179 @@
 from django.db import models
+from django.utils import timezone
+
+from library.concurrency import ConcurrentPrefetchQuerySet
 
 
 # Create your models here.
 
 
-class Tag(models.Model):
+class CountedModel(models.Model):
+    """
+    Saving an existing object leaves the link counters maintained by
+    ``library.counters`` alone, the copy in memory may be stale.
+
+    The loaded values of ``stats_fields`` are kept in ``_stored`` for the
+    summary tables of ``library.stats``.
+    """
+    counter_fields = ()
+    stats_fields = ()
+
+    objects = ConcurrentPrefetchQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored = {name: instance.__dict__[name] for name in cls.stats_fields if name in instance.__dict__}
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
+
+
+class Tag(CountedModel):
     title = models.CharField(max_length=150)
     description = models.CharField(max_length=500, blank=True)
+    # Maintained from signals, see library/counters.py.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    counter_fields = ('book_count',)
 
     def __str__(self):
         return f'{self.id} {self.title}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['title'], name='tag_title_idx'),
+            models.Index(fields=['book_count', 'id'], name='tag_book_count_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='tag_updated_at_id_idx'),
+        ]
 
-class Book(models.Model):
+
+class Book(CountedModel):
     title = models.CharField(max_length=150)
     pages = models.IntegerField(blank=True)
     # authors = models.ManyToManyField(Author)
     tags = models.ManyToManyField(Tag, blank=True)
+    # Maintained from signals, see library/counters.py.
+    tag_count = models.PositiveIntegerField(default=0, editable=False)
+    author_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    counter_fields = ('tag_count', 'author_count')
+    stats_fields = ('pages',)
 
     def display_tags(self):
         """
         Creates a string for the Tags. This is required to display genre in Admin.
+        Uses the prefetched tags when there are any, so a list costs no extra query.
         """
         return ', '.join([tag.title for tag in self.tags.all()[:3]])
 
     display_tags.short_description = 'Tags'
 
+    def has_prefetched_tags(self):
+        return 'tags' in getattr(self, '_prefetched_objects_cache', {})
+
     def __str__(self):
-        return f'{self.id} {self.title} , {self.display_tags()}'
+        # Select options and admin log entries must not query the tags.
+        if self.has_prefetched_tags():
+            return f'{self.id} {self.title} , {self.display_tags()}'
+        return f'{self.id} {self.title}'
 
     class Meta:
         ordering = ('title',)
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            models.Index(fields=['pages'], name='book_pages_idx'),
+            models.Index(fields=['tag_count', 'id'], name='book_tag_count_id_idx'),
+            models.Index(fields=['author_count', 'id'], name='book_author_count_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='book_updated_at_id_idx'),
+        ]
 
 
-class Author(models.Model):
+class Author(CountedModel):
     name = models.CharField(max_length=100)
     year_of_birth = models.IntegerField(blank=True)
     books = models.ManyToManyField(Book, blank=True)
+    # Maintained from signals, see library/counters.py.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    counter_fields = ('book_count',)
+    stats_fields = ('year_of_birth',)
 
     def __str__(self):
         return f'{self.id} {self.name}'
 
     class Meta:
         ordering = ('name',)
+        indexes = [
+            models.Index(fields=['name', 'id'], name='author_name_id_idx'),
+            models.Index(fields=['year_of_birth'], name='author_year_of_birth_idx'),
+            models.Index(fields=['book_count', 'id'], name='author_book_count_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='author_updated_at_id_idx'),
+        ]
+
+
+class Tombstone(models.Model):
+    """
+    Records a deleted book, author or tag for the change feed.
+    """
+    model = models.CharField(max_length=20)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.model} {self.object_id}'
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_at_id_idx'),
+        ]
+
+
+class PagesStat(models.Model):
+    """
+    Number of books and their total pages in one ``Book.pages`` bucket, for
+    the whole catalog (``scope='all'``, ``object_id=0``), an author or a tag.
+    Maintained from signals, see library/stats.py.
+    """
+    scope = models.CharField(max_length=10)
+    object_id = models.IntegerField(default=0)
+    # Lower edge of the bucket.
+    bucket = models.IntegerField()
+    book_count = models.PositiveIntegerField(default=0)
+    pages_sum = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.scope} {self.object_id} {self.bucket}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'object_id', 'bucket'], name='pagesstat_scope_object_bucket_uniq'),
+        ]
+
+
+class DecadeStat(models.Model):
+    """
+    Number of authors born in a decade. Maintained from signals, see
+    library/stats.py.
+    """
+    decade = models.IntegerField(unique=True)
+    author_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.decade}s'
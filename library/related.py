@@ -0,0 +1,382 @@
+"""
+"Related books" from a precomputed tag and author co-occurrence model.
+
+``build_related`` turns the catalog into a sparse book x feature matrix
+(one column per tag and per author, weighted by IDF and
+``AUTHOR_WEIGHT``, rows L2 normalized) and stores the ``K`` most cosine
+similar books of every book as ``.npy`` files under
+``LIBRARY_RELATED['PATH']``. Neighbours are stored back to back with an
+offset per book, so the files hold at most ``K`` ids and scores per book
+and nothing for books without any. Processes memory-map the files, so a
+lookup is a binary search and a slice.
+
+Books whose ``updated_at`` is later than the build, which saves and link
+changes bump (see ``library.counters``), and books added since are scored
+on the fly against the stored feature matrix from their current links.
+Loads that bypass signals mark the whole model stale with a file next to
+it, which scores every book on the fly until the next build. Both survive
+restarts and cache evictions. Without a built model the endpoint falls
+back to counting shared tags and authors in SQL.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router
+from django.db.models import Count
+from scipy import sparse
+
+from library.cache import response_cache
+from library.models import Book, Author, Tag
+
+DEFAULTS = {
+    'PATH': os.path.join(settings.BASE_DIR, 'var', 'related'),
+    'CACHE_ALIAS': 'default',
+    'K': 50,
+    'AUTHOR_WEIGHT': 2.0,
+    # Features of more books than this are dropped, they say little about
+    # similarity and make the product dense.
+    'MAX_FEATURE_BOOKS': 5000,
+    'BLOCK_SIZE': 500,
+    # Changes are timestamped before they commit: books changed this long
+    # before the build started are scored on the fly too.
+    'LAG_SECONDS': 5,
+}
+
+ARRAYS = (
+    'book_ids', 'tag_ids', 'author_ids', 'weights', 'offsets', 'neighbours', 'scores', 'data', 'indices', 'indptr',
+)
+
+# Version of the stored layout; models of another one are ignored until rebuilt.
+FORMAT = 2
+
+# Marks the stored model stale, removed by the next build.
+STALE_FILE = 'stale'
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_RELATED', {})}
+
+
+def top_k(candidates, scores, k):
+    """
+    Returns the ``k`` best ``(candidates, scores)``, by descending score and
+    ascending candidate.
+    """
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[keep], scores[keep]
+    order = np.lexsort((candidates, -scores))
+    return candidates[order], scores[order]
+
+
+def get_features(using=None):
+    """
+    Returns the sorted book, tag and author ids and the binary book x
+    feature matrix, tag columns first.
+    """
+    book_ids = np.fromiter(
+        Book.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator(), dtype=np.int64,
+    )
+    tag_ids = np.fromiter(Tag.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator(), np.int64)
+    author_ids = np.fromiter(
+        Author.objects.using(using).order_by('pk').values_list('pk', flat=True).iterator(), dtype=np.int64,
+    )
+    tag_links = np.array(
+        list(Book.tags.through.objects.using(using).values_list('book_id', 'tag_id').iterator()), dtype=np.int64,
+    ).reshape(-1, 2)
+    author_links = np.array(
+        list(Author.books.through.objects.using(using).values_list('book_id', 'author_id').iterator()),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    rows = np.concatenate([
+        np.searchsorted(book_ids, tag_links[:, 0]),
+        np.searchsorted(book_ids, author_links[:, 0]),
+    ])
+    columns = np.concatenate([
+        np.searchsorted(tag_ids, tag_links[:, 1]),
+        len(tag_ids) + np.searchsorted(author_ids, author_links[:, 1]),
+    ])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(book_ids), len(tag_ids) + len(author_ids)),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return book_ids, tag_ids, author_ids, matrix
+
+
+def get_weights(matrix, tag_count, options):
+    books = matrix.shape[0]
+    frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    weights = (np.log((1 + books) / (1 + frequency)) + 1).astype(np.float32)
+    weights[tag_count:] *= options['AUTHOR_WEIGHT']
+    if options['MAX_FEATURE_BOOKS'] is not None:
+        weights[frequency > options['MAX_FEATURE_BOOKS']] = 0
+    return weights
+
+
+def normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def build(using=None, **overrides):
+    """
+    Computes the model from the catalog in ``using`` and atomically replaces
+    the stored one. Returns the number of books.
+    """
+    options = {**get_options(), **overrides}
+    built_at = time.time() - options['LAG_SECONDS']
+    book_ids, tag_ids, author_ids, matrix = get_features(using)
+    weights = get_weights(matrix, len(tag_ids), options)
+    matrix = normalize(matrix @ sparse.diags(weights))
+    matrix.eliminate_zeros()
+    matrix = matrix.tocsr().astype(np.float32)
+
+    k = options['K']
+    id_type = np.int32 if not len(book_ids) or book_ids[-1] <= np.iinfo(np.int32).max else np.int64
+    counts = np.zeros(len(book_ids), dtype=np.int64)
+    neighbours, scores = [], []
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(book_ids), options['BLOCK_SIZE']):
+        block = (matrix[start:start + options['BLOCK_SIZE']] @ transposed).tocsr()
+        for offset in range(block.shape[0]):
+            row = start + offset
+            begin, end = block.indptr[offset], block.indptr[offset + 1]
+            columns, values = block.indices[begin:end], block.data[begin:end]
+            keep = (columns != row) & (values > 0)
+            candidates, values = top_k(book_ids[columns[keep]], values[keep], k)
+            counts[row] = len(candidates)
+            neighbours.append(candidates.astype(id_type))
+            scores.append(values.astype(np.float32))
+
+    columns = matrix.tocsc()
+    arrays = {
+        'book_ids': book_ids,
+        'tag_ids': tag_ids,
+        'author_ids': author_ids,
+        'weights': weights,
+        'offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        'neighbours': np.concatenate(neighbours) if neighbours else np.zeros(0, dtype=id_type),
+        'scores': np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+        'data': columns.data.astype(np.float32),
+        'indices': columns.indices.astype(np.int32),
+        'indptr': columns.indptr.astype(np.int64),
+    }
+    version = time.time_ns()
+    meta = {
+        'version': version,
+        'format': FORMAT,
+        'built_at': built_at,
+        'k': k,
+        'author_weight': options['AUTHOR_WEIGHT'],
+    }
+    save(options['PATH'], arrays, meta)
+    related_books.cache.set(related_books.version_key, version, timeout=None)
+    # Cached /related/ responses were computed from the previous model.
+    response_cache.invalidate('related', using=using)
+    return len(book_ids)
+
+
+def get_database():
+    """
+    Identifies the catalog database. Stored models and snapshots record it
+    and are ignored by processes using another one.
+    """
+    settings_dict = connections[router.db_for_write(Book)].settings_dict
+    return ':'.join(str(settings_dict[key]) for key in ('ENGINE', 'HOST', 'PORT', 'NAME'))
+
+
+def load_meta(path):
+    """
+    Returns the meta of the files under ``path``, or ``None`` when none were
+    built from this database.
+    """
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    return meta if meta.get('database') == get_database() else None
+
+
+def save(path, arrays, meta):
+    path = os.path.abspath(path)
+    staging = f'{path}.{os.getpid()}.new'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f'{name}.npy'), array)
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump({**meta, 'database': get_database()}, f)
+    # Readers keep their mappings of the old files, which stay valid after
+    # the directory is replaced.
+    old = f'{path}.{os.getpid()}.old'
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(staging, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class Model:
+    def __init__(self, path, meta):
+        self.path = path
+        self.version = meta['version']
+        self.built_at = meta['built_at']
+        self.k = meta['k']
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+
+    def find(self, book_id):
+        row = int(np.searchsorted(self.book_ids, book_id))
+        if row < len(self.book_ids) and self.book_ids[row] == book_id:
+            return row
+        return None
+
+    def is_stale(self):
+        return os.path.exists(os.path.join(self.path, STALE_FILE))
+
+    def get(self, book_id, limit):
+        row = self.find(book_id)
+        if row is None:
+            return None
+        begin = int(self.offsets[row])
+        end = min(int(self.offsets[row + 1]), begin + limit)
+        return list(zip(self.neighbours[begin:end].tolist(), self.scores[begin:end].tolist()))
+
+    def compute(self, book_id, tag_ids, author_ids, limit):
+        """
+        Scores ``book_id`` with the given links against every stored book.
+        """
+        columns = np.concatenate([
+            self.lookup(self.tag_ids, tag_ids),
+            len(self.tag_ids) + self.lookup(self.author_ids, author_ids),
+        ])
+        weights = np.asarray(self.weights[columns], dtype=np.float64)
+        norm = np.sqrt((weights ** 2).sum())
+        if not norm:
+            return []
+        rows, values = [], []
+        for column, weight in zip(columns.tolist(), (weights / norm).tolist()):
+            if not weight:
+                continue
+            begin, end = self.indptr[column], self.indptr[column + 1]
+            rows.append(self.indices[begin:end])
+            values.append(self.data[begin:end] * weight)
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+        totals = np.bincount(rows, weights=np.concatenate(values))
+        candidates = np.flatnonzero(totals)
+        scores = totals[candidates]
+        keep = self.book_ids[candidates] != book_id
+        candidates, scores = top_k(np.asarray(self.book_ids[candidates[keep]]), scores[keep], limit)
+        return list(zip(candidates.tolist(), scores.astype(np.float32).tolist()))
+
+    @staticmethod
+    def lookup(ids, values):
+        values = np.asarray(sorted(values), dtype=np.int64)
+        positions = np.searchsorted(ids, values)
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == values[found]
+        return positions[found]
+
+
+class RelatedBooks:
+    version_key = 'library:related:version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+
+    @property
+    def options(self):
+        return get_options()
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE_ALIAS']]
+
+    def current_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            meta = self.read_meta()
+            if meta is not None:
+                version = meta['version']
+                self.cache.add(self.version_key, version, timeout=None)
+        return version
+
+    def read_meta(self):
+        return load_meta(self.options['PATH'])
+
+    def get_model(self):
+        """
+        Returns the stored model, reloading it when another process rebuilt
+        it, or ``None`` when none was built.
+        """
+        version = self.current_version()
+        if version is None:
+            return None
+        with self._lock:
+            if self._model is None or self._model.version != version:
+                meta = self.read_meta()
+                if meta is None or meta.get('format') != FORMAT:
+                    return None
+                self._model = Model(self.options['PATH'], meta)
+            return self._model
+
+    def mark_stale(self):
+        """
+        Scores every book on the fly until the next build, for writes that
+        bypass model signals.
+        """
+        path = self.options['PATH']
+        if os.path.isdir(path):
+            open(os.path.join(path, STALE_FILE), 'w').close()
+            response_cache.invalidate('related')
+
+    def get(self, book_id, limit, using=None, updated_at=None):
+        """
+        Returns up to ``limit`` ``(book id, score)`` pairs, best first.
+        ``updated_at`` of the book is read when not given.
+        """
+        model = self.get_model()
+        if model is None:
+            return self.count_shared(book_id, limit, using)
+        if updated_at is None:
+            updated_at = Book.objects.using(using).filter(pk=book_id).values_list('updated_at', flat=True).first()
+        if updated_at is not None and updated_at.timestamp() <= model.built_at and not model.is_stale():
+            related = model.get(book_id, limit)
+            if related is not None:
+                return related
+        tag_ids = Book.tags.through.objects.using(using).filter(book_id=book_id).values_list('tag_id', flat=True)
+        author_ids = Author.books.through.objects.using(using).filter(book_id=book_id).values_list(
+            'author_id', flat=True)
+        return model.compute(book_id, list(tag_ids), list(author_ids), limit)
+
+    def count_shared(self, book_id, limit, using=None):
+        """
+        Ranks books by their shared tags and (weighted) authors in SQL.
+        """
+        scores = {}
+        links = [
+            (Book.tags.through, 'tag_id', 1.0),
+            (Author.books.through, 'author_id', self.options['AUTHOR_WEIGHT']),
+        ]
+        for through, column, weight in links:
+            shared = through.objects.using(using).filter(
+                **{f'{column}__in': through.objects.using(using).filter(book_id=book_id).values(column)},
+            ).exclude(book_id=book_id).values('book_id').annotate(shared=Count('pk'))
+            for row in shared.order_by('-shared', 'book_id')[:limit * 10]:
+                scores[row['book_id']] = scores.get(row['book_id'], 0) + row['shared'] * weight
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+related_books = RelatedBooks()
@@ -0,0 +1,102 @@
+import json
+import math
+
+import msgpack
+import orjson
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+def has_non_finite(value):
+    """
+    Tells whether ``value`` holds a ``NaN`` or infinite float.
+    """
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(has_non_finite(key) or has_non_finite(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return any(has_non_finite(item) for item in value)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` output encoded by orjson, several times faster. Values
+    orjson has no native form for go through DRF's encoder, so dates and
+    decimals are written the same way. Indented or ASCII-only output,
+    integers beyond 64 bits and ``NaN`` or infinities, which orjson would
+    write as ``null``, fall back to ``JSONRenderer``, which refuses the
+    latter. Unlike it, floats written with an exponent are spelled ``1e-5``
+    not ``1e-05``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if self.ensure_ascii or not self.compact or indent is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'null' in ret and has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped for JavaScript like JSONRenderer does.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack, chosen with ``Accept: application/msgpack`` or
+    ``?format=msgpack``. Values without a MessagePack type are converted
+    the way the JSON renderers convert them.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder_class().default, use_bin_type=True)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Exports stream their own body, so only error
+    responses are rendered here, as a single JSON line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n').encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Comma-separated values. Exports stream their own body, so only error
+    responses are rendered here, as plain text.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return f'{data}\n'.encode(self.charset)
@@ -0,0 +1,17 @@
+from copy import deepcopy
+
+from rest_framework.routers import DefaultRouter
+
+
+class BulkRouter(DefaultRouter):
+    """
+    ``DefaultRouter`` that also routes ``PATCH`` and ``DELETE`` on list
+    endpoints to ``bulk_update`` and ``bulk_destroy``, for viewsets that
+    implement them.
+    """
+    routes = deepcopy(DefaultRouter.routes)
+    routes[0] = routes[0]._replace(mapping={
+        **routes[0].mapping,
+        'patch': 'bulk_update',
+        'delete': 'bulk_destroy',
+    })
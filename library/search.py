@@ -0,0 +1,154 @@
+"""
+Full-text search documents for the catalog.
+
+On Postgres every document table gets a ``search_vector`` tsvector column
+kept up to date by a trigger, a GIN index over it and a ``pg_trgm`` index
+for substring matches. On SQLite an external-content FTS5 table mirrors the
+column through triggers. The column is maintained by the database itself,
+so bulk inserts and raw updates stay searchable.
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+SEARCH_DOCUMENTS = {
+    'library_book': 'title',
+    'library_author': 'name',
+}
+
+TEXT_SEARCH_CONFIG = 'simple'
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def create_search_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in SEARCH_DOCUMENTS.items():
+        if vendor == 'postgresql':
+            _create_postgres_index(schema_editor, table, column)
+        elif vendor == 'sqlite':
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5("
+                f"{column}, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            create_sqlite_triggers(schema_editor)
+            schema_editor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def create_sqlite_triggers(schema_editor):
+    """
+    Creates the FTS5 sync triggers. SQLite drops triggers when Django
+    rebuilds a table, so migrations that alter a document table on SQLite
+    must call this again.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in SEARCH_DOCUMENTS.items():
+        delete = f"INSERT INTO {table}_fts({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+        insert = f"INSERT INTO {table}_fts(rowid, {column}) VALUES (new.id, new.{column});"
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {insert} END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN {delete} END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column} ON {table} "
+            f"BEGIN {delete} {insert} END"
+        )
+
+
+def _create_postgres_index(schema_editor, table, column):
+    schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN search_vector tsvector')
+    schema_editor.execute(
+        f"UPDATE {table} SET search_vector = to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce({column}, ''))"
+    )
+    schema_editor.execute(f'CREATE INDEX {table}_search_vector_idx ON {table} USING gin (search_vector)')
+    schema_editor.execute(f'CREATE INDEX {table}_{column}_trgm_idx ON {table} USING gin ({column} gin_trgm_ops)')
+    schema_editor.execute(
+        f'CREATE TRIGGER {table}_search_vector_update BEFORE INSERT OR UPDATE OF {column} ON {table} '
+        f"FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.{TEXT_SEARCH_CONFIG}', {column})"
+    )
+
+
+def drop_search_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, column in SEARCH_DOCUMENTS.items():
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_search_vector_update ON {table}')
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm_idx')
+            schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+        elif vendor == 'sqlite':
+            for suffix in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+def has_search_document(model):
+    return model._meta.db_table in SEARCH_DOCUMENTS
+
+
+def tokenize(terms):
+    return _TOKEN_RE.findall(' '.join(terms))
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def match(model, terms, using):
+    """
+    Returns a subquery of primary keys whose document matches every term as a
+    word prefix. On Postgres a trigram-indexed substring match is accepted too.
+    """
+    table = model._meta.db_table
+    column = SEARCH_DOCUMENTS[table]
+    tokens = tokenize(terms)
+    vendor = connections[using].vendor
+    if not tokens:
+        return RawSQL(f'SELECT id FROM {table} WHERE 1 = 0', [])
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        substring = ' AND '.join(f'{column} ILIKE %s' for _ in terms)
+        return RawSQL(
+            f"SELECT id FROM {table} WHERE search_vector @@ to_tsquery('{TEXT_SEARCH_CONFIG}', %s) "
+            f"OR ({substring})",
+            [query] + [f'%{_escape_like(term)}%' for term in terms],
+        )
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        return RawSQL(f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s', [query])
+    lookups = ' AND '.join(f'UPPER({column}) LIKE UPPER(%s)' for _ in terms)
+    return RawSQL(f'SELECT id FROM {table} WHERE {lookups}', [f'%{term}%' for term in terms])
+
+
+def rank(model, terms, using):
+    """
+    Returns a relevance expression for ``match``; higher is better and
+    rows that matched on other fields rank as 0.
+    """
+    table = model._meta.db_table
+    column = SEARCH_DOCUMENTS[table]
+    tokens = tokenize(terms)
+    vendor = connections[using].vendor
+    if not tokens:
+        return RawSQL('0', [])
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        return RawSQL(
+            f"ts_rank({table}.search_vector, to_tsquery('{TEXT_SEARCH_CONFIG}', %s)) "
+            f"+ similarity({table}.{column}, %s)",
+            [query, ' '.join(terms)],
+        )
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        return RawSQL(
+            f'COALESCE((SELECT -bm25({table}_fts) FROM {table}_fts '
+            f'WHERE {table}_fts MATCH %s AND rowid = {table}.id), 0)',
+            [query],
+        )
+    return RawSQL('0', [])
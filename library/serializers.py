@@ -1,20 +1,196 @@
-from rest_framework.serializers import ModelSerializer
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from rest_framework.serializers import ListSerializer, ModelSerializer
+
+from library.bulk import create_returning_ids, insert_links, send_m2m_changed
+from library.metrics import add_serialize_seconds
 from library.models import Book, Author, Tag
 
 
-class AuthorsSerializer(ModelSerializer):
+# Served by the change feed (library/changes.py) instead.
+TIMESTAMPS = ('created_at', 'updated_at')
+
+
+class TimedDataMixin:
+    """
+    Adds the time spent building ``data`` to the request metrics (see
+    ``library.metrics``). Nested serializers are timed with their parent.
+    """
+
+    @property
+    def data(self):
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            add_serialize_seconds(self.context.get('request'), time.perf_counter() - started)
+
+
+class BulkListSerializer(TimedDataMixin, ListSerializer):
+    """
+    Creates and updates many objects at once with ``bulk_create`` and
+    ``bulk_update``. M2M fields are diffed against the existing links as
+    sets and written with one insert and one delete per relation. Model and
+    ``m2m_changed`` signals are still sent for every object.
+    """
+
+    def get_m2m_fields(self):
+        model = self.child.Meta.model
+        return {field.name: field for field in model._meta.many_to_many}
+
+    @staticmethod
+    def split_links(validated_data, m2m_fields):
+        links = []
+        for attrs in validated_data:
+            links.append({name: {obj.pk for obj in attrs.pop(name)} for name in m2m_fields if name in attrs})
+        return links
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        m2m_fields = self.get_m2m_fields()
+        links = self.split_links(validated_data, m2m_fields)
+        with transaction.atomic():
+            instances = create_returning_ids(
+                model, [model(**attrs) for attrs in validated_data], send_signals=True,
+            )
+            for name, field in m2m_fields.items():
+                added = [(instance, link[name]) for instance, link in zip(instances, links) if link.get(name)]
+                self.write_links(field, added, [])
+        return instances
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        m2m_fields = self.get_m2m_fields()
+        links = self.split_links(validated_data, m2m_fields)
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+            fields.update(attrs)
+        if fields:
+            # bulk_update does not call pre_save(), set auto_now fields here.
+            now = timezone.now()
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    fields.add(field.name)
+                    for instance in instances:
+                        setattr(instance, field.attname, now)
+        with transaction.atomic():
+            if fields:
+                model.objects.bulk_update(instances, fields)
+                for instance in instances:
+                    post_save.send(
+                        sender=model, instance=instance, created=False,
+                        update_fields=frozenset(fields), raw=False, using=instance._state.db,
+                    )
+            for name, field in m2m_fields.items():
+                changed = [(instance, link[name]) for instance, link in zip(instances, links) if name in link]
+                if changed:
+                    self.diff_links(field, changed)
+        return instances
+
+    def diff_links(self, field, changed):
+        through = field.remote_field.through
+        source, target = f'{field.m2m_field_name()}_id', f'{field.m2m_reverse_field_name()}_id'
+        existing = {}
+        rows = through.objects.filter(**{f'{source}__in': [instance.pk for instance, _ in changed]})
+        for link_id, source_id, target_id in rows.values_list('id', source, target):
+            existing.setdefault(source_id, {})[target_id] = link_id
+        added, removed, link_ids = [], [], []
+        for instance, wanted in changed:
+            current = existing.get(instance.pk, {})
+            added.append((instance, wanted - set(current)))
+            removed.append((instance, set(current) - wanted))
+            link_ids.extend(current[pk] for pk in removed[-1][1])
+        self.write_links(field, added, removed, link_ids)
+
+    @staticmethod
+    def write_links(field, added, removed, link_ids=()):
+        through = field.remote_field.through
+        send_m2m_changed(field, removed, 'pre_remove')
+        send_m2m_changed(field, added, 'pre_add')
+        if link_ids:
+            through.objects.filter(id__in=link_ids).delete()
+        insert_links(
+            through, field.m2m_field_name(), field.m2m_reverse_field_name(),
+            [(instance.pk, pk) for instance, pk_set in added for pk in pk_set],
+        )
+        send_m2m_changed(field, removed, 'post_remove')
+        send_m2m_changed(field, added, 'post_add')
+
+
+class ExpandableModelSerializer(TimedDataMixin, ModelSerializer):
+    """
+    Replaces related fields listed in ``expand`` with nested representations.
+    ``expandable_fields`` maps a field name to the nested serializer name and
+    the source attribute; the view is responsible for prefetching it.
+    Only the fields named in ``fields`` are kept, when it is not empty.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        self._expand = expand
+        self._sparse_fields = fields
+        super().__init__(*args, **kwargs)
+
+    def get_expand(self):
+        if self._expand is not None:
+            return self._expand
+        return self.context.get('expand', ())
+
+    def get_sparse_fields(self):
+        if self._sparse_fields is not None:
+            return self._sparse_fields
+        return self.context.get('fields', ())
+
+    def get_fields(self):
+        fields = super().get_fields()
+        for name in self.get_expand():
+            if name not in self.expandable_fields:
+                continue
+            serializer_name, source = self.expandable_fields[name]
+            serializer_class = globals()[serializer_name]
+            kwargs = {'source': source} if source != name else {}
+            fields[name] = serializer_class(many=True, read_only=True, expand=(), fields=(), **kwargs)
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields:
+            fields = OrderedDict((name, field) for name, field in fields.items() if name in sparse_fields)
+        return fields
+
+
+class AuthorsSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'books': ('BooksSerializer', 'books'),
+    }
+
     class Meta:
         model = Author
-        fields = '__all__'
+        exclude = TIMESTAMPS
+        list_serializer_class = BulkListSerializer
+
 
+class TagsSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'books': ('BooksSerializer', 'book_set'),
+    }
 
-class TagsSerializer(ModelSerializer):
     class Meta:
         model = Tag
-        fields = '__all__'
+        exclude = TIMESTAMPS
+        list_serializer_class = BulkListSerializer
+
 
+class BooksSerializer(ExpandableModelSerializer):
+    expandable_fields = {
+        'tags': ('TagsSerializer', 'tags'),
+        'authors': ('AuthorsSerializer', 'author_set'),
+    }
 
-class BooksSerializer(ModelSerializer):
     class Meta:
         model = Book
-        fields = '__all__'
\ No newline at end of file
+        exclude = TIMESTAMPS
+        list_serializer_class = BulkListSerializer
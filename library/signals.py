@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from oauth2_provider.models import get_access_token_model
+
+from library import counters, stats
+from library.authentication import token_cache
+from library.autocomplete import autocomplete_index
+from library.cache import response_cache
+from library.models import Book, Author, Tag, Tombstone
+from library.tag_index import tag_index
+
+
+def get_links(sender, instance, reverse, pk_set):
+    """
+    Returns the ``(source ids, target ids)`` touched by an ``m2m_changed``
+    signal, whichever side of the relation it was sent from.
+    """
+    if reverse:
+        return pk_set, {instance.pk}
+    return {instance.pk}, pk_set
+
+
+def link_tables(model):
+    """
+    Returns the names of the M2M tables that reference ``model`` on either side.
+    """
+    through = [field.remote_field.through for field in model._meta.many_to_many]
+    through += [rel.through for rel in model._meta.related_objects if rel.many_to_many]
+    return [table._meta.model_name for table in through]
+
+
+def capture_cleared(sender, instance):
+    """
+    ``post_clear`` carries no ``pk_set``; remember the links on ``pre_clear``.
+    """
+    source = target = None
+    for field in sender._meta.get_fields():
+        if field.many_to_one:
+            if isinstance(instance, field.related_model):
+                source = field.attname
+            else:
+                target = field.attname
+    links = sender.objects.filter(**{source: instance.pk}).values_list(target, flat=True)
+    instance._cleared_links = set(links)
+
+
+def capture_removed(sender, instance, reverse, pk_set):
+    """
+    ``remove()`` reports every id it was given; keep the ones actually linked.
+    """
+    source, target = counters.link_models(sender)
+    if reverse:
+        source, target = target, source
+    links = sender.objects.filter(**{source: instance.pk, f'{target}__in': pk_set}).values_list(target, flat=True)
+    instance._removed_links = set(links)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+@receiver(m2m_changed, sender=Author.books.through)
+def links_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action == 'pre_clear':
+        capture_cleared(sender, instance)
+        return
+    if action == 'pre_remove':
+        capture_removed(sender, instance, reverse, pk_set)
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_links', set())
+    elif action == 'post_remove':
+        pk_set = instance.__dict__.pop('_removed_links', set())
+    elif action != 'post_add':
+        return
+    if not pk_set:
+        return
+    source_ids, target_ids = get_links(sender, instance, reverse, pk_set)
+    delta = 1 if action == 'post_add' else -1
+    counters.links_changed(sender, source_ids, target_ids, delta, using=using, instance=instance)
+    stats.links_changed(sender, source_ids, target_ids, delta, using=using)
+    if sender is Book.tags.through:
+        if delta > 0:
+            tag_index.add_links(target_ids, source_ids, using=using)
+        else:
+            tag_index.remove_links(target_ids, source_ids, using=using)
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, using, **kwargs):
+    if created:
+        tag_index.add_book(instance.pk, using=using)
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleting(sender, instance, **kwargs):
+    instance._deleted_tag_ids = set(instance.tags.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Book)
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Tag)
+def update_deleted_counters(sender, instance, using, **kwargs):
+    # Deleting cascades to the link tables without m2m_changed.
+    counters.object_deleting(instance, using=using)
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=Author)
+def stats_saving(sender, instance, raw, using, **kwargs):
+    if not raw:
+        stats.object_saving(instance, using=using)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def stats_saved(sender, instance, created, raw, using, **kwargs):
+    if not raw:
+        stats.object_saved(instance, created, using=using)
+
+
+@receiver(pre_delete, sender=Book)
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Tag)
+def update_deleted_stats(sender, instance, using, **kwargs):
+    stats.object_deleting(instance, using=using)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, using, **kwargs):
+    tag_index.remove_book(instance.pk, instance.__dict__.pop('_deleted_tag_ids', set()), using=using)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Tag)
+def record_tombstone(sender, instance, using, **kwargs):
+    Tombstone.objects.using(using).create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using, **kwargs):
+    tag_index.remove_tag(instance.pk, using=using)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Tag)
+def autocomplete_saved(sender, instance, using, **kwargs):
+    autocomplete_index.object_saved(instance, using=using)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Tag)
+def autocomplete_deleted(sender, instance, using, **kwargs):
+    autocomplete_index.object_deleted(instance, using=using)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Tag)
+def invalidate_saved(sender, using, **kwargs):
+    response_cache.invalidate(sender._meta.model_name, using=using)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted(sender, using, **kwargs):
+    # Deleting cascades to the link tables without m2m_changed.
+    response_cache.invalidate(sender._meta.model_name, *link_tables(sender), using=using)
+
+
+@receiver(m2m_changed, sender=Book.tags.through)
+@receiver(m2m_changed, sender=Author.books.through)
+def invalidate_links(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        response_cache.invalidate(sender._meta.model_name, using=using)
+
+
+@receiver(post_save, sender=get_access_token_model())
+@receiver(post_delete, sender=get_access_token_model())
+def evict_token(sender, instance, **kwargs):
+    # AccessToken.revoke() deletes the token.
+    token_cache.evict(instance.token)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def evict_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.evict_user(instance.pk)
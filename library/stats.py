@@ -0,0 +1,356 @@
+"""
+Summary tables behind ``/stats/``: ``PagesStat`` holds the number of books
+and their total pages per ``Book.pages`` bucket for the whole catalog,
+every author and every tag, ``DecadeStat`` the number of authors per decade
+of birth. Means and histograms are read from a handful of rows instead of
+aggregating the catalog.
+
+Like the counters of ``library.counters`` they are updated with ``F()``
+expressions in the transaction of the write, from the model and
+``m2m_changed`` signals (see ``library.signals``): one ``UPDATE`` per table
+with a ``CASE`` per changed row, the catalog row included. Rows dropping
+to zero are kept, so the next increment is that single ``UPDATE``, and
+skipped when read. The previous pages or year of birth of a saved object
+are the values it was loaded with, read before the save only for objects
+not loaded from the database. Writes that bypass signals call
+``rebuild``, which recomputes the tables from the catalog; so does a
+change of ``BUCKETS``.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from library.models import Book, Author, PagesStat, DecadeStat
+
+DEFAULTS = {
+    # Lower edges of the Book.pages histogram buckets.
+    'BUCKETS': (0, 50, 100, 200, 300, 400, 500, 750, 1000, 1500),
+}
+
+Scope = namedtuple('Scope', ['name', 'through', 'column'])
+
+# Books are linked to the objects of a scope through ``through.column``.
+SCOPES = {
+    'author': Scope('author', Author.books.through, 'author_id'),
+    'tag': Scope('tag', Book.tags.through, 'tag_id'),
+}
+
+Summary = namedtuple('Summary', ['book_count', 'pages_sum', 'pages_mean', 'histogram'])
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_STATS', {})}
+
+
+def get_bucket(pages, buckets=None):
+    """
+    Returns the lower edge of the bucket of ``pages``, the first one for
+    pages below it.
+    """
+    buckets = buckets or get_options()['BUCKETS']
+    return buckets[max(bisect_right(buckets, pages) - 1, 0)]
+
+
+def bucket_expression(field, buckets):
+    whens = [When(**{f'{field}__lt': high}, then=Value(low)) for low, high in zip(buckets, buckets[1:])]
+    return Case(*whens, default=Value(buckets[-1]), output_field=IntegerField())
+
+
+def get_scope(through):
+    """
+    Returns the scope of the objects linked to books through ``through``.
+    """
+    return next(scope for scope in SCOPES.values() if scope.through is through)
+
+
+def group_changes(changes):
+    """
+    Groups ``{(scope, object_id, bucket): (books, pages)}`` by everything
+    but the object, dropping empty changes.
+    """
+    groups = {}
+    for (scope, object_id, bucket), (books, pages) in changes.items():
+        if books or pages:
+            groups.setdefault((scope, bucket, books, pages), []).append(object_id)
+    return groups
+
+
+def update_pages(groups, using=None):
+    """
+    Adds the changes of ``groups`` to their rows in a single ``UPDATE``.
+    Returns the number of rows updated.
+    """
+    conditions = [
+        (Q(scope=scope, bucket=bucket, object_id__in=ids), books, pages)
+        for (scope, bucket, books, pages), ids in groups.items()
+    ]
+
+    def case(index):
+        whens = [When(condition, then=Value(delta[index])) for condition, *delta in conditions]
+        return Case(*whens, default=Value(0), output_field=IntegerField())
+
+    return PagesStat.objects.using(using).filter(reduce(or_, [condition for condition, _, _ in conditions])).update(
+        book_count=F('book_count') + case(0), pages_sum=F('pages_sum') + case(1),
+    )
+
+
+def add_pages(changes, using=None):
+    """
+    Adds ``{(scope, object_id, bucket): (books, pages)}`` (negative to
+    remove) to the rows of the objects. Rows left without books stay and
+    are ignored.
+    """
+    groups = group_changes(changes)
+    if not groups or update_pages(groups, using) == sum(len(ids) for ids in groups.values()):
+        return
+    # Rows are only created to add books; a row inserted concurrently is
+    # kept and updated like ours.
+    groups = {(scope, bucket, books, pages): ids for (scope, bucket, books, pages), ids in groups.items() if books > 0}
+    if not groups:
+        return
+    existing = set(PagesStat.objects.using(using).filter(reduce(or_, [
+        Q(scope=scope, bucket=bucket, object_id__in=ids) for (scope, bucket, _, _), ids in groups.items()
+    ])).values_list('scope', 'object_id', 'bucket'))
+    missing = {}
+    for (scope, bucket, books, pages), ids in groups.items():
+        ids = [pk for pk in ids if (scope, pk, bucket) not in existing]
+        if ids:
+            missing[(scope, bucket, books, pages)] = ids
+    if not missing:
+        return
+    PagesStat.objects.using(using).bulk_create([
+        PagesStat(scope=scope, object_id=pk, bucket=bucket)
+        for (scope, bucket, _, _), ids in missing.items() for pk in ids
+    ], ignore_conflicts=True)
+    update_pages(missing, using)
+
+
+def add_book(pages, delta, links=(), using=None):
+    """
+    Counts a book with ``pages`` (``delta`` 1) or stops counting it (-1) in
+    the catalog and in the objects of ``links``, ``(scope, ids)`` pairs.
+    """
+    bucket = get_bucket(pages)
+    links = [('all', [0])] + list(links)
+    add_pages({(scope, pk, bucket): (delta, delta * pages) for scope, ids in links for pk in ids}, using=using)
+
+
+def move_book(book_id, old_pages, new_pages, using=None):
+    """
+    Moves a book between buckets, or only its pages within one, in the
+    catalog and in its authors and tags.
+    """
+    links = [('all', [0])] + [(name, list(ids)) for name, ids in get_links(book_id, using)]
+    old_bucket, new_bucket = get_bucket(old_pages), get_bucket(new_pages)
+    changes = {}
+    for scope, ids in links:
+        for pk in ids:
+            if old_bucket == new_bucket:
+                changes[(scope, pk, new_bucket)] = (0, new_pages - old_pages)
+            else:
+                changes[(scope, pk, old_bucket)] = (-1, -old_pages)
+                changes[(scope, pk, new_bucket)] = (1, new_pages)
+    add_pages(changes, using=using)
+
+
+def get_links(book_id, using=None):
+    return [
+        (scope.name, scope.through.objects.using(using).filter(book_id=book_id).values_list(scope.column, flat=True))
+        for scope in SCOPES.values()
+    ]
+
+
+def get_stored(instance, using=None):
+    """
+    Returns the stored values of the ``stats_fields`` of ``instance``.
+    """
+    fields = type(instance).stats_fields
+    values = type(instance).objects.using(using).filter(pk=instance.pk).values_list(*fields).first()
+    return dict(zip(fields, values)) if values is not None else {}
+
+
+def object_saving(instance, using=None):
+    if instance._state.adding:
+        return
+    stored = getattr(instance, '_stored', {})
+    if any(name not in stored for name in type(instance).stats_fields):
+        instance._stored = get_stored(instance, using)
+
+
+def object_saved(instance, created, using=None):
+    stored = getattr(instance, '_stored', {})
+    if isinstance(instance, Book):
+        if created:
+            add_book(instance.pages, 1, using=using)
+        elif 'pages' in stored and stored['pages'] != instance.pages:
+            move_book(instance.pk, stored['pages'], instance.pages, using=using)
+    elif isinstance(instance, Author):
+        if created:
+            add_authors({get_decade(instance.year_of_birth): 1}, using=using)
+        elif 'year_of_birth' in stored and stored['year_of_birth'] != instance.year_of_birth:
+            add_authors({get_decade(stored['year_of_birth']): -1, get_decade(instance.year_of_birth): 1}, using=using)
+    instance._stored = {name: getattr(instance, name) for name in type(instance).stats_fields}
+
+
+def object_deleting(instance, using=None):
+    """
+    Stops counting ``instance``, before the delete cascades to the link
+    tables.
+    """
+    stored = get_stored(instance, using)
+    if isinstance(instance, Book) and stored:
+        add_book(stored['pages'], -1, get_links(instance.pk, using), using=using)
+        return
+    if isinstance(instance, Author) and stored:
+        add_authors({get_decade(stored['year_of_birth']): -1}, using=using)
+    scope = type(instance)._meta.model_name
+    if scope in SCOPES:
+        PagesStat.objects.using(using).filter(scope=scope, object_id=instance.pk).delete()
+
+
+def links_changed(through, source_ids, target_ids, delta, using=None):
+    """
+    Counts ``delta`` (1 or -1) for every link between ``source_ids`` and
+    ``target_ids``, one side of which is a single object.
+    """
+    scope = get_scope(through)
+    book_ids, object_ids = (source_ids, target_ids) if through is Book.tags.through else (target_ids, source_ids)
+    buckets = {}
+    for pages in Book.objects.using(using).filter(pk__in=book_ids).values_list('pages', flat=True):
+        bucket = get_bucket(pages)
+        books, total = buckets.get(bucket, (0, 0))
+        buckets[bucket] = (books + 1, total + pages)
+    add_pages({
+        (scope.name, pk, bucket): (delta * books, delta * pages)
+        for bucket, (books, pages) in buckets.items() for pk in object_ids
+    }, using=using)
+
+
+def get_decade(year):
+    return year // 10 * 10
+
+
+def update_decades(changes, using=None):
+    whens = [When(decade=decade, then=Value(delta)) for decade, delta in changes.items()]
+    return DecadeStat.objects.using(using).filter(decade__in=list(changes)).update(
+        author_count=F('author_count') + Case(*whens, default=Value(0), output_field=IntegerField()),
+    )
+
+
+def add_authors(changes, using=None):
+    """
+    Adds ``{decade: authors}`` (negative to remove) in a single ``UPDATE``.
+    """
+    changes = {decade: delta for decade, delta in changes.items() if delta}
+    if not changes or update_decades(changes, using) == len(changes):
+        return
+    existing = set(DecadeStat.objects.using(using).filter(decade__in=list(changes)).values_list('decade', flat=True))
+    missing = {decade: delta for decade, delta in changes.items() if decade not in existing and delta > 0}
+    if missing:
+        DecadeStat.objects.using(using).bulk_create(
+            [DecadeStat(decade=decade) for decade in missing], ignore_conflicts=True,
+        )
+        update_decades(missing, using)
+
+
+def compute(using=None):
+    """
+    Returns the rows both tables should have, from the catalog:
+    ``({(scope, object_id, bucket): (books, pages)}, {decade: authors})``.
+    """
+    buckets = get_options()['BUCKETS']
+    pages = {}
+    rows = Book.objects.using(using).order_by().annotate(bucket=bucket_expression('pages', buckets)).values(
+        'bucket').annotate(books=Count('pk'), total=Sum('pages')).values_list('bucket', 'books', 'total')
+    for bucket, books, total in rows:
+        pages[('all', 0, bucket)] = (books, total)
+    for scope in SCOPES.values():
+        rows = scope.through.objects.using(using).order_by().annotate(
+            bucket=bucket_expression('book__pages', buckets),
+        ).values(scope.column, 'bucket').annotate(books=Count('pk'), total=Sum('book__pages'))
+        for object_id, bucket, books, total in rows.values_list(scope.column, 'bucket', 'books', 'total'):
+            pages[(scope.name, object_id, bucket)] = (books, total)
+    decades = {}
+    years = Author.objects.using(using).order_by().values('year_of_birth').annotate(authors=Count('pk'))
+    for year, authors in years.values_list('year_of_birth', 'authors'):
+        decades[get_decade(year)] = decades.get(get_decade(year), 0) + authors
+    return pages, decades
+
+
+def count_wrong(expected, stored):
+    return sum(expected.get(key) != stored.get(key) for key in expected.keys() | stored.keys())
+
+
+def rebuild(using=None, fix=True, batch_size=1000):
+    """
+    Recomputes both tables from the catalog. Returns
+    ``{'pages': wrong rows, 'decades': wrong rows}``.
+    """
+    with transaction.atomic(using=using):
+        pages, decades = compute(using)
+        stored_pages = {
+            (scope, object_id, bucket): (books, total)
+            for scope, object_id, bucket, books, total in PagesStat.objects.using(using).filter(
+                book_count__gt=0).values_list('scope', 'object_id', 'bucket', 'book_count', 'pages_sum')
+        }
+        stored_decades = dict(
+            DecadeStat.objects.using(using).filter(author_count__gt=0).values_list('decade', 'author_count'))
+        report = {'pages': count_wrong(pages, stored_pages), 'decades': count_wrong(decades, stored_decades)}
+        if fix and report['pages']:
+            PagesStat.objects.using(using).all().delete()
+            PagesStat.objects.using(using).bulk_create([
+                PagesStat(scope=scope, object_id=object_id, bucket=bucket, book_count=books, pages_sum=total)
+                for (scope, object_id, bucket), (books, total) in pages.items()
+            ], batch_size=batch_size)
+        if fix and report['decades']:
+            DecadeStat.objects.using(using).all().delete()
+            DecadeStat.objects.using(using).bulk_create([
+                DecadeStat(decade=decade, author_count=authors) for decade, authors in decades.items()
+            ], batch_size=batch_size)
+    return report
+
+
+def summarize(rows, buckets):
+    """
+    Returns the ``Summary`` of ``(bucket, books, pages)`` rows.
+    """
+    histogram = dict.fromkeys(buckets, 0)
+    books = total = 0
+    for bucket, count, pages in rows:
+        histogram[bucket] = histogram.get(bucket, 0) + count
+        books += count
+        total += pages
+    return Summary(books, total, total / books if books else None, [histogram[bucket] for bucket in buckets])
+
+
+def get_summaries(scope, object_ids, using=None):
+    """
+    Returns ``{object_id: Summary}`` for ``object_ids`` of a scope, with an
+    empty summary for objects without books.
+    """
+    buckets = get_options()['BUCKETS']
+    rows = {pk: [] for pk in object_ids}
+    stored = PagesStat.objects.using(using).filter(scope=scope, object_id__in=object_ids)
+    for object_id, bucket, books, pages in stored.values_list('object_id', 'bucket', 'book_count', 'pages_sum'):
+        rows[object_id].append((bucket, books, pages))
+    return {pk: summarize(object_rows, buckets) for pk, object_rows in rows.items()}
+
+
+def get_object_ids(scope, after=0, limit=100, using=None):
+    """
+    Returns the first ``limit`` ids after ``after`` of the objects of a scope
+    with books.
+    """
+    ids = PagesStat.objects.using(using).filter(scope=scope, object_id__gt=after, book_count__gt=0).order_by(
+        'object_id')
+    return list(ids.values_list('object_id', flat=True).distinct()[:limit])
+
+
+def get_decades(using=None):
+    decades = DecadeStat.objects.using(using).filter(author_count__gt=0).order_by('decade')
+    return list(decades.values_list('decade', 'author_count'))
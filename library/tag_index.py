@@ -0,0 +1,326 @@
+"""
+In-process inverted index from tag id to the ids of its books.
+
+A common tag's posting list is a Python integer used as a bitmap (bit
+``n`` is set when book ``n`` has the tag), so AND/OR/NOT over it run in C
+over machine words. A bitmap costs ``max book id / 8`` bytes however few
+books it holds, so tags on fewer than one book in ``DENSITY`` keep a sorted
+numpy array of ids instead, at 8 bytes a book; they are turned into
+bitmaps for the duration of a query only. The index is updated
+incrementally from model signals after the transaction commits. Every
+update also bumps a version number kept in the Django cache; a process that
+finds a version it did not produce itself treats its copy as cold, answers
+from SQL and rebuilds.
+"""
+import threading
+from functools import reduce
+from operator import and_, or_
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from library.models import Book
+
+DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'AUTO_BUILD': True,
+    'BACKGROUND': True,
+}
+
+# An array of 8-byte ids is smaller than a bitmap below one book in 64.
+DENSITY = 64
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(value):
+        return bin(value).count('1')
+
+
+def bitmap_from_ids(ids):
+    ids = np.fromiter(ids, dtype=np.int64) if not isinstance(ids, np.ndarray) else ids
+    if not len(ids):
+        return 0
+    buffer = np.zeros(int(ids.max()) // 8 + 1, dtype=np.uint8)
+    np.bitwise_or.at(buffer, ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+    return int.from_bytes(buffer.tobytes(), 'little')
+
+
+def bits_set(bitmap, ids):
+    """
+    Returns a mask of the ``ids`` (a numpy array) whose bit is set in
+    ``bitmap``.
+    """
+    data = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    inside = ids < len(data) * 8
+    mask = np.zeros(len(ids), dtype=bool)
+    mask[inside] = (data[ids[inside] >> 3] >> (ids[inside] & 7).astype(np.uint8)) & 1 == 1
+    return mask
+
+
+def compact(posting, max_id):
+    """
+    Returns ``posting`` as a bitmap when it holds at least one book in
+    ``DENSITY`` up to ``max_id``, as a sorted array of ids otherwise.
+    """
+    if isinstance(posting, int):
+        if popcount(posting) * DENSITY >= max_id:
+            return posting
+        return np.array(list(iter_ids(posting)), dtype=np.int64)
+    if len(posting) * DENSITY >= max_id:
+        return bitmap_from_ids(posting)
+    return posting
+
+
+def to_bitmap(posting):
+    return posting if isinstance(posting, int) else bitmap_from_ids(posting)
+
+
+def iter_ids(bitmap, offset=0, block_size=4096):
+    """
+    Yields the set bits of ``bitmap`` in ascending order, skipping the first
+    ``offset`` of them a block at a time.
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        if offset:
+            size = popcount(int.from_bytes(block, 'little'))
+            if offset >= size:
+                offset -= size
+                continue
+        for index, byte in enumerate(block):
+            if not byte:
+                continue
+            base = (start + index) * 8
+            for bit in range(8):
+                if byte >> bit & 1:
+                    if offset:
+                        offset -= 1
+                        continue
+                    yield base + bit
+
+
+class TagIndex:
+    version_key = 'library:tag_index:version'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tags = {}
+        self._books = 0
+        self._version = None
+        self._building = False
+
+    @property
+    def options(self):
+        return {**DEFAULTS, **getattr(settings, 'LIBRARY_TAG_INDEX', {})}
+
+    @property
+    def cache(self):
+        return caches[self.options['CACHE_ALIAS']]
+
+    def current_version(self):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 0, timeout=None)
+            version = self.cache.get(self.version_key, 0)
+        return version
+
+    def is_warm(self):
+        return self._version is not None and self._version == self.current_version()
+
+    def build(self):
+        version = self.current_version()
+        books = bitmap_from_ids(Book.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+        tags = {}
+        tag_id, book_ids = None, []
+        links = Book.tags.through.objects.order_by('tag_id', 'book_id').values_list('tag_id', 'book_id')
+        for link_tag_id, book_id in links.iterator(chunk_size=10000):
+            if link_tag_id != tag_id:
+                if book_ids:
+                    tags[tag_id] = compact(np.array(book_ids, dtype=np.int64), books.bit_length())
+                tag_id, book_ids = link_tag_id, []
+            book_ids.append(book_id)
+        if book_ids:
+            tags[tag_id] = compact(np.array(book_ids, dtype=np.int64), books.bit_length())
+        with self._lock:
+            self._tags, self._books, self._version = tags, books, version
+
+    def invalidate(self):
+        """
+        Drops this copy and makes every other process rebuild theirs, for
+        writes that bypass model signals.
+        """
+        with self._lock:
+            self._tags, self._books, self._version = {}, 0, None
+            self._bump_version()
+
+    def _bump_version(self):
+        try:
+            return self.cache.incr(self.version_key)
+        except ValueError:
+            self.cache.add(self.version_key, 1, timeout=None)
+            return None
+
+    def schedule_build(self):
+        options = self.options
+        if not options['AUTO_BUILD']:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        if options['BACKGROUND']:
+            threading.Thread(target=self._build_and_close, daemon=True).start()
+        else:
+            self._build_and_close(close=False)
+
+    def _build_and_close(self, close=True):
+        try:
+            self.build()
+        finally:
+            self._building = False
+            if close:
+                connection.close()
+
+    def query(self, include=(), exclude=(), match_all=False):
+        """
+        Returns the bitmap of books having all (or any) of ``include`` and
+        none of ``exclude``, or ``None`` while the index is cold.
+        """
+        with self._lock:
+            warm = self.is_warm()
+            if warm:
+                postings = [self._tags.get(tag_id, 0) for tag_id in include]
+                arrays = [posting for posting in postings if not isinstance(posting, int)]
+                if match_all and arrays:
+                    # Intersect from the rarest tag without building its bitmaps.
+                    ids = reduce(np.intersect1d, arrays)
+                    for bitmap in [posting for posting in postings if isinstance(posting, int)] + [self._books]:
+                        ids = ids[bits_set(bitmap, ids)]
+                    result = bitmap_from_ids(ids)
+                elif include:
+                    bitmaps = [to_bitmap(posting) for posting in postings]
+                    result = reduce(and_ if match_all else or_, bitmaps) & self._books
+                else:
+                    result = self._books
+                for tag_id in exclude:
+                    result &= ~to_bitmap(self._tags.get(tag_id, 0))
+                return result
+        self.schedule_build()
+        return None
+
+    def count_tags(self, bitmap=None, tag_ids=None):
+        """
+        Returns ``{tag id: number of books}`` within ``bitmap`` (every book
+        by default) for ``tag_ids`` (every tag by default), or ``None``
+        while the index is cold.
+        """
+        with self._lock:
+            if self.is_warm():
+                books = self._books if bitmap is None else bitmap & self._books
+                counts = {}
+                for tag_id in self._tags if tag_ids is None else tag_ids:
+                    posting = self._tags.get(tag_id, 0)
+                    if isinstance(posting, int):
+                        counts[tag_id] = popcount(posting & books)
+                    else:
+                        counts[tag_id] = int(np.count_nonzero(bits_set(books, posting)))
+                return counts
+        self.schedule_build()
+        return None
+
+    def add_links(self, tag_ids, book_ids, using=None):
+        self._on_commit(self._add_links, tag_ids, book_ids, using=using)
+
+    def remove_links(self, tag_ids, book_ids, using=None):
+        self._on_commit(self._remove_links, tag_ids, book_ids, using=using)
+
+    def add_book(self, book_id, using=None):
+        self._on_commit(self._add_book, book_id, using=using)
+
+    def remove_book(self, book_id, tag_ids, using=None):
+        self._on_commit(self._remove_book, book_id, tag_ids, using=using)
+
+    def remove_tag(self, tag_id, using=None):
+        self._on_commit(self._remove_tag, tag_id, using=using)
+
+    def _on_commit(self, update, *args, using=None):
+        transaction.on_commit(lambda: self._apply(update, *args), using=using)
+
+    def _apply(self, update, *args):
+        with self._lock:
+            warm = self.is_warm()
+            if warm:
+                update(*args)
+            version = self._bump_version()
+            # Another process changed the catalog since our last update.
+            self._version = version if warm and version == self._version + 1 else None
+
+    def _add_links(self, tag_ids, book_ids):
+        ids = np.array(sorted(book_ids), dtype=np.int64)
+        for tag_id in tag_ids:
+            posting = self._tags.get(tag_id)
+            if posting is None:
+                posting = ids
+            elif isinstance(posting, int):
+                posting |= bitmap_from_ids(ids)
+            else:
+                posting = np.union1d(posting, ids)
+            self._tags[tag_id] = compact(posting, self._books.bit_length())
+
+    def _remove_links(self, tag_ids, book_ids):
+        ids = np.array(sorted(book_ids), dtype=np.int64)
+        for tag_id in tag_ids:
+            posting = self._tags.get(tag_id)
+            if posting is None:
+                continue
+            if isinstance(posting, int):
+                posting &= ~bitmap_from_ids(ids)
+            else:
+                posting = np.setdiff1d(posting, ids, assume_unique=True)
+            self._tags[tag_id] = compact(posting, self._books.bit_length())
+
+    def _add_book(self, book_id):
+        self._books |= 1 << book_id
+
+    def _remove_book(self, book_id, tag_ids):
+        self._books &= ~(1 << book_id)
+        self._remove_links(tag_ids, [book_id])
+
+    def _remove_tag(self, tag_id):
+        self._tags.pop(tag_id, None)
+
+
+class TagSearchResult:
+    """
+    Lazy sequence of the books in a bitmap, ordered by id, that a Django
+    ``Paginator`` can slice without materializing the whole result.
+    """
+
+    def __init__(self, bitmap, queryset):
+        self.bitmap = bitmap
+        self.queryset = queryset
+
+    def count(self):
+        return popcount(self.bitmap)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        ids = []
+        for book_id in iter_ids(self.bitmap, start):
+            if key.stop is not None and len(ids) >= key.stop - start:
+                break
+            ids.append(book_id)
+        books = {book.pk: book for book in self.queryset.filter(pk__in=ids)}
+        return [books[book_id] for book_id in ids if book_id in books]
+
+
+tag_index = TagIndex()
@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from library.admin import EstimatedCountPaginator
+from library.models import Book, Author, Tag
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.tag = Tag.objects.create(title='Classic')
+        self.author = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+
+    def create_books(self, count):
+        for i in range(count):
+            book = Book.objects.create(title=f'Book {i}', pages=i)
+            book.tags.add(self.tag)
+
+    def changelist_queries(self):
+        url = reverse('admin:library_book_changelist')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return len(context.captured_queries)
+
+    def test_book_changelist_queries(self):
+        self.create_books(2)
+        queries = self.changelist_queries()
+        self.create_books(10)
+        self.assertEqual(queries, self.changelist_queries())
+
+    def test_estimated_count(self):
+        self.create_books(7)
+        books = Book.objects.order_by('pk')
+        with mock.patch('library.admin.estimate_count', return_value=3):
+            paginator = EstimatedCountPaginator(books, 2)
+            self.assertEqual(3, paginator.count)
+            # Pages past a low estimate are served and raise the count.
+            page = paginator.page(3)
+            self.assertEqual(['Book 4', 'Book 5'], [book.title for book in page])
+            self.assertEqual(7, paginator.count)
+            self.assertTrue(page.has_next())
+            page = paginator.page(4)
+            self.assertEqual((7, 4, False), (paginator.count, paginator.num_pages, page.has_next()))
+            # Filtered querysets are counted exactly.
+            self.assertEqual(4, EstimatedCountPaginator(books.filter(pages__gte=3), 2).count)
+
+        with mock.patch('library.admin.estimate_count', return_value=100):
+            paginator = EstimatedCountPaginator(books, 2)
+            paginator.page(4)
+            self.assertEqual(7, paginator.count)
+
+    def test_str_without_prefetch(self):
+        self.create_books(1)
+        book = Book.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(f'{book.id} Book 0', str(book))
+        book = Book.objects.prefetch_related('tags').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(f'{book.id} Book 0 , Classic', str(book))
+
+    def test_author_form_does_not_list_books(self):
+        self.create_books(3)
+        self.author.books.add(Book.objects.get(title='Book 1'))
+        response = self.client.get(reverse('admin:library_author_change', args=(self.author.id,)))
+        self.assertContains(response, 'Book 1')
+        self.assertNotContains(response, 'Book 2')
+
+    def test_search(self):
+        self.create_books(3)
+        response = self.client.get(reverse('admin:library_book_changelist'), data={'q': 'book'})
+        self.assertEqual(3, response.context['cl'].result_count)
+
+    def test_autocomplete(self):
+        self.create_books(3)
+        response = self.client.get(reverse('admin:library_book_autocomplete'), data={'term': 'Book 2'})
+        book = Book.objects.get(title='Book 2')
+        self.assertEqual([f'{book.id} Book 2 , Classic'], [result['text'] for result in response.json()['results']])
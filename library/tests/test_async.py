@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_application_model
+
+import DLibrary.urls
+from library.asyncviews import asyncify
+from library.concurrency import query_recorder
+from library.metrics import QueryRecorder, metrics
+from library.models import Book, Author, Tag
+from library.views import BookViewSet
+
+urlpatterns = asyncify(DLibrary.urls.urlpatterns)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTestCase(TransactionTestCase):
+    def setUp(self):
+        user = User.objects.create(username='user1')
+        application = get_application_model().objects.create(
+            name='Test Application', user=user, client_type='confidential', authorization_grant_type='password',
+        )
+        get_access_token_model().objects.create(
+            user=user, scope='read write', expires=timezone.now() + timezone.timedelta(seconds=300),
+            token='secret-access-token-key', application=application,
+        )
+        self.client = AsyncClient()
+        self.tag = Tag.objects.create(title='Novel')
+        self.book = Book.objects.create(title='War and Peace', pages=1225)
+        self.book.tags.add(self.tag)
+
+    async def request(self, method, path, data=None):
+        # AsyncClient of Django 3.1 replaces its headers with these and drops
+        # the data of GET requests, queries go in the path.
+        headers = [(b'host', b'testserver'), (b'authorization', b'Bearer secret-access-token-key')]
+        body = json.dumps(data).encode() if data is not None else b''
+        if data is not None:
+            headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        return await self.client.generic(method.upper(), path, body, 'application/json', headers=headers)
+
+    def get(self, *paths):
+        async def gather():
+            return await asyncio.gather(*[self.request('get', path) for path in paths])
+
+        return async_to_sync(gather)()
+
+    def test_patterns(self):
+        match = resolve(reverse('books-detail', args=(self.book.id,)))
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+        self.assertIs(BookViewSet, match.func.cls)
+        self.assertTrue(match.func.csrf_exempt)
+
+    def test_concurrent_reads(self):
+        # Both requests have to be in the view at the same time to pass.
+        barrier = threading.Barrier(2, timeout=5)
+        retrieve = BookViewSet.retrieve
+
+        def wait_and_retrieve(view, request, *args, **kwargs):
+            barrier.wait()
+            return retrieve(view, request, *args, **kwargs)
+
+        BookViewSet.retrieve = wait_and_retrieve
+        try:
+            responses = self.get(*[reverse('books-detail', args=(self.book.id,))] * 2)
+        finally:
+            BookViewSet.retrieve = retrieve
+        self.assertEqual([200, 200], [response.status_code for response in responses])
+        self.assertEqual('War and Peace', responses[0].json()['title'])
+        self.assertEqual([self.tag.id], responses[1].json()['tags'])
+
+    def test_metrics(self):
+        metrics.clear()
+        response, = self.get(reverse('books-detail', args=(self.book.id,)) + '?expand=tags')
+        self.assertEqual(200, response.status_code)
+        endpoint = metrics._endpoints[('books-detail', 'GET')]
+        self.assertGreater(endpoint.queries.sum, 0)
+        self.assertGreater(endpoint.render_seconds, 0)
+
+    def test_write(self):
+        data = {'title': 'Anna Karenina', 'pages': 864, 'tags': [self.tag.id]}
+        response = async_to_sync(self.request)('post', reverse('books-list'), data)
+        self.assertEqual(201, response.status_code, response.content)
+        self.tag.refresh_from_db()
+        self.assertEqual(2, self.tag.book_count)
+
+
+class ConcurrentPrefetchTestCase(TransactionTestCase):
+    def setUp(self):
+        tag = Tag.objects.create(title='Novel')
+        author = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        for title in ('War and Peace', 'Anna Karenina'):
+            book = Book.objects.create(title=title, pages=100)
+            book.tags.add(tag)
+            author.books.add(book)
+
+    def fetch(self):
+        recorder = QueryRecorder()
+        token = query_recorder.set(recorder)
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                books = list(Book.objects.prefetch_related('tags', 'author_set'))
+        finally:
+            query_recorder.reset(token)
+        self.assertEqual([['Novel'], ['Novel']], [[tag.title for tag in book.tags.all()] for book in books])
+        self.assertEqual(['Leo Tolstoy'] * 2, [author.name for book in books for author in book.author_set.all()])
+        return len(queries), recorder.count
+
+    @override_settings(LIBRARY_ASYNC={'CONCURRENT_PREFETCH': True})
+    def test_concurrent(self):
+        # The authors are fetched by a worker, on its own connection.
+        self.assertEqual((2, 1), self.fetch())
+
+    @override_settings(LIBRARY_ASYNC={'CONCURRENT_PREFETCH': True})
+    def test_transaction(self):
+        with transaction.atomic():
+            self.assertEqual((3, 0), self.fetch())
+
+    def test_disabled(self):
+        self.assertEqual((3, 0), self.fetch())
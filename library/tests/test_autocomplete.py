@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from library.autocomplete import autocomplete_index, fold, get_keys
+from library.models import Book, Author, Tag
+
+
+@override_settings(LIBRARY_CHANGES={'LAG_SECONDS': 0})
+class AutocompleteTestCase(APITransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(LIBRARY_AUTOCOMPLETE={
+            'PATH': directory.name + '/autocomplete', 'BACKGROUND': False, 'SYNC_SECONDS': 0,
+            'KEY_BYTES': 8, 'SCAN_LIMIT': 2, 'TOP_SIZE': 2,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        autocomplete_index.cache.clear()
+        autocomplete_index.reset(None)
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+
+        self.fantasy, self.magic = [Tag.objects.create(title=title) for title in ('Fantasy', 'Magic')]
+        self.rowling = Author.objects.create(name='J. K. Rowling', year_of_birth=1965)
+        self.harari = Author.objects.create(name='Yuval Noah Harari', year_of_birth=1976)
+        self.stone, self.chamber, self.sapiens, self.harbour = [
+            Book.objects.create(title=title, pages=300) for title in (
+                'Harry Potter and the Philosopher’s Stone', 'Harry Potter and the Chamber of Secrets',
+                'Sapiens', 'Harbour Lights',
+            )
+        ]
+        self.stone.tags.set([self.fantasy, self.magic])
+        self.chamber.tags.set([self.fantasy])
+        self.rowling.books.set([self.stone, self.chamber])
+        self.harari.books.set([self.sapiens])
+
+    def build(self):
+        call_command('build_autocomplete', stdout=StringIO())
+
+    def get(self, q, **params):
+        response = self.client.get(reverse('autocomplete'), {'q': q, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        return response.data
+
+    def titles(self, q, **params):
+        return [item['title'] for item in self.get(q, types='books', **params)['books']]
+
+    def test_lookup(self):
+        self.build()
+        data = self.get('har')
+        self.assertEqual(
+            ['Harry Potter and the Philosopher’s Stone', 'Harry Potter and the Chamber of Secrets', 'Harbour Lights'],
+            [item['title'] for item in data['books']],
+        )
+        self.assertEqual([{'id': self.harari.id, 'name': 'Yuval Noah Harari'}], data['authors'])
+        self.assertEqual([], data['tags'])
+        self.assertEqual({'tags'}, set(self.get('MAG', types='tags')))
+        self.assertEqual([self.magic.id], [item['id'] for item in self.get('MAG', types='tags')['tags']])
+        self.assertEqual(['Harry Potter and the Philosopher’s Stone'], self.titles('har', limit=1))
+        # Queries longer than the stored keys are checked on the names.
+        self.assertEqual(['Harry Potter and the Chamber of Secrets'], self.titles('harry potter and the c'))
+        self.assertEqual(['Harry Potter and the Philosopher’s Stone'], self.titles('philosophers st'))
+
+    def test_folding(self):
+        self.build()
+        Author.objects.create(name='Émile Zola', year_of_birth=1840)
+        self.build()
+        self.assertEqual(['Émile Zola'], [item['name'] for item in self.get('emi', types='authors')['authors']])
+        self.assertEqual(['Émile Zola'], [item['name'] for item in self.get('ÉMILE z', types='authors')['authors']])
+
+    def test_saved(self):
+        self.build()
+        book = Book.objects.create(title='Harvest', pages=10)
+        self.chamber.title = 'Chamber of Secrets'
+        self.chamber.save()
+        self.assertEqual(
+            ['Harry Potter and the Philosopher’s Stone', 'Harbour Lights', 'Harvest'], self.titles('har'))
+        self.assertEqual(['Chamber of Secrets'], self.titles('chamber'))
+        book.delete()
+        self.assertEqual(['Harry Potter and the Philosopher’s Stone', 'Harbour Lights'], self.titles('har'))
+
+    def test_changes_feed(self):
+        self.build()
+        # Writes of other processes and counter changes reach us through the feed.
+        Book.objects.filter(pk=self.harbour.pk).update(tag_count=5, updated_at=timezone.now())
+        Book.objects.filter(pk=self.sapiens.pk).update(title='Harmony', updated_at=timezone.now())
+        self.assertEqual(['Harbour Lights', 'Harry Potter and the Philosopher’s Stone'], self.titles('har', limit=2))
+        self.assertIn('Harmony', self.titles('harm'))
+
+    def test_sql_fallback(self):
+        self.assertEqual(
+            ['Harry Potter and the Philosopher’s Stone', 'Harry Potter and the Chamber of Secrets', 'Harbour Lights'],
+            self.titles('Har'),
+        )
+        self.assertEqual(['Yuval Noah Harari'], [item['name'] for item in self.get('har', types='authors')['authors']])
+        # The snapshot was built on the first lookup.
+        self.assertIsNotNone(autocomplete_index.get_snapshot())
+
+    def test_reload(self):
+        self.build()
+        self.assertEqual(3, len(self.titles('har')))
+        Book.objects.filter(pk=self.harbour.pk).delete()
+        self.build()
+        self.assertEqual(2, len(self.titles('har')))
+        self.assertFalse(any(autocomplete_index._overlay.values()))
+
+    def test_other_database(self):
+        self.build()
+        path = os.path.join(autocomplete_index.options['PATH'], 'meta.json')
+        with open(path) as f:
+            meta = json.load(f)
+        with open(path, 'w') as f:
+            json.dump({**meta, 'database': 'other'}, f)
+        autocomplete_index.reset(None)
+        self.assertIsNone(autocomplete_index.get_snapshot())
+
+    def test_invalid(self):
+        url = reverse('autocomplete')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'q': 'a', 'types': 'users'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'q': 'a', 'limit': 100}).status_code)
+
+    def test_anonymous(self):
+        self.build()
+        self.client.force_authenticate(None)
+        self.assertEqual(['books'], list(self.get('har')))
+        response = self.client.get(reverse('autocomplete'), {'q': 'har', 'types': 'books,authors'})
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+class FoldTestCase(SimpleTestCase):
+    def test_fold(self):
+        self.assertEqual('emile oneil', fold("  Émile O'Neil! "))
+        self.assertEqual('strasse', fold('STRAẞE'))
+        self.assertEqual('елка и мир', fold('Ёлка и Мир'))
+        self.assertEqual([b'war and', b'and pea', b'peace'], get_keys('war and peace', 7))
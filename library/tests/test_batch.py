@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+from library.views import BatchGet
+
+
+class IdsFilterTestCase(APITestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(title=f'Book {i}', pages=i) for i in range(4)]
+
+    def test_ids(self):
+        ids = f'{self.books[2].id}, {self.books[0].id}'
+        response = self.client.get(reverse('books-list'), data={'ids': ids})
+        self.assertEqual(['Book 0', 'Book 2'], [row['title'] for row in response.data['results']])
+
+    def test_invalid(self):
+        response = self.client.get(reverse('books-list'), data={'ids': '1,x'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class BatchGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tags = [Tag.objects.create(title=f'Tag {i}') for i in range(3)]
+        self.author = Author.objects.create(name='Author 1', year_of_birth=1900)
+        self.book = Book.objects.create(title='Book 1', pages=10)
+        self.book.tags.set(self.tags[:2])
+
+    def post(self, data):
+        return self.client.post(reverse('batch-get'), data=data, format='json')
+
+    def test_request_order(self):
+        tag_ids = [self.tags[2].id, 0, self.tags[0].id, self.tags[2].id]
+        response = self.post({'tags': tag_ids, 'books': [self.book.id], 'authors': []})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            [self.tags[2].id, 0, self.tags[0].id, self.tags[2].id],
+            [tag['id'] for tag in response.data['tags']],
+        )
+        self.assertEqual({'id': 0, 'not_found': True}, response.data['tags'][1])
+        self.assertEqual('Tag 0', response.data['tags'][2]['title'])
+        self.assertEqual(sorted(tag.id for tag in self.tags[:2]), sorted(response.data['books'][0]['tags']))
+        self.assertEqual([], response.data['authors'])
+
+    def test_one_query_per_chunk(self):
+        ids = [tag.id for tag in self.tags]
+        with self.assertNumQueries(1):
+            self.post({'tags': ids})
+        BatchGet.chunk_size = 2
+        try:
+            with self.assertNumQueries(2):
+                self.post({'tags': ids})
+        finally:
+            BatchGet.chunk_size = 500
+
+    def test_invalid(self):
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post({'shelves': [1]}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post({'tags': ['x']}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post({'tags': list(range(1001))}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post([1]).status_code)
+
+    def test_permissions(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(status.HTTP_200_OK, self.post({'books': [self.book.id]}).status_code)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, self.post({'tags': [self.tags[0].id]}).status_code)
@@ -0,0 +1,123 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from library.models import Book, Tag
+from library.tag_index import tag_index
+
+
+class BulkApiTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag_1 = Tag.objects.create(title='First')
+        self.tag_2 = Tag.objects.create(title='Second')
+        self.book_1 = Book.objects.create(title='Book 1', pages=100)
+        self.book_2 = Book.objects.create(title='Book 2', pages=200)
+        self.book_1.tags.set([self.tag_1])
+
+    def test_create(self):
+        data = [
+            {'title': 'New 1', 'pages': 10, 'tags': [self.tag_1.id, self.tag_2.id]},
+            {'title': 'New 2', 'pages': 20, 'tags': []},
+        ]
+        response = self.client.post(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(['New 1', 'New 2'], [row['title'] for row in response.data])
+        self.assertEqual([self.tag_1.id, self.tag_2.id], sorted(response.data[0]['tags']))
+        book = Book.objects.get(title='New 1')
+        self.assertEqual({self.tag_1.id, self.tag_2.id}, set(book.tags.values_list('id', flat=True)))
+
+    def test_create_single(self):
+        response = self.client.post(reverse('books-list'), data={'title': 'New', 'pages': 1}, format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual('New', response.data['title'])
+
+    def test_create_errors(self):
+        data = [{'title': 'New 1', 'pages': 10}, {'title': 'New 2', 'pages': 'many'}]
+        response = self.client.post(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertIn('pages', response.data[1])
+        self.assertFalse(Book.objects.filter(title='New 1').exists())
+
+    def test_too_many_items(self):
+        data = [{'title': f'New {i}', 'pages': i} for i in range(1001)]
+        response = self.client.post(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(0, Book.objects.filter(title__startswith='New').count())
+
+    def test_update(self):
+        data = [
+            {'id': self.book_1.id, 'pages': 101, 'tags': [self.tag_2.id]},
+            {'id': self.book_2.id, 'title': 'Book 2 revised'},
+        ]
+        response = self.client.patch(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.tag_2.id], response.data[0]['tags'])
+        self.book_1.refresh_from_db()
+        self.book_2.refresh_from_db()
+        self.assertEqual(101, self.book_1.pages)
+        self.assertEqual([self.tag_2], list(self.book_1.tags.all()))
+        self.assertEqual('Book 2 revised', self.book_2.title)
+        self.assertEqual(200, self.book_2.pages)
+
+    def test_update_errors(self):
+        data = [
+            {'id': self.book_1.id, 'pages': 1},
+            {'id': self.book_1.id, 'pages': 2},
+            {'pages': 3},
+            {'id': 0, 'pages': 4},
+        ]
+        response = self.client.patch(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({}, response.data[0])
+        self.assertEqual([['id'], ['id'], ['id']], [list(error) for error in response.data[1:]])
+        self.book_1.refresh_from_db()
+        self.assertEqual(100, self.book_1.pages)
+
+    def test_destroy(self):
+        response = self.client.delete(reverse('books-list'), data=[self.book_1.id, self.book_2.id], format='json')
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertFalse(Book.objects.exists())
+
+    def test_destroy_not_found(self):
+        response = self.client.delete(reverse('books-list'), data=[self.book_1.id, 0], format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(2, Book.objects.count())
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.delete(reverse('books-list'), data=[self.book_1.id], format='json')
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+@override_settings(LIBRARY_TAG_INDEX={'BACKGROUND': False})
+class BulkSignalsTestCase(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(title='First')
+        tag_index.invalidate()
+        tag_index.build()
+
+    def search(self):
+        response = self.client.get(reverse('search_books-list'), data={'tags': self.tag.id})
+        return [row['title'] for row in response.data['results']]
+
+    def test_tag_index_and_cache(self):
+        self.assertEqual([], self.search())
+        data = [{'title': 'New 1', 'pages': 1, 'tags': [self.tag.id]}, {'title': 'New 2', 'pages': 2}]
+        self.client.post(reverse('books-list'), data=data, format='json')
+        self.assertTrue(tag_index.is_warm())
+        self.assertEqual(['New 1'], self.search())
+
+        book_2 = Book.objects.get(title='New 2')
+        data = [{'id': book_2.id, 'tags': [self.tag.id]}]
+        self.client.patch(reverse('books-list'), data=data, format='json')
+        self.assertEqual(['New 1', 'New 2'], self.search())
+
+        self.client.delete(reverse('books-list'), data=[book_2.id], format='json')
+        self.assertEqual(['New 1'], self.search())
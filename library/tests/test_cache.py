@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.tag = Tag.objects.create(title='First')
+        self.book = Book.objects.create(title='Book 1', pages=226)
+
+    def test_list_served_from_cache(self):
+        url = reverse('books-list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_not_modified(self):
+        url = reverse('books-detail', args=(self.book.id,))
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_invalidated_on_save(self):
+        url = reverse('books-detail', args=(self.book.id,))
+        etag = self.client.get(url)['ETag']
+        self.book.title = 'Book 2'
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('Book 2', response.data['title'])
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_invalidated_on_links(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('books-tags', args=(self.book.id,))
+        self.assertEqual([], self.client.get(url).data['results'])
+        self.book.tags.add(self.tag)
+        self.assertEqual([self.tag.id], [tag['id'] for tag in self.client.get(url).data['results']])
+        self.tag.delete()
+        self.assertEqual([], self.client.get(url).data['results'])
+
+    def test_unrelated_write_keeps_entry(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('tags-list')
+        self.client.get(url)
+        self.book.title = 'Book 2'
+        self.book.save()
+        Author.objects.create(name='Author 1', year_of_birth=1903).books.add(self.book)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_query_string_order(self):
+        url = reverse('books-list')
+        self.client.get(url, data={'ordering': 'pages', 'search': 'book'})
+        with self.assertNumQueries(0):
+            self.client.get(url + '?search=book&ordering=pages')
+
+    def test_permissions_checked_before_cache(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('tags-list')
+        self.client.get(url)
+        self.client.force_authenticate(None)
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
@@ -0,0 +1,102 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library import changes
+from library.models import Book, Author, Tag, Tombstone
+
+
+@override_settings(LIBRARY_CHANGES={'LAG_SECONDS': 0})
+class ChangesTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(title='Novel')
+        self.author = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        self.book = Book.objects.create(title='War and Peace', pages=1225)
+
+    def get(self, since=None, **params):
+        if since:
+            params['since'] = since
+        response = self.client.get(reverse('changes'), params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        return response.data
+
+    def events(self, data):
+        return [(event['type'], event['model'], event['id']) for event in data['results']]
+
+    def test_sync(self):
+        data = self.get()
+        self.assertEqual([
+            ('create', 'tag', self.tag.id),
+            ('create', 'author', self.author.id),
+            ('create', 'book', self.book.id),
+        ], self.events(data))
+        self.assertEqual('War and Peace', data['results'][2]['data']['title'])
+        self.assertFalse(data['has_more'])
+        cursor = data['next']
+        self.assertEqual([], self.get(cursor)['results'])
+        self.assertEqual(cursor, self.get(cursor)['next'])
+
+        self.book.tags.add(self.tag)
+        data = self.get(cursor)
+        self.assertEqual({('update', 'book', self.book.id), ('update', 'tag', self.tag.id)}, set(self.events(data)))
+        book = [event for event in data['results'] if event['model'] == 'book'][0]
+        self.assertEqual([self.tag.id], book['data']['tags'])
+        cursor = data['next']
+
+        Book.objects.create(title='Anna Karenina', pages=864)
+        self.author.books.add(self.book)
+        book_id = self.book.id
+        self.book.delete()
+        data = self.get(cursor)
+        self.assertEqual(['create', 'update', 'update', 'delete'], [event['type'] for event in data['results']])
+        self.assertEqual(('delete', 'book', book_id), self.events(data)[-1])
+
+    def test_pages(self):
+        now = timezone.now()
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            # Events at the same instant are ordered by model then id.
+            books = [Book.objects.create(title=f'Book {i}', pages=i) for i in range(5)]
+            Tag.objects.create(title='Drama')
+        seen, cursor = [], None
+        while True:
+            data = self.get(cursor, limit=2)
+            seen += self.events(data)
+            cursor = data['next']
+            if not data['has_more']:
+                break
+        self.assertEqual(9, len(seen))
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual([('create', 'book', book.id) for book in books], seen[3:8])
+
+    def test_bulk_update(self):
+        cursor = self.get()['next']
+        response = self.client.patch(reverse('books-list'), [{'id': self.book.id, 'pages': 1300}], format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([('update', 'book', self.book.id)], self.events(self.get(cursor)))
+
+    @override_settings(LIBRARY_CHANGES={'LAG_SECONDS': 60})
+    def test_lag(self):
+        self.assertEqual([], self.get()['results'])
+
+    def test_invalid(self):
+        response = self.client.get(reverse('changes'), {'since': 'x'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get(reverse('changes'), {'limit': 0})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        old = changes.Event(timezone.now() - timedelta(days=31), 0, 1)
+        response = self.client.get(reverse('changes'), {'since': changes.encode_cursor(old)})
+        self.assertEqual(status.HTTP_410_GONE, response.status_code)
+
+    def test_prune(self):
+        self.tag.delete()
+        Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(1, changes.prune_tombstones())
+        self.assertFalse(Tombstone.objects.exists())
@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from library.models import Book, Author, Tag
+
+
+def use_temporary_snapshots(test_case):
+    # Loads rebuild the autocomplete snapshot, keep it out of the working tree.
+    directory = tempfile.TemporaryDirectory()
+    test_case.addCleanup(directory.cleanup)
+    settings = override_settings(
+        LIBRARY_AUTOCOMPLETE={'PATH': directory.name + '/autocomplete', 'BACKGROUND': False},
+        LIBRARY_RELATED={'PATH': directory.name + '/related'},
+    )
+    settings.enable()
+    test_case.addCleanup(settings.disable)
+
+
+class ImportCatalogTestCase(TestCase):
+    def setUp(self):
+        use_temporary_snapshots(self)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def call(self, *args, **options):
+        call_command('import_catalog', *args, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_import(self):
+        Tag.objects.create(title='Classic')
+        authors = self.write('authors.csv', 'name,year_of_birth\nLeo Tolstoy,1828\nAnton Chekhov,1860\n')
+        books = self.write('books.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'title': 'War and Peace', 'pages': 1225, 'tags': ['Classic', 'Novel'], 'authors': ['Leo Tolstoy']},
+            {'title': 'The Duel', 'pages': 120, 'tags': ['Novel'], 'authors': ['Anton Chekhov', 'Nobody']},
+            {'title': 'Untitled', 'pages': 1},
+        ]))
+        self.call(authors, type='authors')
+        self.call(books, type='books', batch_size=2)
+
+        self.assertEqual(2, Author.objects.count())
+        self.assertEqual(['Classic', 'Novel'], list(Tag.objects.order_by('title').values_list('title', flat=True)))
+        book = Book.objects.get(title='War and Peace')
+        self.assertEqual({'Classic', 'Novel'}, set(book.tags.values_list('title', flat=True)))
+        self.assertEqual(['Leo Tolstoy'], [author.name for author in book.author_set.all()])
+        self.assertEqual(['Anton Chekhov'], [a.name for a in Book.objects.get(title='The Duel').author_set.all()])
+        self.assertEqual(0, Book.objects.get(title='Untitled').tags.count())
+
+    def test_csv_lists(self):
+        books = self.write('books.csv', 'title,pages,tags,authors\nBook 1,10,A|B,\n')
+        self.call(books, type='books')
+        self.assertEqual({'A', 'B'}, set(Book.objects.get().tags.values_list('title', flat=True)))
+
+    def test_invalid_rows(self):
+        authors = self.write('authors.csv', 'name,year_of_birth\nLeo Tolstoy,1828\nAnton Chekhov,\n')
+        with self.assertRaisesMessage(CommandError, 'line 3: year_of_birth is required'):
+            self.call(authors, type='authors')
+        books = self.write('books.ndjson', '{"title": "A", "pages": 1}\n\n{"title": "B", "pages": "many"}\n')
+        with self.assertRaisesMessage(CommandError, "line 3: pages must be an integer, got 'many'"):
+            self.call(books, type='books')
+        books = self.write('books.ndjson', '{"title": "A", "pages": 1}\n{"title": "B",\n')
+        with self.assertRaisesMessage(CommandError, 'line 2: invalid JSON'):
+            self.call(books, type='books')
+
+    def test_rebuilt_after_load(self):
+        books = self.write('books.ndjson', '{"title": "A", "pages": 1}\n{"title": "B"}\n')
+        with mock.patch('library.counters.reconcile') as reconcile, self.assertRaises(CommandError):
+            self.call(books, type='books', batch_size=1)
+        reconcile.assert_not_called()
+        self.assertEqual(['A'], list(Book.objects.values_list('title', flat=True)))
+
+    def test_resume(self):
+        tags = self.write('tags.csv', 'title,description\nA,\nB,\nC,\n')
+        checkpoint = os.path.join(self.directory.name, 'tags.checkpoint')
+        with open(checkpoint, 'w') as f:
+            json.dump({'path': os.path.abspath(tags), 'records': 2}, f)
+        self.call(tags, type='tags', checkpoint=checkpoint)
+        self.assertEqual(['C'], list(Tag.objects.values_list('title', flat=True)))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_resume_pending(self):
+        tags = self.write('tags.csv', 'title,description\nA,\nB,\nC,\n')
+        checkpoint = os.path.join(self.directory.name, 'tags.checkpoint')
+        state = {'path': os.path.abspath(tags), 'records': 0, 'pending': 2, 'last_id': 0}
+        with open(checkpoint, 'w') as f:
+            json.dump(state, f)
+        # The pending batch did not commit.
+        self.call(tags, type='tags', checkpoint=checkpoint)
+        self.assertEqual(['A', 'B', 'C'], list(Tag.objects.order_by('title').values_list('title', flat=True)))
+
+        Tag.objects.filter(title='C').delete()
+        with open(checkpoint, 'w') as f:
+            json.dump({**state, 'last_id': Tag.objects.get(title='A').pk - 1}, f)
+        self.call(tags, type='tags', checkpoint=checkpoint)
+        self.assertEqual(['A', 'B', 'C'], list(Tag.objects.order_by('title').values_list('title', flat=True)))
+
+
+class SeedCatalogTestCase(TestCase):
+    def setUp(self):
+        use_temporary_snapshots(self)
+
+    def seed(self, **options):
+        call_command('seed_catalog', stdout=StringIO(), **options)
+
+    def test_seed(self):
+        self.seed(books=50, authors=10, tags=5, batch_size=20)
+        self.assertEqual((50, 10, 5), (Book.objects.count(), Author.objects.count(), Tag.objects.count()))
+        self.assertEqual(50, Book.objects.filter(author__isnull=False).distinct().count())
+        self.assertGreater(Book.tags.through.objects.count(), 0)
+
+    def test_reproducible(self):
+        self.seed(books=20, authors=5, tags=5, seed=7)
+        first = list(Book.objects.order_by('id').values_list('title', 'pages'))
+        Book.objects.all().delete()
+        self.seed(books=20, authors=5, tags=5, seed=7)
+        self.assertEqual(first, list(Book.objects.order_by('id').values_list('title', 'pages')))
+
+
+class BenchTestCase(TestCase):
+    def setUp(self):
+        use_temporary_snapshots(self)
+        call_command('seed_catalog', books=30, authors=5, tags=5, stdout=StringIO())
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_bench(self):
+        output = os.path.join(self.directory.name, 'results.json')
+        call_command('bench', requests=3, warmup=1, output=output, stdout=StringIO())
+        with open(output) as f:
+            results = json.load(f)
+        self.assertEqual(30, results['meta']['catalog']['books'])
+        for name, result in results['scenarios'].items():
+            self.assertEqual(0, result['errors'], name)
+            self.assertEqual(3, result['requests'])
+        # Writes are rolled back.
+        self.assertEqual(30, Book.objects.count())
+
+    def test_compare(self):
+        baseline = os.path.join(self.directory.name, 'baseline.json')
+        call_command('bench', scenario=['book-detail'], requests=3, warmup=0, output=baseline, stdout=StringIO())
+        with open(baseline) as f:
+            results = json.load(f)
+        results['scenarios']['book-detail']['queries_per_request'] = 0
+        with open(baseline, 'w') as f:
+            json.dump(results, f)
+        with self.assertRaises(CommandError):
+            call_command('bench', scenario=['book-detail'], requests=3, compare=baseline, stdout=StringIO())
+
+
+class CheckQueryPlansTestCase(TestCase):
+    def setUp(self):
+        use_temporary_snapshots(self)
+
+    def test_no_scans(self):
+        call_command('seed_catalog', books=30, authors=5, tags=5, stdout=StringIO())
+        stdout = StringIO()
+        call_command('check_query_plans', fail=True, stdout=stdout)
+        self.assertIn('No sequential scans', stdout.getvalue())
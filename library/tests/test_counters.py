@@ -0,0 +1,111 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library import counters
+from library.models import Book, Author, Tag
+
+
+class CountersTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag_1 = Tag.objects.create(title='First')
+        self.tag_2 = Tag.objects.create(title='Second')
+        self.author = Author.objects.create(name='Author 1', year_of_birth=1900)
+        self.book_1 = Book.objects.create(title='Book 1', pages=1)
+        self.book_2 = Book.objects.create(title='Book 2', pages=2)
+
+    def assertCounts(self, obj, **expected):
+        obj.refresh_from_db()
+        self.assertEqual(expected, {name: getattr(obj, name) for name in expected})
+        self.assertEqual(0, sum(counters.reconcile(fix=False).values()))
+
+    def test_links(self):
+        self.book_1.tags.add(self.tag_1, self.tag_2)
+        self.assertEqual(2, self.book_1.tag_count)
+        self.tag_1.book_set.add(self.book_2)
+        self.assertCounts(self.tag_1, book_count=2)
+        self.assertCounts(self.book_2, tag_count=1)
+        # Removing a link that does not exist changes nothing.
+        self.book_2.tags.remove(self.tag_1, self.tag_2)
+        self.assertCounts(self.tag_2, book_count=1)
+        self.tag_1.book_set.clear()
+        self.assertCounts(self.book_1, tag_count=1)
+        self.author.books.set([self.book_1, self.book_2])
+        self.assertCounts(self.author, book_count=2)
+        self.book_2.author_set.clear()
+        self.assertCounts(self.author, book_count=1)
+        self.assertCounts(self.book_1, author_count=1)
+
+    def test_deletes(self):
+        self.book_1.tags.add(self.tag_1, self.tag_2)
+        self.book_2.tags.add(self.tag_1)
+        self.author.books.add(self.book_1, self.book_2)
+        self.book_2.delete()
+        self.assertCounts(self.tag_1, book_count=1)
+        self.assertCounts(self.author, book_count=1)
+        self.tag_2.delete()
+        self.assertCounts(self.book_1, tag_count=1)
+        self.author.delete()
+        self.assertCounts(self.book_1, author_count=0)
+
+    def test_save_keeps_counters(self):
+        stale = Tag.objects.get(pk=self.tag_1.pk)
+        self.book_1.tags.add(self.tag_1)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertCounts(self.tag_1, book_count=1)
+        self.assertEqual('Renamed', self.tag_1.title)
+
+    def test_bulk(self):
+        response = self.client.post(reverse('books-list'), [
+            {'title': 'Book 3', 'pages': 3, 'tags': [self.tag_1.id, self.tag_2.id]},
+            {'title': 'Book 4', 'pages': 4, 'tags': [self.tag_1.id]},
+        ], format='json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code, response.data)
+        self.assertEqual([2, 1], [book['tag_count'] for book in response.data])
+        ids = [book['id'] for book in response.data]
+        response = self.client.patch(reverse('books-list'), [
+            {'id': ids[0], 'tags': [self.tag_2.id]},
+        ], format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        self.assertEqual(1, response.data[0]['tag_count'])
+        self.assertCounts(self.tag_1, book_count=1)
+        self.assertCounts(self.tag_2, book_count=1)
+
+    def test_read_only(self):
+        response = self.client.patch(reverse('tags-detail', args=(self.tag_1.id,)), {'book_count': 10}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertCounts(self.tag_1, book_count=0)
+
+    def test_order_and_filter(self):
+        self.book_1.tags.add(self.tag_2)
+        self.book_2.tags.add(self.tag_2, self.tag_1)
+        response = self.client.get(reverse('tags-list'), {'ordering': '-book_count'})
+        self.assertEqual([self.tag_2.id, self.tag_1.id], [tag['id'] for tag in response.data['results']])
+        response = self.client.get(reverse('books-list'), {'tag_count__gte': 2})
+        self.assertEqual([self.book_2.id], [book['id'] for book in response.data['results']])
+
+    def test_unlisted_ordering_ignored(self):
+        response = self.client.get(reverse('books-list'), {'ordering': '-id'})
+        self.assertEqual([self.book_1.id, self.book_2.id], [book['id'] for book in response.data['results']])
+        response = self.client.get(reverse('books-list'), {'ordering': '-id,-pages'})
+        self.assertEqual([self.book_2.id, self.book_1.id], [book['id'] for book in response.data['results']])
+
+    def test_reconcile(self):
+        self.book_1.tags.add(self.tag_1)
+        Tag.objects.filter(pk=self.tag_1.pk).update(book_count=5)
+        Book.objects.filter(pk=self.book_2.pk).update(author_count=3)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', dry_run=True, fail=True, stdout=out)
+        self.assertIn('tag.book_count: 1 wrong', out.getvalue())
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounts(self.tag_1, book_count=1)
+        self.assertCounts(self.book_2, author_count=0)
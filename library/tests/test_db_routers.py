@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from library.cache import response_cache
+from library.db_routers import ReplicaRouter, replica_pool
+from library.middleware import ReplicaMiddleware
+from library.models import Book
+
+REPLICAS = {'ALIASES': ['replica'], 'HEALTH_CHECK_INTERVAL': 60}
+
+
+@override_settings(LIBRARY_REPLICAS=REPLICAS)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    def setUp(self):
+        replica_pool.reset()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.routes = []
+        patcher = mock.patch.object(replica_pool, 'check', return_value=True)
+        self.check = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, request, write=False):
+        self.routes.append(self.router.db_for_read(Book))
+        if write:
+            self.routes.append(self.router.db_for_write(Book))
+            self.routes.append(self.router.db_for_read(Book))
+        with transaction.atomic():
+            self.routes.append(self.router.db_for_read(Book))
+        self.routes.append(self.router.db_for_read(User))
+        return HttpResponse()
+
+    def call(self, request, write=False):
+        return ReplicaMiddleware(lambda request: self.view(request, write))(request)
+
+    def test_safe_request_reads_replica(self):
+        self.call(self.factory.get('/books/'))
+        self.assertEqual(['replica', 'default', None], self.routes)
+        self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_write_pins_to_primary(self):
+        response = self.call(self.factory.post('/books/'), write=True)
+        self.assertEqual([None, 'default', None, None, None], self.routes)
+        self.assertEqual(5, response.cookies['library_primary']['max-age'])
+
+        self.routes = []
+        request = self.factory.get('/books/')
+        request.COOKIES['library_primary'] = '1'
+        self.call(request)
+        self.assertEqual([None, None, None], self.routes)
+
+    def test_write_during_safe_request(self):
+        self.call(self.factory.get('/books/'), write=True)
+        self.assertEqual(['replica', 'default', None, None, None], self.routes)
+
+    def test_unhealthy_replica(self):
+        self.check.return_value = False
+        self.call(self.factory.get('/books/'))
+        self.call(self.factory.get('/books/'))
+        self.assertEqual([None, None, None] * 2, self.routes)
+        # The failure is remembered until the next check.
+        self.assertEqual(1, self.check.call_count)
+
+    def test_allow_migrate(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'library'))
+        self.assertIsNone(self.router.allow_migrate('default', 'library'))
+
+    def test_response_cache_timeout(self):
+        # Responses read from a replica may be older than the generation they are stored under.
+        view = mock.Mock(get_cache_models=lambda: ['book'])
+        timeouts = []
+
+        def respond(request):
+            with mock.patch.object(response_cache.cache, 'set', lambda key, value, timeout: timeouts.append(timeout)):
+                response_cache.respond(view, Request(request), lambda: Response({}))
+            return HttpResponse()
+
+        ReplicaMiddleware(respond)(self.factory.get('/books/'))
+        request = self.factory.get('/books/')
+        request.COOKIES['library_primary'] = '1'
+        ReplicaMiddleware(respond)(request)
+        self.assertEqual([5, 300], timeouts)
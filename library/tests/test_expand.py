@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+from library.serializers import TagsSerializer
+
+
+class ExpandTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.tag_1 = Tag.objects.create(title='First')
+        self.tag_2 = Tag.objects.create(title='Second')
+        self.author = Author.objects.create(name='Author 1', year_of_birth=1903)
+
+    def create_books(self, count):
+        for i in range(count):
+            book = Book.objects.create(title=f'Book {i}', pages=100 + i)
+            book.tags.set([self.tag_1, self.tag_2])
+            self.author.books.add(book)
+
+    def test_expand_book(self):
+        self.create_books(1)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('books-list'), data={'expand': 'tags,authors'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        book = response.data['results'][0]
+        tags = Tag.objects.filter(pk__in=[self.tag_1.id, self.tag_2.id]).order_by('id')
+        self.assertEqual(TagsSerializer(tags, many=True).data, book['tags'])
+        self.assertEqual([self.author.id], [author['id'] for author in book['authors']])
+        self.assertEqual(1, len(book['authors'][0]['books']))
+
+    def test_unknown_expand_ignored(self):
+        self.create_books(1)
+        response = self.client.get(reverse('books-list'), data={'expand': 'pages'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(sorted([self.tag_1.id, self.tag_2.id]), sorted(response.data['results'][0]['tags']))
+
+    def test_expand_permissions(self):
+        self.create_books(1)
+        for expand in ('tags', 'authors'):
+            response = self.client.get(reverse('books-list'), data={'expand': expand})
+            self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+            response = self.client.get(reverse('books-detail', args=(Book.objects.get().id,)), data={'expand': expand})
+            self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+        self.assertEqual(status.HTTP_200_OK, self.client.get(reverse('books-list')).status_code)
+
+    def test_book_list_query_count(self):
+        self.create_books(2)
+        self.client.force_authenticate(self.user)
+        # count, page, tags, authors, authors' books
+        with self.assertNumQueries(5):
+            self.client.get(reverse('books-list'), data={'expand': 'tags,authors'})
+        self.create_books(8)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('books-list'), data={'expand': 'tags,authors'})
+        self.assertEqual(10, len(response.data['results']))
+
+    def test_author_list_query_count(self):
+        self.create_books(5)
+        self.client.force_authenticate(self.user)
+        # count, page, books, books' tags
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('authors-list'), data={'expand': 'books'})
+        self.assertEqual(5, len(response.data['results'][0]['books']))
+
+    def test_tag_list_query_count(self):
+        self.create_books(5)
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('tags-list'), data={'expand': 'books'})
+        self.assertEqual(5, len(response.data['results'][0]['books']))
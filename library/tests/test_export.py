@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+from library.views import BookViewSet
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.tag = Tag.objects.create(title='Classic')
+        self.author = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        for i in range(7):
+            book = Book.objects.create(title=f'Book {i}', pages=100 + i)
+            book.tags.add(self.tag)
+            self.author.books.add(book)
+
+    def read(self, response):
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.client.get(reverse('books-export'))
+        self.assertEqual('application/x-ndjson; charset=utf-8', response['Content-Type'])
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(7, len(rows))
+        self.assertEqual(
+            {
+                'id': rows[0]['id'], 'title': 'Book 0', 'pages': 100,
+                'tags': [{'id': self.tag.id, 'title': 'Classic'}],
+                'authors': [{'id': self.author.id, 'name': 'Leo Tolstoy'}],
+            },
+            rows[0],
+        )
+
+    def test_csv(self):
+        response = self.client.get(reverse('books-export'), data={'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(7, len(rows))
+        self.assertEqual('Classic', rows[0]['tags'])
+        self.assertEqual(str(self.author.id), rows[0]['authors_ids'])
+
+    def test_filter_fields(self):
+        response = self.client.get(reverse('books-export'), data={'pages': 103})
+        rows = self.read(response).splitlines()
+        self.assertEqual(['Book 3'], [json.loads(row)['title'] for row in rows])
+
+    def test_chunked_queries(self):
+        BookViewSet.export_chunk_size = 3
+        try:
+            response = self.client.get(reverse('books-export'))
+            # one cursor query plus tags and authors for each of 3 chunks
+            with self.assertNumQueries(7):
+                self.assertEqual(7, len(self.read(response).splitlines()))
+        finally:
+            BookViewSet.export_chunk_size = 2000
+
+    def test_permissions(self):
+        response = self.client.get(reverse('authors-export'))
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('authors-export'))
+        books = json.loads(self.read(response))['books']
+        self.assertEqual(7, len(books))
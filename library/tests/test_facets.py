@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from library import facets
+from library.models import Book, Author, Tag
+from library.tag_index import tag_index
+
+
+class FacetsMixin:
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.novel = Tag.objects.create(title='Novel')
+        self.drama = Tag.objects.create(title='Drama')
+        self.poems = Tag.objects.create(title='Poems')
+        self.tolstoy = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        self.chekhov = Author.objects.create(name='Anton Chekhov', year_of_birth=1860)
+        self.war = Book.objects.create(title='War and Peace', pages=1225)
+        self.anna = Book.objects.create(title='Anna Karenina', pages=864)
+        self.seagull = Book.objects.create(title='The Seagull', pages=80)
+        self.war.tags.set([self.novel])
+        self.anna.tags.set([self.novel, self.drama])
+        self.seagull.tags.set([self.drama, self.poems])
+        self.tolstoy.books.set([self.war, self.anna])
+        self.chekhov.books.set([self.seagull])
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        return response.data['facets']
+
+    def test_catalog(self):
+        facets = self.get(reverse('books-list'), facets='tags,authors')
+        self.assertEqual([
+            {'id': self.novel.id, 'title': 'Novel', 'count': 2},
+            {'id': self.drama.id, 'title': 'Drama', 'count': 2},
+            {'id': self.poems.id, 'title': 'Poems', 'count': 1},
+        ], facets['tags'])
+        self.assertEqual([
+            {'id': self.tolstoy.id, 'name': 'Leo Tolstoy', 'count': 2},
+            {'id': self.chekhov.id, 'name': 'Anton Chekhov', 'count': 1},
+        ], facets['authors'])
+
+    def test_filtered(self):
+        facets = self.get(reverse('books-list'), facets='tags', facet_limit=1, pages=80)
+        self.assertEqual([{'id': self.drama.id, 'title': 'Drama', 'count': 1}], facets['tags'])
+        facets = self.get(reverse('tags-books', args=(self.drama.id,)), facets='authors')
+        self.assertEqual([self.tolstoy.id, self.chekhov.id], [row['id'] for row in facets['authors']])
+
+    def test_search_books(self):
+        url = reverse('search_books-list')
+        facets = self.get(url, tags=f'{self.drama.id},-{self.poems.id}', facets='tags,authors')
+        self.assertEqual([self.novel.id, self.drama.id], sorted(row['id'] for row in facets['tags']))
+        self.assertEqual([{'id': self.tolstoy.id, 'name': 'Leo Tolstoy', 'count': 1}], facets['authors'])
+
+    def test_invalidated(self):
+        url = reverse('books-list')
+        self.get(url, facets='authors')
+        self.chekhov.books.add(self.war)
+        self.assertEqual(2, self.get(url, facets='authors')['authors'][1]['count'])
+
+    def test_invalid(self):
+        url = reverse('books-list')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'facets': 'pages'}).status_code)
+        response = self.client.get(url, {'facets': 'tags', 'facet_limit': 1000})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertNotIn('facets', self.client.get(url).data)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        for name in ('tags', 'authors'):
+            response = self.client.get(reverse('books-list'), {'facets': name})
+            self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+@override_settings(LIBRARY_TAG_INDEX={'AUTO_BUILD': False})
+class SqlFacetsTestCase(FacetsMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        tag_index.invalidate()
+
+    def test_grouped_query(self):
+        # The count, the page, its tags and one grouped query per facet.
+        with self.assertNumQueries(5):
+            self.get(reverse('books-list'), facets='tags,authors', search='Anna')
+
+    @override_settings(LIBRARY_FACETS={'MAX_SQL_BOOKS': 1})
+    def test_too_many_books(self):
+        response = self.client.get(reverse('books-list'), {'facets': 'authors', 'search': 'the'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.client.get(reverse('tags-books', args=(self.drama.id,)), {'facets': 'authors'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    @override_settings(LIBRARY_FACETS={'MAX_SQL_BOOKS': 1})
+    def test_estimated_count(self):
+        url = reverse('tags-books', args=(self.drama.id,))
+        params = {'facets': 'authors', 'cursor': '', 'count': 'estimate'}
+        with mock.patch('library.pagination.estimate_count', return_value=1):
+            response = self.client.get(url, params)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+@override_settings(LIBRARY_TAG_INDEX={'BACKGROUND': False})
+class IndexFacetsTestCase(FacetsMixin, APITransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        tag_index.build()
+
+    def test_counted_from_index(self):
+        self.get(reverse('books-list'), facets='tags')
+        self.assertTrue(tag_index.is_warm())
+        self.assertEqual({self.novel.id: 2, self.drama.id: 2, self.poems.id: 1}, tag_index.count_tags())
+
+    def test_filtered_from_index(self):
+        with CaptureQueriesContext(connection) as context:
+            tags = self.get(reverse('books-list'), facets='tags', pages=80)['tags']
+        self.assertEqual([self.drama.id, self.poems.id], [row['id'] for row in tags])
+        self.assertFalse([query for query in context.captured_queries if 'GROUP BY' in query['sql']])
+
+    @override_settings(LIBRARY_FACETS={'BATCH_SIZE': 1})
+    def test_top_tags(self):
+        with mock.patch.object(tag_index, 'count_tags', wraps=tag_index.count_tags) as count_tags:
+            tags = facets.count_index('tags', None, 'default', 1)
+        self.assertEqual([{'id': self.novel.id, 'title': 'Novel', 'count': 2}], tags)
+        # Poems, on one book, cannot beat a count of 2.
+        self.assertEqual([[self.novel.id], [self.drama.id]], [call.args[1] for call in count_tags.call_args_list])
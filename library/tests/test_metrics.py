@@ -0,0 +1,66 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from library.metrics import Histogram, metrics
+from library.models import Book
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        metrics.clear()
+        self.user = User.objects.create(username='user1')
+        Book.objects.create(title='Book 1', pages=10)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual('text/plain; version=0.0.4; charset=utf-8', response['Content-Type'])
+        return response.content.decode('utf-8').splitlines()
+
+    def test_histogram(self):
+        histogram = Histogram((1, 2))
+        for value in (0, 1, 2, 3):
+            histogram.observe(value)
+        self.assertEqual([('1', 2), ('2', 3), ('+Inf', 4)], list(histogram.samples()))
+        self.assertEqual(6, histogram.sum)
+
+    def test_request_metrics(self):
+        self.client.get(reverse('books-list'))
+        self.client.get(reverse('books-list'))
+        self.client.get(reverse('books-detail', args=(0,)))
+        lines = self.scrape()
+        labels = '{view="books-list",method="GET"}'
+        self.assertIn('library_requests_total{view="books-list",method="GET",status="200"} 2', lines)
+        self.assertIn('library_requests_total{view="books-detail",method="GET",status="404"} 1', lines)
+        self.assertIn(f'library_request_duration_seconds_count{labels} 2', lines)
+        self.assertIn('library_request_duration_seconds_bucket{view="books-list",method="GET",le="+Inf"} 2', lines)
+        # The second request is answered from the response cache.
+        self.assertIn('library_request_queries_bucket{view="books-list",method="GET",le="0"} 1', lines)
+        response_bytes = [line for line in lines if line.startswith(f'library_response_bytes_total{labels}')]
+        self.assertGreater(int(response_bytes[0].split()[1]), 0)
+        self.assertIn(f'library_request_serialize_seconds_count{labels} 1', lines)
+        self.assertIn('library_request_serialize_seconds_count{view="books-detail",method="GET"} 0', lines)
+        self.assertIn('# TYPE library_token_cache_entries gauge', lines)
+        self.assertFalse([line for line in lines if 'view="metrics"' in line])
+
+    @override_settings(LIBRARY_METRICS={'SLOW_REQUEST_SECONDS': 0})
+    def test_slow_request_log(self):
+        with self.assertLogs('library.metrics', 'WARNING') as logs:
+            self.client.get(reverse('books-list'), data={'pages': 10})
+        self.assertIn('Slow request GET /books/?pages=10 (200)', logs.output[0])
+        self.assertIn('library_book', logs.output[0])
+
+    def test_allowed_ips(self):
+        url = reverse('metrics')
+        self.assertEqual(403, self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code)
+        with override_settings(LIBRARY_METRICS={'ALLOWED_IPS': ('10.0.0.0/8',)}):
+            self.assertEqual(200, self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code)
+            self.assertEqual(403, self.client.get(url).status_code)
+        with override_settings(LIBRARY_METRICS={'ALLOWED_IPS': None}):
+            self.assertEqual(200, self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code)
+
+    @override_settings(LIBRARY_METRICS={'ENABLED': False})
+    def test_disabled(self):
+        self.client.get(reverse('books-list'))
+        self.assertFalse([line for line in self.scrape() if 'books-list' in line])
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+
+
+class NestedRoutesTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag_1 = Tag.objects.create(title='First')
+        self.tag_2 = Tag.objects.create(title='Second')
+        self.author = Author.objects.create(name='Author 1', year_of_birth=1900)
+        self.other_author = Author.objects.create(name='Author 2', year_of_birth=1910)
+        self.book_1 = Book.objects.create(title='Book 1', pages=100)
+        self.book_2 = Book.objects.create(title='Book 2', pages=200)
+        self.book_3 = Book.objects.create(title='Book 3', pages=300)
+        self.book_1.tags.set([self.tag_1, self.tag_2])
+        self.book_2.tags.set([self.tag_1])
+        self.author.books.set([self.book_1, self.book_3])
+
+    def titles(self, url, **params):
+        response = self.client.get(url, data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [row.get('title') or row.get('name') for row in response.data['results']]
+
+    def test_tag_books(self):
+        url = reverse('tags-books', args=(self.tag_1.id,))
+        self.assertEqual(['Book 1', 'Book 2'], self.titles(url))
+        self.assertEqual(['Book 2', 'Book 1'], self.titles(url, ordering='-pages'))
+        self.assertEqual(['Book 2'], self.titles(url, search='200'))
+
+    def test_author_books(self):
+        url = reverse('authors-books', args=(self.author.id,))
+        self.assertEqual(['Book 1', 'Book 3'], self.titles(url))
+        response = self.client.get(url, data={'cursor': ''})
+        self.assertEqual(2, len(response.data['results']))
+        self.assertIsNone(response.data['next'])
+
+    def test_book_authors_and_tags(self):
+        self.assertEqual(['Author 1'], self.titles(reverse('books-authors', args=(self.book_1.id,))))
+        self.assertEqual(['First', 'Second'], self.titles(reverse('books-tags', args=(self.book_1.id,))))
+        self.assertEqual([], self.titles(reverse('books-tags', args=(self.book_3.id,))))
+
+    def test_nested_detail(self):
+        url = reverse('books-detail', kwargs={'tag_pk': self.tag_1.id, 'pk': self.book_2.id})
+        self.assertEqual(status.HTTP_200_OK, self.client.get(url).status_code)
+        url = reverse('books-detail', kwargs={'tag_pk': self.tag_2.id, 'pk': self.book_2.id})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(url).status_code)
+
+    def test_invalid_parent(self):
+        url = reverse('books-detail', kwargs={'tag_pk': 'x', 'pk': self.book_2.id})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(url).status_code)
+
+    def test_invalidated_on_links(self):
+        url = reverse('authors-books', args=(self.author.id,))
+        self.assertEqual(['Book 1', 'Book 3'], self.titles(url))
+        self.author.books.remove(self.book_3)
+        self.assertEqual(['Book 1'], self.titles(url))
@@ -0,0 +1,56 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book
+
+
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        # Duplicate titles make the id tie-breaker matter.
+        for i in range(25):
+            Book.objects.create(title=f'Book {i % 12:02}', pages=100 + i)
+        self.expected = list(Book.objects.order_by('title', 'id').values_list('id', flat=True))
+
+    def walk(self, url, data):
+        ids, pages = [], 0
+        response = self.client.get(url, data=data)
+        while True:
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(row['id'] for row in response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return ids, pages, response
+            response = self.client.get(response.data['next'])
+
+    def test_walk_forward(self):
+        ids, pages, response = self.walk(reverse('books-list'), {'cursor': ''})
+        self.assertEqual(self.expected, ids)
+        self.assertEqual(3, pages)
+        self.assertNotIn('count', response.data)
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_walk_backward(self):
+        _, _, response = self.walk(reverse('books-list'), {'cursor': ''})
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(self.expected[10:20], [row['id'] for row in previous.data['results']])
+        first = self.client.get(previous.data['previous'])
+        self.assertEqual(self.expected[:10], [row['id'] for row in first.data['results']])
+        self.assertIsNone(first.data['previous'])
+
+    def test_ordering_param(self):
+        ids, _, _ = self.walk(reverse('books-list'), {'cursor': '', 'ordering': '-pages'})
+        self.assertEqual(list(Book.objects.order_by('-pages', 'id').values_list('id', flat=True)), ids)
+
+    def test_count(self):
+        response = self.client.get(reverse('books-list'), data={'cursor': '', 'count': 'exact'})
+        self.assertEqual(25, response.data['count'])
+
+    def test_cursor_bound_to_ordering(self):
+        response = self.client.get(reverse('books-list'), data={'cursor': ''})
+        response = self.client.get(response.data['next'] + '&ordering=pages')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('books-list'), data={'cursor': 'garbage'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
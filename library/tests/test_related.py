@@ -0,0 +1,113 @@
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+from library.related import related_books
+
+
+class RelatedBooksTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            LIBRARY_RELATED={'PATH': directory.name + '/related', 'K': 3, 'LAG_SECONDS': 0},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        related_books.cache.clear()
+
+        self.novel, self.war, self.russia, self.poems = [
+            Tag.objects.create(title=title) for title in ('Novel', 'War', 'Russia', 'Poems')
+        ]
+        self.tolstoy = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        self.books = [Book.objects.create(title=f'Book {i}', pages=100) for i in range(5)]
+        self.books[0].tags.set([self.novel, self.war, self.russia])
+        self.books[1].tags.set([self.novel, self.war, self.russia])
+        self.books[2].tags.set([self.novel])
+        self.books[3].tags.set([self.poems])
+        self.tolstoy.books.set([self.books[0], self.books[2]])
+
+    def build(self):
+        call_command('build_related', stdout=StringIO())
+
+    def get(self, book, **params):
+        response = self.client.get(reverse('books-related', args=(book.id,)), params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        return [(item['title'], item['score']) for item in response.data]
+
+    def test_related(self):
+        self.build()
+        related = self.get(self.books[0])
+        self.assertEqual(['Book 2', 'Book 1'], [title for title, _ in related])
+        self.assertGreater(related[0][1], 0)
+        self.assertEqual(['Book 0'], [title for title, _ in self.get(self.books[2], limit=1)])
+        self.assertEqual([], self.get(self.books[4]))
+
+    def test_stored_neighbours(self):
+        self.build()
+        model = related_books.get_model()
+        # Books 3 and 4 have no neighbours and take no room.
+        self.assertEqual([0, 2, 4, 6, 6, 6], model.offsets.tolist())
+        self.assertEqual(6, len(model.neighbours))
+        self.assertEqual([(self.books[0].id, model.scores[4])], model.get(self.books[2].id, 1))
+
+    def test_expand_queries(self):
+        self.build()
+        self.client.force_authenticate(User.objects.create(username='user1'))
+        self.get(self.books[0], limit=1)
+        # The book and the related books, each with their tags, authors and author books.
+        with self.assertNumQueries(8):
+            self.assertEqual(1, len(self.get(self.books[0], limit=1, expand='tags,authors')))
+        with self.assertNumQueries(8):
+            self.assertEqual(2, len(self.get(self.books[0], limit=3, expand='tags,authors')))
+
+    def test_sql_fallback(self):
+        self.assertEqual(['Book 1', 'Book 2'], [title for title, _ in self.get(self.books[0])])
+
+    def test_changed_links(self):
+        self.build()
+        self.assertEqual([], self.get(self.books[3]))
+        self.books[3].tags.add(self.novel, self.war)
+        self.assertEqual(['Book 1', 'Book 0'], [title for title, _ in self.get(self.books[3], limit=2)])
+        # Books added after the build are scored from their links.
+        book = Book.objects.create(title='Book 5', pages=10)
+        book.tags.add(self.poems)
+        self.assertEqual(['Book 3'], [title for title, _ in self.get(book)])
+        self.tolstoy.books.clear()
+        self.assertEqual(['Book 1', 'Book 2'], [title for title, _ in self.get(self.books[0])])
+
+    def test_stale(self):
+        self.build()
+        Book.tags.through.objects.bulk_create([
+            Book.tags.through(book=self.books[3], tag=self.novel),
+            Book.tags.through(book=self.books[3], tag=self.war),
+        ])
+        self.assertEqual([], self.get(self.books[3], limit=2))
+        related_books.mark_stale()
+        self.assertEqual(['Book 1', 'Book 0'], [title for title, _ in self.get(self.books[3], limit=2)])
+
+    def test_rebuilt(self):
+        self.build()
+        self.assertEqual(['Book 2', 'Book 1'], [title for title, _ in self.get(self.books[0])])
+        # Cached responses are recomputed from the new model.
+        Book.tags.through.objects.filter(book=self.books[1]).delete()
+        self.build()
+        self.assertEqual(['Book 2'], [title for title, _ in self.get(self.books[0])])
+
+    def test_deleted_book(self):
+        self.build()
+        self.books[1].delete()
+        self.assertEqual(['Book 2'], [title for title, _ in self.get(self.books[0])])
+
+    def test_invalid_limit(self):
+        url = reverse('books-related', args=(self.books[0].id,))
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'limit': 'x'}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.client.get(url, {'limit': 0}).status_code)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(reverse('books-related', args=(0,))).status_code)
@@ -0,0 +1,127 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+
+import msgpack
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from library import compression
+from library.models import Book, Tag
+from library.renderers import ORJSONRenderer
+from library.serializers import BooksSerializer
+
+
+class ORJSONRendererTestCase(APITestCase):
+    def test_same_output(self):
+        tag = Tag.objects.create(title='Роман\u2028\u2029', description='"quoted"\n')
+        book = Book.objects.create(title='Война и мир', pages=1225)
+        book.tags.add(tag)
+        data = {
+            'results': BooksSerializer(Book.objects.all(), many=True).data,
+            'at': datetime(2020, 11, 8, 10, 30, 15, 123456, tzinfo=timezone.utc),
+            'price': Decimal('9.90'),
+            1: [None, True, 0.5, -3],
+        }
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+        self.assertEqual(b'', ORJSONRenderer().render(None))
+
+    def test_fallback(self):
+        data = {'big': 2 ** 70, 'nested': {'a': [1]}}
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+        indented = ORJSONRenderer().render(data, 'application/json; indent=2')
+        self.assertEqual(JSONRenderer().render(data, 'application/json; indent=2'), indented)
+
+    def test_non_finite(self):
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'results': [{'score': value, 'title': None}]})
+        self.assertEqual(b'{"score":null}', ORJSONRenderer().render({'score': None}))
+
+
+class MessagePackTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(title='Book 1', pages=10)
+
+    def test_render(self):
+        response = self.client.get(reverse('books-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual('application/msgpack', response['Content-Type'])
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(json.loads(self.client.get(reverse('books-list')).content), data)
+        response = self.client.get(reverse('books-detail', args=(self.book.id,)), {'format': 'msgpack'})
+        self.assertEqual('Book 1', msgpack.unpackb(response.content, raw=False)['title'])
+
+    def test_parse(self):
+        body = msgpack.packb({'title': 'Book 2', 'pages': 20})
+        response = self.client.post(reverse('books-list'), body, content_type='application/msgpack')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code, response.data)
+        self.assertTrue(Book.objects.filter(title='Book 2').exists())
+        response = self.client.post(reverse('books-list'), b'\xc1', content_type='application/msgpack')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+@override_settings(LIBRARY_COMPRESSION={'MIN_SIZE': 200})
+class CompressionTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        for i in range(10):
+            Book.objects.create(title=f'Book {i}', pages=100 + i)
+
+    def test_gzip(self):
+        url = reverse('books-list')
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(plain.content, gzip.decompress(response.content))
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        self.assertEqual('W/' + plain['ETag'], response['ETag'])
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_small(self):
+        response = self.client.get(reverse('books-list'), {'page_size': 1, 'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(response.content), 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_not_modified_etag(self):
+        url = reverse('books-list')
+        etag = self.client.get(url)['ETag']
+        self.assertTrue(etag.startswith('"'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((status.HTTP_304_NOT_MODIFIED, etag), (response.status_code, response['ETag']))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual((status.HTTP_304_NOT_MODIFIED, 'W/' + etag), (response.status_code, response['ETag']))
+
+    def test_stream(self):
+        url = reverse('books-export')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(plain, gzip.decompress(b''.join(response.streaming_content)))
+
+    @override_settings(LIBRARY_COMPRESSION={'ENABLED': False})
+    def test_disabled(self):
+        response = self.client.get(reverse('books-list'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class ChooseEncodingTestCase(SimpleTestCase):
+    @mock.patch.object(compression, 'get_encodings', return_value=['br', 'gzip'])
+    def test_choose(self, get_encodings):
+        self.assertEqual('br', compression.choose_encoding('gzip, deflate, br'))
+        self.assertEqual('gzip', compression.choose_encoding('br;q=0.5, gzip'))
+        self.assertEqual('gzip', compression.choose_encoding('br;q=0, *'))
+        self.assertIsNone(compression.choose_encoding('identity, deflate'))
+        self.assertIsNone(compression.choose_encoding(None))
@@ -0,0 +1,54 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book
+
+
+class FullTextSearchTestCase(APITestCase):
+    def setUp(self):
+        self.book_1 = Book.objects.create(title='War and Peace', pages=1225)
+        self.book_2 = Book.objects.create(title='Peace of Mind', pages=120)
+        self.book_3 = Book.objects.create(title='Das Café am Rande der Welt', pages=226)
+
+    def search(self, term, **params):
+        response = self.client.get(reverse('books-list'), data={'search': term, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [row['id'] for row in response.data['results']]
+
+    def test_word_prefix(self):
+        self.assertEqual(
+            sorted([self.book_1.id, self.book_2.id]),
+            sorted(self.search('pea')),
+        )
+
+    def test_all_terms_match(self):
+        self.assertEqual([self.book_1.id], self.search('war peace'))
+
+    def test_accent_folding(self):
+        self.assertEqual([self.book_3.id], self.search('cafe'))
+
+    def test_numeric_field(self):
+        self.assertEqual([self.book_2.id], self.search('120'))
+
+    def test_index_follows_updates(self):
+        self.book_2.title = 'Quiet Mind'
+        self.book_2.save()
+        self.assertEqual([self.book_1.id], self.search('peace'))
+        self.book_1.delete()
+        self.assertEqual([], self.search('peace'))
+
+    def test_ordering_param_wins(self):
+        self.assertEqual([self.book_2.id, self.book_1.id], self.search('peace', ordering='pages'))
+
+    def test_cursor_pagination(self):
+        for i in range(15):
+            Book.objects.create(title=f'Peace {i}', pages=i)
+        ids = []
+        response = self.client.get(reverse('books-list'), data={'search': 'peace', 'cursor': ''})
+        while True:
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(17, len(set(ids)))
@@ -17,6 +17,8 @@ class BookSerializerCase(TestCase):
                     ('id', book_1.id),
                     ('title', 'Book 1'),
                     ('pages', 226),
+                    ('tag_count', 0),
+                    ('author_count', 0),
                     ('tags', [])
                 ]),
             OrderedDict(
@@ -24,6 +26,8 @@ class BookSerializerCase(TestCase):
                     ('id', book_2.id),
                     ('title', 'Book 2'),
                     ('pages', 1226),
+                    ('tag_count', 0),
+                    ('author_count', 0),
                     ('tags', [])
                 ])]
         self.assertEqual(expexcted_data, data)
@@ -41,6 +45,7 @@ class AuthorSerializerCase(TestCase):
                     ('id', author_1.id),
                     ('name', 'Author 1'),
                     ('year_of_birth', 1226),
+                    ('book_count', 1),
                     ('books', [author_1.books.get().id]),
                 ]),
             OrderedDict(
@@ -48,6 +53,7 @@ class AuthorSerializerCase(TestCase):
                     ('id', author_2.id),
                     ('name', 'Author 2'),
                     ('year_of_birth', 1926),
+                    ('book_count', 0),
                     ('books', []),
                 ])]
         self.assertEqual(expexcted_data, data)
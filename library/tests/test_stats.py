@@ -0,0 +1,130 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library import stats
+from library.models import Book, Author, Tag, PagesStat
+
+
+@override_settings(LIBRARY_STATS={'BUCKETS': (0, 100, 500)})
+class StatsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.novel, self.poems = Tag.objects.create(title='Novel'), Tag.objects.create(title='Poems')
+        self.tolstoy = Author.objects.create(name='Leo Tolstoy', year_of_birth=1828)
+        self.pushkin = Author.objects.create(name='Alexander Pushkin', year_of_birth=1799)
+        self.war = Book.objects.create(title='War and Peace', pages=1225)
+        self.anna = Book.objects.create(title='Anna Karenina', pages=864)
+        self.ruslan = Book.objects.create(title='Ruslan and Ludmila', pages=90)
+        self.novel.book_set.set([self.war, self.anna])
+        self.ruslan.tags.add(self.poems)
+        self.tolstoy.books.set([self.war, self.anna])
+        self.pushkin.books.add(self.ruslan)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code, response.data)
+        self.assertEqual({'pages': 0, 'decades': 0}, stats.rebuild(fix=False))
+        return response.data
+
+    def get_scope(self, scope, **params):
+        data = self.get(reverse('scope-stats', args=(scope,)), **params)
+        return {item['id']: (item['book_count'], item['pages_sum'], item['histogram']) for item in data['results']}
+
+    def test_catalog(self):
+        data = self.get(reverse('stats'))
+        self.assertEqual([0, 100, 500], data['buckets'])
+        self.assertEqual(
+            {'book_count': 3, 'pages_sum': 2179, 'pages_mean': 2179 / 3, 'histogram': [1, 0, 2]}, data['books'])
+        self.assertEqual(
+            [{'decade': 1790, 'author_count': 1}, {'decade': 1820, 'author_count': 1}], data['authors_by_decade'])
+
+    def test_scopes(self):
+        self.assertEqual({
+            self.tolstoy.id: (2, 2089, [0, 0, 2]),
+            self.pushkin.id: (1, 90, [1, 0, 0]),
+        }, self.get_scope('authors'))
+        self.assertEqual({self.novel.id: (2, 2089, [0, 0, 2])}, self.get_scope('tags', limit=1))
+        empty = Tag.objects.create(title='Empty')
+        tags = self.get_scope('tags', ids=f'{empty.id},{self.poems.id}')
+        self.assertEqual({empty.id: (0, 0, [0, 0, 0]), self.poems.id: (1, 90, [1, 0, 0])}, tags)
+        data = self.get(reverse('scope-stats', args=('tags',)), ids=empty.id)
+        self.assertIsNone(data['results'][0]['pages_mean'])
+        self.assertIsNone(data['next'])
+        data = self.get(reverse('scope-stats', args=('tags',)), limit=1)
+        self.assertEqual(self.novel.id, data['next'])
+        self.assertEqual([self.poems.id], list(self.get_scope('tags', after=data['next'])))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get('/stats/users/').status_code)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(3, self.get(reverse('stats'))['books']['book_count'])
+        for scope in ('authors', 'tags'):
+            response = self.client.get(reverse('scope-stats', args=(scope,)))
+            self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_changes(self):
+        self.war.pages = 400
+        self.war.save()
+        self.assertEqual((2, 1264, [0, 1, 1]), self.get_scope('tags')[self.novel.id])
+        self.anna.tags.remove(self.novel)
+        self.novel.book_set.add(self.ruslan)
+        self.assertEqual((2, 490, [1, 1, 0]), self.get_scope('tags')[self.novel.id])
+        self.pushkin.year_of_birth = 1830
+        self.pushkin.save()
+        self.assertEqual([{'decade': 1820, 'author_count': 1}, {'decade': 1830, 'author_count': 1}],
+                         self.get(reverse('stats'))['authors_by_decade'])
+
+    def test_deletes(self):
+        self.war.delete()
+        self.assertEqual((1, 864, [0, 0, 1]), self.get_scope('authors')[self.tolstoy.id])
+        self.tolstoy.delete()
+        self.novel.delete()
+        self.assertEqual({self.pushkin.id}, set(self.get_scope('authors')))
+        self.assertEqual({self.poems.id}, set(self.get_scope('tags')))
+        self.assertEqual(1, len(self.get(reverse('stats'))['authors_by_decade']))
+
+    def test_single_update(self):
+        book = Book.objects.get(pk=self.war.pk)
+        # Creates the rows of the new bucket.
+        book.pages = 400
+        book.save()
+        book.pages = 1200
+        with CaptureQueriesContext(connection) as context:
+            book.save()
+        statements = [query['sql'] for query in context.captured_queries]
+        # Both buckets of the catalog, the author and the tag in one statement.
+        self.assertEqual(1, len([sql for sql in statements if sql.startswith('UPDATE "library_pagesstat"')]))
+        # The stored pages come from the loaded object.
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT "library_book"."pages"')])
+        self.assertEqual((2, 2064, [0, 0, 2]), self.get_scope('tags')[self.novel.id])
+
+        self.pushkin.year_of_birth = 1825
+        with CaptureQueriesContext(connection) as context:
+            self.pushkin.save()
+        statements = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(1, len([sql for sql in statements if sql.startswith('UPDATE "library_decadestat"')]))
+        self.assertEqual([{'decade': 1820, 'author_count': 2}], self.get(reverse('stats'))['authors_by_decade'])
+
+    def test_bulk_update(self):
+        data = [{'id': self.war.id, 'pages': 50}, {'id': self.ruslan.id, 'tags': [self.novel.id]}]
+        response = self.client.patch(reverse('books-list'), data=data, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 1004, [2, 0, 1]), self.get_scope('tags')[self.novel.id])
+
+    def test_rebuild(self):
+        PagesStat.objects.filter(scope='tag').delete()
+        Book.objects.filter(pk=self.war.pk).update(pages=10)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stats', '--dry-run', '--fail', stdout=StringIO())
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual((2, 874, [1, 0, 1]), self.get_scope('tags')[self.novel.id])
@@ -0,0 +1,125 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from library.models import Book, Tag
+import numpy as np
+
+from library.tag_index import bitmap_from_ids, compact, iter_ids, tag_index
+
+
+class BitmapTestCase(APITestCase):
+    def test_iter_ids(self):
+        ids = [0, 3, 7, 8, 4095 * 8, 100000]
+        bitmap = bitmap_from_ids(ids)
+        self.assertEqual(ids, list(iter_ids(bitmap)))
+        self.assertEqual(ids[3:], list(iter_ids(bitmap, offset=3)))
+        self.assertEqual(ids[5:], list(iter_ids(bitmap, offset=5, block_size=16)))
+
+    def test_compact(self):
+        # A rare tag on a book with a high id keeps its ids, not a bitmap.
+        sparse = compact(np.array([5, 100000]), 100001)
+        self.assertEqual([5, 100000], sparse.tolist())
+        dense = compact(np.arange(0, 100000, 10), 100001)
+        self.assertEqual(bitmap_from_ids(range(0, 100000, 10)), dense)
+        self.assertEqual([5, 100000], compact(bitmap_from_ids([5, 100000]), 100001).tolist())
+
+
+class TagSearchMixin:
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag_1 = Tag.objects.create(title='First')
+        self.tag_2 = Tag.objects.create(title='Second')
+        self.tag_3 = Tag.objects.create(title='Third')
+        self.book_1 = Book.objects.create(title='Book 1', pages=1)
+        self.book_2 = Book.objects.create(title='Book 2', pages=2)
+        self.book_3 = Book.objects.create(title='Book 3', pages=3)
+        self.book_1.tags.set([self.tag_1, self.tag_2])
+        self.book_2.tags.set([self.tag_1])
+        self.book_3.tags.set([self.tag_2, self.tag_3])
+
+    def search(self, tags, match='any'):
+        response = self.client.get(reverse('search_books-list'), data={'tags': tags, 'match': match})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [row['id'] for row in response.data['results']], response.data['count']
+
+    def check_results(self):
+        t1, t2, t3 = self.tag_1.id, self.tag_2.id, self.tag_3.id
+        b1, b2, b3 = self.book_1.id, self.book_2.id, self.book_3.id
+        self.assertEqual(([b1, b2, b3], 3), self.search(f'{t1},{t2}'))
+        self.assertEqual(([b1], 1), self.search(f'{t1},{t2}', match='all'))
+        self.assertEqual(([b2], 1), self.search(f'{t1},-{t2}'))
+        self.assertEqual(([b2], 1), self.search(f'-{t2}'))
+        self.assertEqual(([], 0), self.search(f'{t1},{t3}', match='all'))
+
+
+@override_settings(LIBRARY_TAG_INDEX={'AUTO_BUILD': False})
+class SqlTagSearchTestCase(TagSearchMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        tag_index.invalidate()
+
+    def test_search(self):
+        self.check_results()
+        self.assertFalse(tag_index.is_warm())
+
+    def test_invalid(self):
+        response = self.client.get(reverse('search_books-list'), data={'tags': 'x'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.get(reverse('search_books-list'), data={'tags': '1', 'match': 'some'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+@override_settings(LIBRARY_TAG_INDEX={'BACKGROUND': False})
+class IndexTagSearchTestCase(TagSearchMixin, APITransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        tag_index.build()
+
+    def test_search(self):
+        self.check_results()
+        self.assertTrue(tag_index.is_warm())
+
+    def test_incremental_updates(self):
+        book_4 = Book.objects.create(title='Book 4', pages=4)
+        book_4.tags.add(self.tag_3)
+        self.tag_3.book_set.add(self.book_2)
+        self.book_1.tags.remove(self.tag_2)
+        self.book_3.delete()
+        self.assertTrue(tag_index.is_warm())
+        self.assertEqual(([self.book_2.id, book_4.id], 2), self.search(f'{self.tag_3.id}'))
+        self.assertEqual(([], 0), self.search(f'{self.tag_2.id}'))
+        self.book_2.tags.clear()
+        self.assertEqual(([book_4.id], 1), self.search(f'{self.tag_3.id}'))
+
+    def test_foreign_version_goes_cold(self):
+        tag_index.cache.incr(tag_index.version_key)
+        self.assertFalse(tag_index.is_warm())
+        self.check_results()
+        self.assertTrue(tag_index.is_warm())
+
+    def test_sparse_tags(self):
+        Book.objects.bulk_create([Book(title=f'Bulk {i}', pages=i) for i in range(200)])
+        self.tag_2.book_set.add(*Book.objects.filter(title__startswith='Bulk'))
+        tag_index.build()
+        self.assertIsInstance(tag_index._tags[self.tag_3.id], np.ndarray)
+        self.assertIsInstance(tag_index._tags[self.tag_2.id], int)
+        self.book_2.tags.add(self.tag_3)
+        self.assertIsInstance(tag_index._tags[self.tag_3.id], np.ndarray)
+        t1, t2, t3 = self.tag_1.id, self.tag_2.id, self.tag_3.id
+        self.assertEqual(([self.book_3.id], 1), self.search(f'{t2},{t3}', match='all'))
+        self.assertEqual(([self.book_2.id], 1), self.search(f'{t1},{t3}', match='all'))
+        self.assertEqual(([self.book_2.id], 1), self.search(f'{t3},-{t2}'))
+        self.assertEqual(203, self.search(f'{t2},{t3}')[1])
+
+    def test_pagination(self):
+        books = [Book(title=f'Bulk {i}', pages=i) for i in range(25)]
+        for book in books:
+            book.save()
+            book.tags.add(self.tag_3)
+        response = self.client.get(reverse('search_books-list'), data={'tags': self.tag_3.id, 'page': 3})
+        self.assertEqual(26, response.data['count'])
+        self.assertEqual([book.id for book in books[-6:]], [row['id'] for row in response.data['results']])
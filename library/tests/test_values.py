@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from library.models import Book, Author, Tag
+from library.serializers import BooksSerializer, AuthorsSerializer, TagsSerializer
+
+
+class ValuesListTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user1')
+        self.client.force_authenticate(self.user)
+        self.tag_1 = Tag.objects.create(title='First', description='one')
+        self.tag_2 = Tag.objects.create(title='Second', description='two')
+        self.author = Author.objects.create(name='Author 1', year_of_birth=1900)
+        for i in range(12):
+            book = Book.objects.create(title=f'Book {i:02}', pages=100 + i)
+            book.tags.set([self.tag_1, self.tag_2][:i % 3])
+            if i % 2:
+                self.author.books.add(book)
+
+    def get(self, name, **params):
+        response = self.client.get(reverse(name), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.data
+
+    def test_same_representation(self):
+        with mock.patch.object(Book, 'from_db', side_effect=AssertionError('instance built')):
+            data = self.get('books-list')
+        self.assertEqual(BooksSerializer(Book.objects.all()[:10], many=True).data, data['results'])
+        self.assertEqual(AuthorsSerializer(Author.objects.all(), many=True).data, self.get('authors-list')['results'])
+        self.assertEqual(TagsSerializer(Tag.objects.order_by('id'), many=True).data, self.get('tags-list')['results'])
+
+    def test_sparse_fields(self):
+        data = self.get('books-list', fields='title,tags,unknown')
+        self.assertEqual({'title': 'Book 02', 'tags': [self.tag_1.id, self.tag_2.id]}, data['results'][2])
+
+    def test_sparse_fields_detail(self):
+        book = Book.objects.get(title='Book 00')
+        response = self.client.get(reverse('books-detail', args=(book.id,)), data={'fields': 'id,pages'})
+        self.assertEqual({'id': book.id, 'pages': 100}, response.data)
+
+    def test_keyset(self):
+        titles = []
+        data = self.get('books-list', fields='title', ordering='-pages', cursor='')
+        titles += [row['title'] for row in data['results']]
+        self.client.credentials()
+        response = self.client.get(data['next'])
+        titles += [row['title'] for row in response.data['results']]
+        self.assertEqual([f'Book {i:02}' for i in reversed(range(12))], titles)
+
+    def test_expand_uses_instances(self):
+        data = self.get('books-list', expand='tags', fields='title,tags')
+        tag = {'id': self.tag_1.id, 'title': 'First', 'description': 'one', 'book_count': 8}
+        self.assertEqual({'title': 'Book 01', 'tags': [tag]}, data['results'][1])
+
+    def test_queries(self):
+        # count, page and the tag ids of the page
+        with self.assertNumQueries(3):
+            self.get('books-list')
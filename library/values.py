@@ -0,0 +1,131 @@
+"""
+Fast read path for list endpoints.
+
+When every field of a serializer is a plain column or the primary keys of
+a forward M2M relation, a page is read with ``QuerySet.values()`` and turned
+into the serializer's representation without building model instances or
+walking the field objects row by row. M2M ids are aggregated in SQL with
+``ArrayAgg`` on Postgres and fetched with one query per relation on other
+backends. The output is the same JSON the serializer produces, with the
+ids of each relation in ascending order.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+
+# Fields whose representation of a database value is the value itself.
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField)
+
+
+class Relation:
+    """
+    The primary keys of a forward M2M relation.
+    """
+
+    def __init__(self, field):
+        self.through = field.remote_field.through
+        self.source = f'{field.m2m_field_name()}_id'
+        self.target = f'{field.m2m_reverse_field_name()}_id'
+
+    def subquery(self):
+        from django.contrib.postgres.aggregates import ArrayAgg
+
+        links = self.through.objects.filter(**{self.source: OuterRef('pk')}).order_by()
+        links = links.values(self.source).annotate(ids=ArrayAgg(self.target, ordering=self.target))
+        return Subquery(links.values('ids'))
+
+    def fetch(self, ids, using):
+        links = defaultdict(list)
+        rows = self.through.objects.using(using).filter(**{f'{self.source}__in': ids})
+        for source_id, target_id in rows.order_by(self.target).values_list(self.source, self.target):
+            links[source_id].append(target_id)
+        return links
+
+
+class ValuesPlan:
+    """
+    How to build the representation of ``serializer`` from ``values()`` rows.
+    """
+
+    def __init__(self, model, columns, relations):
+        self.model = model
+        self.columns = columns
+        self.relations = relations
+
+    def get_queryset(self, queryset, extra=()):
+        """
+        Returns ``queryset`` as ``values()`` rows holding the columns of the
+        plan, the primary key and ``extra`` (e.g. the ordering fields).
+        """
+        pk = self.model._meta.pk.attname
+        names = [pk]
+        for name in [column for _, column, _ in self.columns] + list(extra):
+            if name not in names:
+                names.append(name)
+        queryset = queryset.prefetch_related(None)
+        if self.relations and connections[queryset.db].vendor == 'postgresql':
+            queryset = queryset.annotate(**{
+                self.relation_key(name): relation.subquery() for name, relation in self.relations
+            })
+            names += [self.relation_key(name) for name, _ in self.relations]
+        return queryset.values(*names)
+
+    @staticmethod
+    def relation_key(name):
+        return f'_values_{name}'
+
+    def represent(self, rows, using):
+        rows = list(rows)
+        pk = self.model._meta.pk.attname
+        relations = []
+        for name, relation in self.relations:
+            if connections[using].vendor == 'postgresql':
+                key = self.relation_key(name)
+                relations.append((name, lambda row, key=key: row[key] or []))
+            else:
+                links = relation.fetch([row[pk] for row in rows], using)
+                relations.append((name, lambda row, links=links: links.get(row[pk], [])))
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, field in self.columns:
+                value = row[column]
+                item[name] = value if field is None or value is None else field.to_representation(value)
+            for name, get_ids in relations:
+                item[name] = get_ids(row)
+            data.append(item)
+        return data
+
+
+def get_plan(serializer):
+    """
+    Returns the ``ValuesPlan`` of a ``ModelSerializer``, or ``None`` when one
+    of its fields needs model instances.
+    """
+    model = serializer.Meta.model
+    columns, relations = [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if '.' in field.source or field.source == '*':
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if isinstance(field, ManyRelatedField):
+            child = field.child_relation
+            if not isinstance(child, PrimaryKeyRelatedField) or child.pk_field or not model_field.many_to_many \
+                    or model_field.auto_created:
+                return None
+            relations.append((name, Relation(model_field)))
+        elif model_field.concrete and not model_field.is_relation and not isinstance(field, serializers.Serializer):
+            converter = None if type(field) in IDENTITY_FIELDS else field
+            columns.append((name, model_field.attname, converter))
+        else:
+            return None
+    return ValuesPlan(model, columns, relations)
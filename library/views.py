@@ -1,75 +1,464 @@
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
-from library.models import Book, Author, Tag
+from library import autocomplete, changes, stats
+from library.cache import cache_response
+from library.filters import FullTextSearchFilter, IdsFilter, parse_ids
+from library.mixins import (
+    BulkMixin, CacheResponseMixin, ExpandMixin, ExportMixin, FacetMixin, NestedMixin, ValuesListMixin,
+    check_list_permissions, get_list_view, has_list_permission,
+)
+from library.models import Book, Author, Tag, Tombstone
+from library.pagination import KeysetPagination
+from library.related import related_books
 from library.serializers import BooksSerializer, AuthorsSerializer, TagsSerializer
+from library.tag_index import TagSearchResult, tag_index
 
 
-class BookViewSet(ModelViewSet):
+class BookViewSet(BulkMixin, CacheResponseMixin, NestedMixin, ExpandMixin, ExportMixin, FacetMixin,
+                  ValuesListMixin, ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BooksSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IdsFilter, FullTextSearchFilter, OrderingFilter]
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_fields = ['title', 'pages']
-    search_fields = ['title', 'pages']
-    order_fields = ['title', 'pages']
+    pagination_class = KeysetPagination
+    filter_fields = {
+        'title': ['exact'],
+        'pages': ['exact'],
+        'tag_count': ['exact', 'gte', 'lte'],
+        'author_count': ['exact', 'gte', 'lte'],
+    }
+    search_fields = ['@title', 'pages']
+    ordering_fields = ['title', 'pages', 'tag_count', 'author_count']
+    prefetch = ('tags',)
+    expand_prefetch = {
+        'tags': ('tags',),
+        'authors': ('author_set', 'author_set__books'),
+    }
+    parent_lookups = {
+        'tag_pk': 'tags',
+        'author_pk': 'author',
+    }
+    cache_models = ('book', 'book_tags', 'author_books')
+    cache_expand_models = {
+        'tags': ('tag',),
+        'authors': ('author',),
+    }
+    cache_facet_models = {
+        'tags': ('tag',),
+        'authors': ('author',),
+    }
+    cache_action_models = {
+        'related': ('related',),
+    }
+    related_limit = 10
+    related_max_limit = 50
+
+    def get_expand_viewsets(self):
+        return {'tags': TagViewSet, 'authors': AuthorViewSet}
+
+    def get_facet_viewsets(self):
+        return {'tags': TagViewSet, 'authors': AuthorViewSet}
 
     @action(detail=True, methods=["GET"])
-    def authors(self, request, pk=None, tag_pk=None):
-        book = self.get_object()
-        authors = Author.objects.filter(books=book)
-        serializer = AuthorsSerializer(authors, many=True)
-        return Response(serializer.data, status=200)
+    def authors(self, request, *args, **kwargs):
+        return self.list_nested(AuthorViewSet, 'book_pk')
+
+    @action(detail=True, methods=["GET"])
+    def tags(self, request, *args, **kwargs):
+        return self.list_nested(TagViewSet, 'book_pk')
 
     @action(detail=True, methods=["GET"])
-    def tags(self, request, pk=None, author_pk=None):
+    @cache_response
+    def related(self, request, *args, **kwargs):
+        """
+        ``?limit=`` books sharing the most tags and authors with this one,
+        best first, each with its similarity ``score``.
+        """
         book = self.get_object()
-        tags = Tag.objects.filter(book=book)
-        serializer = TagsSerializer(tags, many=True)
-        return Response(serializer.data, status=200)
+        limit = self.get_related_limit()
+        related = related_books.get(book.pk, limit, using=book._state.db, updated_at=book.updated_at)
+        books = self.get_queryset().using(book._state.db).in_bulk([pk for pk, _ in related])
+        # Books deleted since the model was built are skipped.
+        related = [(books[pk], score) for pk, score in related if pk in books]
+        data = self.get_serializer([book for book, _ in related], many=True).data
+        return Response([{**item, 'score': round(score, 6)} for item, (_, score) in zip(data, related)])
 
+    def get_related_limit(self):
+        value = self.request.query_params.get('limit', self.related_limit)
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        if not 1 <= limit <= self.related_max_limit:
+            raise ValidationError({'limit': [f'Expected a number from 1 to {self.related_max_limit}.']})
+        return limit
 
-class AuthorViewSet(ModelViewSet):
+
+class AuthorViewSet(BulkMixin, CacheResponseMixin, NestedMixin, ExpandMixin, ExportMixin, ValuesListMixin,
+                    ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorsSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, IdsFilter, FullTextSearchFilter, OrderingFilter]
     permission_classes = [IsAuthenticated]
-    search_fields = ['name', 'year_of_birth']
-    order_fields = ['name', 'year_of_birth']
-    filter_fields = ['name', 'year_of_birth', 'books']
+    pagination_class = KeysetPagination
+    search_fields = ['@name', 'year_of_birth']
+    ordering_fields = ['name', 'year_of_birth', 'book_count']
+    filter_fields = {
+        'name': ['exact'],
+        'year_of_birth': ['exact'],
+        'books': ['exact'],
+        'book_count': ['exact', 'gte', 'lte'],
+    }
+    prefetch = ('books',)
+    expand_prefetch = {
+        'books': ('books', 'books__tags'),
+    }
+    parent_lookups = {
+        'book_pk': 'books',
+    }
+    cache_models = ('author', 'author_books')
+    cache_expand_models = {
+        'books': ('book', 'book_tags'),
+    }
+
+    def get_expand_viewsets(self):
+        return {'books': BookViewSet}
 
     @action(detail=True, methods=["GET"])
-    def books(self, request, pk=None,):
-        author = self.get_object()
-        books = Book.objects.filter(author=author,)
-        serializer = BooksSerializer(books, many=True)
-        return Response(serializer.data, status=200)
+    def books(self, request, *args, **kwargs):
+        return self.list_nested(BookViewSet, 'author_pk')
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(BulkMixin, CacheResponseMixin, NestedMixin, ExpandMixin, ExportMixin, ValuesListMixin,
+                 ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
+    filter_backends = [DjangoFilterBackend, IdsFilter, FullTextSearchFilter, OrderingFilter]
     permission_classes = [IsAuthenticated]
+    filter_fields = {
+        'book_count': ['exact', 'gte', 'lte'],
+    }
+    search_fields = ['title']
+    ordering = ['id']
+    expand_prefetch = {
+        'books': ('book_set', 'book_set__tags'),
+    }
+    parent_lookups = {
+        'book_pk': 'book',
+    }
+    cache_models = ('tag', 'book_tags')
+    cache_expand_models = {
+        'books': ('book', 'author_books'),
+    }
+
+    def get_expand_viewsets(self):
+        return {'books': BookViewSet}
 
     @action(detail=True, methods=["GET"])
-    def books(self, request, pk=None):
-        tag = self.get_object()
-        books = Book.objects.filter(tags=tag)
-        serializer = BooksSerializer(books, many=True)
-        return Response(serializer.data, status=200)
+    def books(self, request, *args, **kwargs):
+        return self.list_nested(BookViewSet, 'tag_pk')
 
 
-class SearchBooks(ModelViewSet):
+class SearchBooks(FacetMixin, ModelViewSet):
+    """
+    ``?tags=1,2,-4&match=all|any`` returns the books having all (or any) of
+    the listed tags and none of the negated ones, ordered by id. Answered
+    from the in-memory tag index, or from SQL while the index is cold.
+    ``?facets=tags,authors`` counts the matching books per tag and author.
+    """
     serializer_class = BooksSerializer
 
     def get_queryset(self):
-        queryset = Book.objects.all()
-        tags = self.request.query_params.get('tags', None)
-        if tags:
-            tags = tags.split(',')
-            queryset = Book.objects.filter(tags__in=tags)
-        return queryset
+        return Book.objects.prefetch_related('tags')
+
+    def get_facet_viewsets(self):
+        return {'tags': TagViewSet, 'authors': AuthorViewSet}
+
+    def list(self, request, *args, **kwargs):
+        tags = request.query_params.get('tags', None)
+        if not tags:
+            return super().list(request, *args, **kwargs)
+        include, exclude = self.parse_tags(tags)
+        match = request.query_params.get('match', 'any')
+        if match not in ('all', 'any'):
+            raise ValidationError({'match': 'Expected "all" or "any".'})
+
+        bitmap = tag_index.query(include, exclude, match_all=match == 'all')
+        queryset = self.filter_by_tags(self.get_queryset(), include, exclude, match == 'all')
+        books = queryset if bitmap is None else TagSearchResult(bitmap, self.get_queryset())
+        page = self.paginate_queryset(books)
+        serializer = self.get_serializer(page, many=True)
+        return self.add_facets(self.get_paginated_response(serializer.data), queryset, bitmap)
+
+    @staticmethod
+    def parse_tags(tags):
+        include, exclude = [], []
+        for tag in tags.split(','):
+            tag = tag.strip()
+            try:
+                tag_id = int(tag)
+            except ValueError:
+                raise ValidationError({'tags': 'Expected comma separated tag ids.'})
+            if tag.startswith('-'):
+                exclude.append(-tag_id)
+            else:
+                include.append(tag_id)
+        return include, exclude
+
+    @staticmethod
+    def filter_by_tags(queryset, include, exclude, match_all):
+        if match_all:
+            for tag_id in include:
+                queryset = queryset.filter(tags=tag_id)
+        elif include:
+            queryset = queryset.filter(id__in=Book.tags.through.objects.filter(
+                tag_id__in=include).values('book_id'))
+        if exclude:
+            queryset = queryset.exclude(id__in=Book.tags.through.objects.filter(
+                tag_id__in=exclude).values('book_id'))
+        return queryset.order_by('id')
+
+
+class BatchGet(APIView):
+    """
+    ``POST /batch/get`` with ``{"books": [1, 2], "tags": [3]}`` returns the
+    objects of every list in request order, read with one ``IN`` query per
+    model and chunk. Missing ids are answered with
+    ``{"id": ..., "not_found": true}``. Each list is serialized and
+    authorized by the viewset of its model.
+    """
+    viewsets = {
+        'books': BookViewSet,
+        'authors': AuthorViewSet,
+        'tags': TagViewSet,
+    }
+    permission_classes = []
+    max_ids = 1000
+    chunk_size = 500
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, dict):
+            raise ValidationError({'non_field_errors': ['Expected an object of id lists.']})
+        unknown = set(request.data) - set(self.viewsets)
+        if unknown:
+            raise ValidationError({name: ['Unknown type.'] for name in sorted(unknown)})
+        requested = {name: parse_ids(ids, self.max_ids, name) for name, ids in request.data.items()}
+        return Response({name: self.get_objects(name, ids) for name, ids in requested.items()})
+
+    def get_objects(self, name, ids):
+        # A batch is a read: authorize it like a list of the viewset.
+        view = get_list_view(self.request, self.viewsets[name])
+        view.check_permissions(view.request)
+        queryset = view.get_queryset()
+        unique_ids = list(dict.fromkeys(ids))
+        found = {}
+        for start in range(0, len(unique_ids), self.chunk_size):
+            chunk = unique_ids[start:start + self.chunk_size]
+            found.update((obj.pk, obj) for obj in queryset.filter(pk__in=chunk).order_by())
+        data = dict(zip(found, view.get_serializer(list(found.values()), many=True).data))
+        return [data[pk] if pk in data else {'id': pk, 'not_found': True} for pk in ids]
+
+
+class Changes(APIView):
+    """
+    ``GET /changes/?since=<cursor>&limit=`` returns the books, authors and
+    tags created, updated or deleted after ``since`` (from the start without
+    it), oldest first, with the cursor to pass next time. Updates carry the
+    representation of the object's viewset; deletes only the id.
+    """
+    viewsets = {
+        'book': BookViewSet,
+        'author': AuthorViewSet,
+        'tag': TagViewSet,
+    }
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        options = changes.get_options()
+        since = changes.decode_cursor(request.query_params.get('since'))
+        try:
+            limit = int(request.query_params.get('limit', options['PAGE_SIZE']))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        if not 1 <= limit <= options['MAX_PAGE_SIZE']:
+            raise ValidationError({'limit': [f'Expected a number from 1 to {options["MAX_PAGE_SIZE"]}.']})
+        events, has_more = changes.read(since, limit)
+
+        objects = {}
+        for index, source in enumerate(changes.SOURCES):
+            pks = [event.pk for event in events if event.source == index]
+            if pks:
+                objects[index] = self.get_objects(source, pks)
+        results = []
+        for event in events:
+            results.append(self.get_event(event, since, objects[event.source].get(event.pk)))
+        return Response({
+            'results': [result for result in results if result is not None],
+            'next': changes.encode_cursor(events[-1]) if events else request.query_params.get('since'),
+            'has_more': has_more,
+        })
+
+    def get_objects(self, source, pks):
+        if source.model is Tombstone:
+            return Tombstone.objects.in_bulk(pks)
+        view = self.viewsets[source.name](request=self.request, args=(), kwargs={}, format_kwarg=None, action='list')
+        instances = view.get_queryset().order_by().in_bulk(pks)
+        data = view.get_serializer(list(instances.values()), many=True).data
+        return {pk: (instance, item) for (pk, instance), item in zip(instances.items(), data)}
+
+    @staticmethod
+    def get_event(event, since, obj):
+        if obj is None:
+            # Deleted between reading the event and the object.
+            return None
+        if isinstance(obj, Tombstone):
+            return {'type': 'delete', 'model': obj.model, 'id': obj.object_id, 'timestamp': obj.deleted_at}
+        instance, data = obj
+        created = since is None or changes.Event(instance.created_at, event.source, instance.pk) > since
+        return {
+            'type': 'create' if created else 'update',
+            'model': instance._meta.model_name,
+            'id': instance.pk,
+            'timestamp': instance.updated_at,
+            'data': data,
+        }
+
+
+class Autocomplete(APIView):
+    """
+    ``GET /autocomplete/?q=har&types=books,authors,tags&limit=5`` returns,
+    for every requested type (all by default), the most popular objects
+    with a name starting with ``q``, or with one of its words doing so,
+    ignoring case and accents. See ``library.autocomplete``.
+
+    Each type is authorized like a list of its viewset: requested types
+    the client may not list are refused, the ones it may not list are left
+    out of the default.
+    """
+    viewsets = {
+        'books': BookViewSet,
+        'authors': AuthorViewSet,
+        'tags': TagViewSet,
+    }
+    permission_classes = []
+    default_limit = 5
+    max_limit = 20
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['This parameter is required.']})
+        types = [name for name in request.query_params.get('types', '').split(',') if name]
+        types = list(dict.fromkeys(types))
+        unknown = [name for name in types if name not in autocomplete.SOURCES]
+        if unknown:
+            raise ValidationError({'types': [f'Unknown type: {name}.' for name in unknown]})
+        for name in types:
+            check_list_permissions(request, self.viewsets[name])
+        if not types:
+            types = [name for name in autocomplete.SOURCES if has_list_permission(request, self.viewsets[name])]
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            raise ValidationError({'limit': ['A valid integer is required.']})
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({'limit': [f'Expected a number from 1 to {self.max_limit}.']})
+
+        index = autocomplete.autocomplete_index
+        data = {}
+        for name in types:
+            found = index.lookup(name, query, limit)
+            if found is None:
+                found = index.lookup_sql(name, query, limit)
+            field = autocomplete.SOURCES[name].field
+            data[name] = [{'id': pk, field: text} for pk, text in found]
+        return Response(data)
+
+
+def summary_data(summary):
+    return {
+        'book_count': summary.book_count,
+        'pages_sum': summary.pages_sum,
+        'pages_mean': summary.pages_mean,
+        'histogram': summary.histogram,
+    }
+
+
+class Stats(APIView):
+    """
+    ``GET /stats/`` returns the number of books, their total and mean pages
+    and pages histogram (book counts per bucket, ``buckets`` being the
+    lower edges), and the number of authors born in every decade. Read
+    from the summary tables of ``library.stats``.
+    """
+    permission_classes = []
+
+    def get(self, request, *args, **kwargs):
+        summary = stats.get_summaries('all', [0])[0]
+        return Response({
+            'buckets': list(stats.get_options()['BUCKETS']),
+            'books': summary_data(summary),
+            'authors_by_decade': [
+                {'decade': decade, 'author_count': count} for decade, count in stats.get_decades()
+            ],
+        })
+
+
+class ScopeStats(APIView):
+    """
+    ``GET /stats/authors/`` and ``/stats/tags/`` return the book statistics
+    of every author or tag, as ``/stats/`` does for the catalog: for the
+    objects in ``?ids=1,2,3``, or for the ``limit`` objects with books
+    following the id ``after``, with the ``next`` one to pass. A scope is
+    authorized like a list of its viewset.
+    """
+    scopes = {
+        'authors': 'author',
+        'tags': 'tag',
+    }
+    viewsets = {
+        'authors': AuthorViewSet,
+        'tags': TagViewSet,
+    }
+    permission_classes = []
+    default_limit = 100
+    max_limit = 1000
+
+    def get(self, request, scope, *args, **kwargs):
+        if scope not in self.scopes:
+            raise NotFound()
+        check_list_permissions(request, self.viewsets[scope])
+        scope = self.scopes[scope]
+        ids, after, limit = self.get_params()
+        if ids is None:
+            ids = stats.get_object_ids(scope, after, limit)
+        summaries = stats.get_summaries(scope, ids)
+        has_more = request.query_params.get('ids') is None and len(ids) == limit
+        return Response({
+            'buckets': list(stats.get_options()['BUCKETS']),
+            'results': [{'id': pk, **summary_data(summaries[pk])} for pk in ids],
+            'next': ids[-1] if has_more else None,
+        })
+
+    def get_params(self):
+        params = self.request.query_params
+        ids = None
+        if params.get('ids'):
+            ids = parse_ids([part.strip() for part in params['ids'].split(',')], self.max_limit, 'ids')
+            ids = list(dict.fromkeys(ids))
+        values = {}
+        for name, default in (('after', 0), ('limit', self.default_limit)):
+            try:
+                values[name] = int(params.get(name, default))
+            except ValueError:
+                raise ValidationError({name: ['A valid integer is required.']})
+        if not 1 <= values['limit'] <= self.max_limit:
+            raise ValidationError({'limit': [f'Expected a number from 1 to {self.max_limit}.']})
+        return ids, values['after'], values['limit']